@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: import time and memory of each service entry point.
+
+Every sample runs in a fresh interpreter, so results include nothing cached
+by an earlier import. Results are checked against a budget file and the
+script exits 1 on any breach, including heavy modules (yt-dlp, boto3,
+aioredis, redis) that an entry point is meant to load lazily.
+
+Most of an entry point's import time is FastAPI itself (about 500ms on a
+laptop-class machine) and varies with the host, so a bare `import fastapi`
+is sampled alongside each entry point and import time is budgeted as the
+p50 of the paired differences: the repo's own modules and the dependencies
+they pull in. The budgets in cold_start_budget.json come from four `--runs 7` runs on
+the reference machine (baseline ~500ms; main 224-287ms and conversion-api
+85-213ms over it), taking the highest p50 plus about 25% for noise.
+
+Usage:
+    python -m benchmarks.bench_cold_start --runs 7
+    python -m benchmarks.bench_cold_start --budget benchmarks/cold_start_budget.json --output cold.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict
+
+from benchmarks.common import REPO_ROOT, percentile, result_envelope, write_json
+
+HEAVY_MODULES = ["yt_dlp", "boto3", "botocore", "aioredis", "redis"]
+
+TARGETS = {
+    "main": "import main",
+    "conversion-api": (
+        "from benchmarks.serve_conversion import load_conversion_api\n"
+        "load_conversion_api()"
+    ),
+}
+
+# Import cost every entry point pays regardless of the repo's code
+BASELINE = "import fastapi"
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+{load}
+import_seconds = time.perf_counter() - started
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({{
+    "import_seconds": import_seconds,
+    "rss_kb": rss_kb,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cold_start_budget.json")
+
+
+def sample(load: str) -> Dict:
+    """Run one import in a new interpreter and report its cost"""
+    env = dict(os.environ, OTEL_TRACES_EXPORTER="none", LOG_LEVEL="WARNING", PYTHONDONTWRITEBYTECODE="1")
+    code = PROBE.format(load=load, heavy=HEAVY_MODULES)
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - started
+    return result
+
+
+def measure(target: str, runs: int) -> Dict:
+    samples, baselines = [], []
+    for _ in range(runs):
+        # Interleaved, so both sides of each pair see the same machine load
+        baselines.append(sample(BASELINE))
+        samples.append(sample(TARGETS[target]))
+    imports = [s["import_seconds"] for s in samples]
+    processes = [s["process_seconds"] for s in samples]
+    overheads = [s["import_seconds"] - b["import_seconds"] for s, b in zip(samples, baselines)]
+    return {
+        "target": target,
+        "runs": runs,
+        "import_ms": {"p50": round(percentile(imports, 50) * 1000, 1),
+                      "max": round(max(imports) * 1000, 1)},
+        "baseline_import_ms": round(percentile([b["import_seconds"] for b in baselines], 50) * 1000, 1),
+        "import_overhead_ms": round(percentile(overheads, 50) * 1000, 1),
+        "process_ms": {"p50": round(percentile(processes, 50) * 1000, 1),
+                       "max": round(max(processes) * 1000, 1)},
+        "rss_mb": round(max(s["rss_kb"] for s in samples) / 1024, 1),
+        "heavy_modules": samples[0]["heavy_modules"],
+    }
+
+
+def check_budget(result: Dict, budget: Dict) -> list:
+    breaches = []
+    if result["import_overhead_ms"] > budget.get("import_overhead_ms", float("inf")):
+        breaches.append(f"import p50 {result['import_overhead_ms']}ms over {BASELINE!r} "
+                        f"> {budget['import_overhead_ms']}ms")
+    if result["rss_mb"] > budget.get("rss_mb", float("inf")):
+        breaches.append(f"RSS {result['rss_mb']}MB > {budget['rss_mb']}MB")
+    eager = sorted(set(result["heavy_modules"]) & set(budget.get("lazy_modules", [])))
+    if eager:
+        breaches.append(f"imported at load time: {', '.join(eager)}")
+    return breaches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="JSON budget per target; '' to skip")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    budgets = {}
+    if args.budget:
+        with open(args.budget) as f:
+            budgets = json.load(f)
+
+    results = []
+    failures = []
+    for target in filter(None, args.targets.split(",")):
+        result = measure(target, args.runs)
+        if target in budgets:
+            result["budget"] = budgets[target]
+            result["breaches"] = check_budget(result, budgets[target])
+            failures += [f"{target}: {breach}" for breach in result["breaches"]]
+        results.append(result)
+
+    write_json(result_envelope(results, {"runs": args.runs, "budget": args.budget}), args.output)
+    if failures:
+        print("\nCold-start budget exceeded:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
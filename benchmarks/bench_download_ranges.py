@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for concurrent partial reads against /download/{filename}.
+
+Simulates podcast players seeking/resuming: each request asks for a random
+byte range (optionally multi-range or a conditional revalidation) and the
+script reports throughput and latency percentiles as JSON.
+
+Usage:
+    # Start main.py against a temporary cache with a generated artifact
+    python -m benchmarks.bench_download_ranges --serve --concurrency 32 --requests 2000
+
+    # Or point it at a running server that already has the file cached
+    python -m benchmarks.bench_download_ranges --base-url http://localhost:8000 --filename abc.m4a \
+        --query 'exp=<expiry>&sig=<signature>'
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from benchmarks.common import REPO_ROOT, latency_summary, wait_for_http, write_json
+from lib.storage import download_expiry, download_signature
+
+
+def start_server(port, file_size):
+    """Run main.py under uvicorn with a throwaway cache holding one artifact"""
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    filename = "bench.m4a"
+    with open(os.path.join(cache_dir, filename), "wb") as f:
+        f.write(os.urandom(file_size))
+
+    secret = os.urandom(16).hex()
+    env = dict(os.environ, ARTIFACT_CACHE_DIR=cache_dir, DOWNLOAD_URL_SECRET=secret)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for_http(f"{base_url}/health")
+    except RuntimeError:
+        proc.terminate()
+        raise
+    expires = download_expiry()
+    return proc, base_url, filename, f"exp={expires}&sig={download_signature(filename, expires, secret)}"
+
+
+def run(base_url, filename, query, concurrency, total_requests, range_size, multi_range_ratio, revalidate_ratio):
+    url = f"{base_url}/download/{filename}" + (f"?{query}" if query else "")
+    head = requests.head(url, timeout=10)
+    head.raise_for_status()
+    size = int(head.headers["content-length"])
+    etag = head.headers.get("etag")
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def one_request(_):
+        roll = random.random()
+        headers = {}
+        if roll < revalidate_ratio and etag:
+            headers["If-None-Match"] = etag
+        else:
+            start = random.randrange(0, max(size - range_size, 1))
+            byte_range = f"{start}-{min(start + range_size, size) - 1}"
+            if roll < revalidate_ratio + multi_range_ratio:
+                second = random.randrange(0, max(size - range_size, 1))
+                byte_range += f",{second}-{min(second + range_size, size) - 1}"
+            headers["Range"] = f"bytes={byte_range}"
+            if etag:
+                headers["If-Range"] = etag
+
+        started = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=30)
+        body_size = len(response.content)
+        return time.perf_counter() - started, response.status_code, body_size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _, _ in results]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    total_bytes = sum(body_size for _, _, body_size in results)
+
+    return {
+        "benchmark": "download_ranges",
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "file_size": size,
+        "range_size": range_size,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total_requests / elapsed, 1),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2),
+        "latency_ms": latency_summary(latencies),
+        "status_counts": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--filename", default="bench.m4a")
+    parser.add_argument("--query", help="exp=...&sig=... query string of a signed link to --filename "
+                                        "(not needed with --serve or public storage)")
+    parser.add_argument("--serve", action="store_true", help="Start a local main.py with a generated artifact")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--file-size", type=int, default=50 * 1024 * 1024)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--range-size", type=int, default=256 * 1024)
+    parser.add_argument("--multi-range-ratio", type=float, default=0.1)
+    parser.add_argument("--revalidate-ratio", type=float, default=0.1)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    proc = None
+    base_url, filename, query = args.base_url, args.filename, args.query
+    if args.serve:
+        proc, base_url, filename, query = start_server(args.port, args.file_size)
+
+    try:
+        result = run(base_url, filename, query, args.concurrency, args.requests,
+                     args.range_size, args.multi_range_ratio, args.revalidate_ratio)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    write_json(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for JSON response encoding and compression.
+
+Builds /list_user_videos- and /users/{user_id}/jobs-shaped payloads of N
+items and times each encoding path in-process: FastAPI's default
+(jsonable_encoder + json), orjson, and orjson splicing cached per-item
+fragments (cold and warm). Then reports bytes on the wire and compression
+time for identity, gzip and brotli at the levels CompressionMiddleware
+uses.
+
+Usage:
+    python -m benchmarks.bench_json_encoding --items 500 --iterations 200 --output json.json
+"""
+
+import json
+import time
+import random
+import string
+import argparse
+from typing import Callable, List
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import latency_summary, result_envelope, write_json
+from lib.compression import COMPRESSION_BROTLI_QUALITY, COMPRESSION_GZIP_LEVEL, compress, supported_encodings
+from lib.json_response import FragmentCache, dumps
+
+
+# Real descriptions reuse a small vocabulary, which matters for compression ratios
+VOCABULARY = ["".join(random.Random(n).choices(string.ascii_lowercase, k=2 + n % 8)) for n in range(400)]
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, k=count))
+
+
+def playlist_items(count: int, seed: int = 1) -> List[dict]:
+    """playlistItems-style items with realistic description lengths"""
+    rng = random.Random(seed)
+    items = []
+    for n in range(count):
+        video_id = "".join(rng.choices(string.ascii_letters + string.digits, k=11))
+        description = words(rng, rng.randint(40, 160)) + (
+            "\n\nSubscribe: https://youtube.com/@channel\nPodcast: https://example.com/feed.xml\n#podcast #episode"
+        )
+        items.append({
+            "id": f"item{n}",
+            "etag": f"etag{n}",
+            "snippet": {
+                "resourceId": {"videoId": video_id},
+                "title": f"Episode {n}: {words(rng, 6)}",
+                "description": description,
+                "publishedAt": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+                "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+            },
+        })
+    return items
+
+
+def video_entry(item: dict) -> dict:
+    snippet = item["snippet"]
+    return {
+        "videoId": snippet["resourceId"]["videoId"],
+        "title": snippet["title"],
+        "description": snippet["description"],
+        "publishedAt": snippet["publishedAt"],
+        "thumbnail": snippet["thumbnails"]["high"]["url"],
+    }
+
+
+def job_entries(count: int, seed: int = 2) -> List[dict]:
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(count):
+        job_id = "".join(rng.choices(string.hexdigits.lower(), k=32))
+        jobs.append({
+            "job_id": job_id,
+            "video_id": "".join(rng.choices(string.ascii_letters + string.digits, k=11)),
+            "content_type": "audio",
+            "status": "completed",
+            "progress": 100,
+            "created_at": "2024-05-01T12:00:00Z",
+            "download_url": f"https://bucket.s3.amazonaws.com/audio/{job_id}.m4a?X-Amz-Signature={job_id * 2}",
+            "error": None,
+        })
+    return jobs
+
+
+def listing(videos) -> dict:
+    return {
+        "channel": {"id": "UC123", "title": "Channel", "description": "About", "publishedAt": "2020-01-01T00:00:00Z"},
+        "videos": videos,
+        "totalResults": len(videos),
+        "nextPageToken": None,
+        "privacyFiltered": {"publicVideos": len(videos), "filteredOut": 0},
+    }
+
+
+def stdlib_encode(content) -> bytes:
+    # What FastAPI does for a returned dict: jsonable_encoder, then Starlette's JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def time_encoder(encode: Callable[[], bytes], iterations: int):
+    timings = []
+    body = b""
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = encode()
+        timings.append(time.perf_counter() - started)
+    return body, timings
+
+
+def wire_sizes(body: bytes, iterations: int) -> dict:
+    sizes = {"identity": {"bytes": len(body)}}
+    for encoding in supported_encodings():
+        compressed, timings = time_encoder(lambda: compress(body, encoding), max(1, iterations // 10))
+        sizes[encoding] = {
+            "bytes": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2),
+            "compress_ms": latency_summary(timings),
+        }
+    return sizes
+
+
+def run(item_count: int, iterations: int) -> List[dict]:
+    items = playlist_items(item_count)
+    jobs = job_entries(item_count)
+    fragments = FragmentCache("bench", max_items=item_count * 2)
+
+    def fragment_listing():
+        return dumps(listing(fragments.fragments(items, lambda item: (item["id"], item["etag"]), video_entry)))
+
+    def cold_fragment_listing():
+        fragments.clear()
+        return fragment_listing()
+
+    encoders = {
+        "videos.fastapi_default": lambda: stdlib_encode(listing([video_entry(item) for item in items])),
+        "videos.orjson": lambda: dumps(listing([video_entry(item) for item in items])),
+        "videos.orjson_fragments_cold": cold_fragment_listing,
+        "videos.orjson_fragments_warm": fragment_listing,
+        "jobs.fastapi_default": lambda: stdlib_encode({"user_id": "u", "jobs": jobs, "next_cursor": None}),
+        "jobs.orjson": lambda: dumps({"user_id": "u", "jobs": jobs, "next_cursor": None}),
+    }
+
+    results = []
+    reference = {}
+    for name, encode in encoders.items():
+        fragments.clear()
+        encode()  # warm-up (and fills the fragment cache for the warm case)
+        body, timings = time_encoder(encode, iterations)
+        payload = name.split(".", 1)[0]
+        # Every path must produce the same document
+        decoded = json.loads(body)
+        if reference.setdefault(payload, decoded) != decoded:
+            raise AssertionError(f"{name} encoded a different document")
+        results.append({
+            "scenario": name,
+            "items": item_count,
+            "iterations": iterations,
+            "encode_ms": latency_summary(timings),
+            "wire": wire_sizes(body, iterations),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", help="Write the JSON results here as well as to stdout")
+    args = parser.parse_args()
+
+    results = run(args.items, args.iterations)
+    config = {
+        "items": args.items,
+        "iterations": args.iterations,
+        "gzip_level": COMPRESSION_GZIP_LEVEL,
+        "brotli_quality": COMPRESSION_BROTLI_QUALITY,
+    }
+    write_json(result_envelope(results, config), args.output)
+
+
+if __name__ == "__main__":
+    main()
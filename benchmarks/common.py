@@ -0,0 +1,149 @@
+"""
+Shared helpers for the benchmark scripts: latency statistics, process
+resource sampling, and the machine-readable result envelope.
+"""
+
+import os
+import json
+import time
+import socket
+import platform
+import threading
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max in milliseconds"""
+    if not latencies:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(latencies, 50) * 1000, 2),
+        "p95": round(percentile(latencies, 95) * 1000, 2),
+        "p99": round(percentile(latencies, 99) * 1000, 2),
+        "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        "max": round(max(latencies) * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 20.0):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def process_tree_usage(pid: int) -> Dict[str, float]:
+    """CPU seconds and RSS for a process and its children, read from /proc"""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+
+    cpu_seconds = 0.0
+    rss_bytes = 0
+    for proc_id in pids:
+        try:
+            with open(f"/proc/{proc_id}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            with open(f"/proc/{proc_id}/statm") as f:
+                rss_bytes += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return {"cpu_seconds": cpu_seconds, "rss_bytes": rss_bytes}
+
+
+class ResourceSampler:
+    """Samples a process tree's RSS in the background while a scenario runs"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.max_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_cpu = 0.0
+
+    def __enter__(self):
+        if self.pid:
+            self._start_cpu = process_tree_usage(self.pid)["cpu_seconds"]
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.max_rss = max(self.max_rss, process_tree_usage(self.pid)["rss_bytes"])
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def result(self) -> Dict[str, float]:
+        if not self.pid:
+            return {}
+        return {
+            "cpu_seconds": round(process_tree_usage(self.pid)["cpu_seconds"] - self._start_cpu, 3),
+            "max_rss_mb": round(self.max_rss / 1024 / 1024, 1),
+        }
+
+
+def result_envelope(results: List[dict], config: dict) -> dict:
+    """Wrap scenario results with enough context to compare runs across commits"""
+    return {
+        "schema": 1,
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": config,
+        "results": results,
+    }
+
+
+def write_json(data: dict, path: Optional[str]):
+    output = json.dumps(data, indent=2)
+    print(output)
+    if path:
+        with open(path, "w") as f:
+            f.write(output + "\n")
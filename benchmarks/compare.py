@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files and fail on regressions.
+
+    python -m benchmarks.compare baseline.json current.json --max-latency-regression 15 --max-throughput-regression 10
+
+Exits 1 when any scenario present in both files regressed beyond the
+thresholds (p95/p99 latency up, throughput down, or error rate up).
+"""
+
+import sys
+import json
+import argparse
+from typing import Dict, Tuple
+
+
+def load(path: str) -> Tuple[Dict[str, dict], dict]:
+    with open(path) as f:
+        data = json.load(f)
+    return {result["scenario"]: result for result in data.get("results", [])}, data
+
+
+def pct_change(before: float, after: float) -> float:
+    if not before:
+        return 0.0
+    return (after - before) / before * 100.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--max-latency-regression", type=float, default=15.0, help="Allowed p95/p99 increase, %%")
+    parser.add_argument("--max-throughput-regression", type=float, default=10.0, help="Allowed throughput drop, %%")
+    parser.add_argument("--max-error-rate-increase", type=float, default=0.01, help="Allowed absolute increase")
+    args = parser.parse_args()
+
+    baseline, baseline_meta = load(args.baseline)
+    current, current_meta = load(args.current)
+    print(f"baseline {(baseline_meta.get('commit') or '?')[:10]}  ->  current {(current_meta.get('commit') or '?')[:10]}")
+
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name], current[name]
+        rows = [
+            ("p95 ms", before["latency_ms"]["p95"], after["latency_ms"]["p95"], args.max_latency_regression, 1),
+            ("p99 ms", before["latency_ms"]["p99"], after["latency_ms"]["p99"], args.max_latency_regression, 1),
+            ("rps", before["throughput_rps"], after["throughput_rps"], args.max_throughput_regression, -1),
+        ]
+        for metric, old, new, limit, direction in rows:
+            change = pct_change(old, new)
+            regressed = change * direction > limit
+            flag = "REGRESSION" if regressed else ""
+            print(f"{name:32s} {metric:8s} {old:10.2f} -> {new:10.2f} ({change:+6.1f}%) {flag}")
+            if regressed:
+                regressions.append(f"{name} {metric}")
+
+        error_delta = after["error_rate"] - before["error_rate"]
+        if error_delta > args.max_error_rate_increase:
+            print(f"{name:32s} errors   {before['error_rate']:10.4f} -> {after['error_rate']:10.4f} REGRESSION")
+            regressions.append(f"{name} error_rate")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Load-test harness for main.py and custom-conversion-api.py.
+
+Starts the stub upstreams (benchmarks/stubs.py), a throwaway Redis and an
+S3 stand-in (moto, or any endpoint you pass such as MinIO), launches both
+services against them, drives each scenario at the requested concurrency
+and writes throughput, latency percentiles and server CPU/RSS as JSON.
+Compare two result files with benchmarks/compare.py.
+
+    python -m benchmarks.run --concurrency 32 --requests 500 --output bench.json
+    python -m benchmarks.run --scenarios main.list_user_videos --profile youtube=latency:150,jitter:50
+    python -m benchmarks.run --with-worker --scenarios conversion.end_to_end --requests 20
+
+Scenarios:
+    main.health, main.list_user_videos, main.rapidapi_convert,
+    conversion.convert, conversion.batch, conversion.status,
+    conversion.end_to_end (needs --with-worker, yt-dlp and ffmpeg)
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import requests
+
+from benchmarks.common import (
+    REPO_ROOT, ResourceSampler, free_port, latency_summary, result_envelope, wait_for_http, write_json,
+)
+from benchmarks.stubs import StubConfig, parse_profiles, start_stub_server, stub_environment
+
+MAIN_SCENARIOS = ["main.health", "main.list_user_videos", "main.rapidapi_convert"]
+CONVERSION_SCENARIOS = ["conversion.convert", "conversion.batch", "conversion.status"]
+DEFAULT_SCENARIOS = MAIN_SCENARIOS + CONVERSION_SCENARIOS
+
+
+class Service:
+    """A service subprocess with its own log file"""
+
+    def __init__(self, name: str, args: List[str], env: Dict[str, str], health_url: Optional[str], workdir: str):
+        self.name = name
+        self.log_path = os.path.join(workdir, f"{name}.log")
+        self.log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(args, cwd=REPO_ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        if health_url:
+            try:
+                wait_for_http(health_url)
+            except RuntimeError:
+                self.stop()
+                raise RuntimeError(f"{name} failed to start, see {self.log_path}")
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.log.close()
+
+
+def start_redis(workdir: str) -> Tuple[Service, str]:
+    binary = shutil.which("redis-server")
+    if not binary:
+        raise RuntimeError("redis-server not found; pass --redis-url to use an existing Redis")
+    port = free_port()
+    service = Service("redis", [binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+                      dict(os.environ), None, workdir)
+    time.sleep(0.5)
+    return service, f"redis://127.0.0.1:{port}"
+
+
+def start_moto(workdir: str) -> Tuple[Service, str]:
+    port = free_port()
+    service = Service("moto", [sys.executable, "-m", "moto.server", "-p", str(port)],
+                      dict(os.environ), f"http://127.0.0.1:{port}/", workdir)
+    return service, f"http://127.0.0.1:{port}"
+
+
+def run_scenario(name: str, call: Callable[[requests.Session, int], int], concurrency: int,
+                 total: int, pid: Optional[int]) -> dict:
+    """Run `call` `total` times across `concurrency` threads and summarise"""
+    sessions = {}
+
+    def session_for_thread() -> requests.Session:
+        ident = threading.get_ident()
+        if ident not in sessions:
+            sessions[ident] = requests.Session()
+        return sessions[ident]
+
+    def one(index: int):
+        started = time.perf_counter()
+        try:
+            status = call(session_for_thread(), index)
+        except requests.exceptions.RequestException:
+            status = 0
+        return time.perf_counter() - started, status
+
+    with ResourceSampler(pid) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "status_counts": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary([latency for latency, _ in outcomes]),
+        "resources": sampler.result(),
+    }
+
+
+def main_scenarios(base_url: str) -> Dict[str, Callable]:
+    def health(session, i):
+        return session.get(f"{base_url}/health", timeout=30).status_code
+
+    def list_user_videos(session, i):
+        return session.get(f"{base_url}/list_user_videos",
+                           headers={"Authorization": f"Bearer stub-token-{i % 100}"}, timeout=60).status_code
+
+    def rapidapi_convert(session, i):
+        return session.post(f"{base_url}/api/rapidapi/convert", json={
+            "video_id": f"vid{i:08d}",
+            "content_type": "audio" if i % 2 else "video",
+            "api_key": "stub-conversion-key",
+        }, timeout=120).status_code
+
+    return {
+        "main.health": health,
+        "main.list_user_videos": list_user_videos,
+        "main.rapidapi_convert": rapidapi_convert,
+    }
+
+
+def conversion_scenarios(base_url: str, job_ids: List[str]) -> Dict[str, Callable]:
+    def convert(session, i):
+        response = session.post(f"{base_url}/convert", params={
+            "video_id": f"vid{i:08d}", "content_type": "audio", "quality": "medium",
+        }, timeout=30)
+        if response.status_code == 200:
+            job_ids.append(response.json()["job_id"])
+        return response.status_code
+
+    def batch(session, i):
+        response = session.post(f"{base_url}/convert/batch", json={
+            "user_id": f"user{i % 100}",
+            "videos": [{"video_id": f"vid{i:05d}{n:03d}", "content_type": "audio"} for n in range(25)],
+        }, timeout=60)
+        return response.status_code
+
+    job_cycle = itertools.cycle(job_ids or ["missing"])
+
+    def status(session, i):
+        return session.get(f"{base_url}/status/{next(job_cycle)}", timeout=30).status_code
+
+    return {
+        "conversion.convert": convert,
+        "conversion.batch": batch,
+        "conversion.status": status,
+    }
+
+
+def end_to_end(base_url: str, timeout: float) -> Callable:
+    def run_job(session, i):
+        response = session.post(f"{base_url}/convert", params={
+            "video_id": f"e2e{i:05d}{int(time.time())}", "content_type": "audio",
+        }, timeout=30)
+        if response.status_code != 200:
+            return response.status_code
+        job_id = response.json()["job_id"]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = session.get(f"{base_url}/status/{job_id}", timeout=30).json()
+            if state.get("status") == "completed":
+                return 200
+            if state.get("status") == "failed":
+                return 500
+            time.sleep(0.2)
+        return 504
+
+    return run_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--profile", action="append", help="Stub profile, e.g. rapidapi=latency:800,ratelimit:0.05")
+    parser.add_argument("--videos-per-channel", type=int, default=500)
+    parser.add_argument("--redis-url", help="Use this Redis instead of starting redis-server")
+    parser.add_argument("--s3-endpoint", help="Use this S3 endpoint (e.g. MinIO) instead of moto")
+    parser.add_argument("--with-worker", action="store_true", help="Also run a conversion worker")
+    parser.add_argument("--job-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    needs_conversion = any(name.startswith("conversion.") for name in scenarios)
+    needs_main = any(name.startswith("main.") for name in scenarios)
+
+    workdir = tempfile.mkdtemp(prefix="podpay-bench-")
+    stub_config = StubConfig(profiles=parse_profiles(args.profile), videos_per_channel=args.videos_per_channel)
+    stub_server = start_stub_server(stub_config)
+    stub_url = f"http://127.0.0.1:{stub_server.server_address[1]}"
+
+    env = dict(os.environ)
+    env.update(stub_environment(stub_url))
+    env.update({
+        "ARTIFACT_CACHE_DIR": os.path.join(workdir, "artifacts"),
+        "LOG_LEVEL": "WARNING",
+        "OTEL_TRACES_EXPORTER": "none",
+        "WORKER_METRICS_PORT": "0",
+        "AWS_ACCESS_KEY_ID": env.get("AWS_ACCESS_KEY_ID", "bench"),
+        "AWS_SECRET_ACCESS_KEY": env.get("AWS_SECRET_ACCESS_KEY", "bench"),
+        "AWS_DEFAULT_REGION": env.get("AWS_DEFAULT_REGION", "us-east-1"),
+    })
+
+    services: List[Service] = []
+    results = []
+    try:
+        if needs_conversion:
+            redis_url = args.redis_url
+            if not redis_url:
+                redis_service, redis_url = start_redis(workdir)
+                services.append(redis_service)
+            s3_endpoint = args.s3_endpoint
+            if not s3_endpoint:
+                moto_service, s3_endpoint = start_moto(workdir)
+                services.append(moto_service)
+                import boto3
+                boto3.client("s3", endpoint_url=s3_endpoint, region_name=env["AWS_DEFAULT_REGION"],
+                             aws_access_key_id=env["AWS_ACCESS_KEY_ID"],
+                             aws_secret_access_key=env["AWS_SECRET_ACCESS_KEY"]).create_bucket(
+                    Bucket=env.get("AWS_BUCKET", "podpay-media"))
+            env.update({"REDIS_URL": redis_url, "S3_ENDPOINT_URL": s3_endpoint})
+            if not args.with_worker:
+                # No worker heartbeats, so admission control would refuse every submission
+                env["ADMISSION_ENABLED"] = "0"
+
+        main_service = conversion_service = None
+        if needs_main:
+            port = free_port()
+            main_service = Service("main", [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                            "--log-level", "warning"], env, f"http://127.0.0.1:{port}/health", workdir)
+            services.append(main_service)
+            calls = main_scenarios(f"http://127.0.0.1:{port}")
+            for name in scenarios:
+                if name in calls:
+                    results.append(run_scenario(name, calls[name], args.concurrency, args.requests, main_service.pid))
+
+        if needs_conversion:
+            port = free_port()
+            conversion_service = Service(
+                "conversion-api", [sys.executable, "-m", "benchmarks.serve_conversion", "api", "--port", str(port)],
+                env, f"http://127.0.0.1:{port}/queue/stats", workdir
+            )
+            services.append(conversion_service)
+            base_url = f"http://127.0.0.1:{port}"
+            if args.with_worker:
+                services.append(Service("worker", [sys.executable, "-m", "benchmarks.serve_conversion", "worker"],
+                                        env, None, workdir))
+
+            job_ids: List[str] = []
+            calls = conversion_scenarios(base_url, job_ids)
+            for name in scenarios:
+                if name == "conversion.status":
+                    # Rebuild so status polls cycle over the jobs created so far
+                    calls = conversion_scenarios(base_url, job_ids)
+                if name in calls:
+                    results.append(run_scenario(name, calls[name], args.concurrency, args.requests,
+                                                conversion_service.pid))
+                elif name == "conversion.end_to_end":
+                    if not args.with_worker:
+                        raise SystemExit("conversion.end_to_end needs --with-worker")
+                    results.append(run_scenario(name, end_to_end(base_url, args.job_timeout),
+                                                args.concurrency, args.requests, conversion_service.pid))
+    finally:
+        for service in reversed(services):
+            service.stop()
+        stub_server.shutdown()
+
+    config = {
+        "scenarios": scenarios,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "profiles": args.profile or [],
+        "videos_per_channel": args.videos_per_channel,
+        "with_worker": args.with_worker,
+        "upstream_calls": dict(stub_config.counts),
+    }
+    write_json(result_envelope(results, config), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Entry point for custom-conversion-api.py, whose hyphenated file name can't
+be imported by uvicorn's "module:app" syntax.
+
+    python -m benchmarks.serve_conversion api --port 8001
+    python -m benchmarks.serve_conversion worker
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+import importlib.util
+
+from benchmarks.common import REPO_ROOT
+
+
+def load_conversion_api():
+    """Import custom-conversion-api.py as the module `custom_conversion_api`"""
+    if "custom_conversion_api" in sys.modules:
+        return sys.modules["custom_conversion_api"]
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    spec = importlib.util.spec_from_file_location(
+        "custom_conversion_api", os.path.join(REPO_ROOT, "custom-conversion-api.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["custom_conversion_api"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("role", choices=["api", "worker"])
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    module = load_conversion_api()
+    if args.role == "api":
+        import uvicorn
+        uvicorn.run(module.app, host="127.0.0.1", port=args.port, log_level="warning")
+    else:
+        asyncio.run(module.worker())
+
+
+if __name__ == "__main__":
+    main()
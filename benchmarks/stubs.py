@@ -0,0 +1,235 @@
+"""
+Local stand-ins for every upstream the services call: Google tokeninfo,
+the YouTube Data API, both RapidAPI hosts, and a media origin the worker
+can download from instead of YouTube.
+
+Each upstream group has a Profile controlling latency, jitter, 5xx rate
+and 429 rate, so the same benchmark can be run against a healthy or a
+degraded provider.
+
+Run standalone:
+    python -m benchmarks.stubs --port 9000 --profile rapidapi=latency:800,ratelimit:0.05
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import urlparse, parse_qs
+
+GROUPS = ("tokeninfo", "youtube", "rapidapi", "media")
+
+
+@dataclass
+class Profile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    ratelimit_rate: float = 0.0
+    retry_after: int = 1
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profile":
+        """Parse "latency:200,jitter:50,error:0.01,ratelimit:0.05,retry_after:2\""""
+        names = {"latency": "latency_ms", "jitter": "jitter_ms", "error": "error_rate",
+                 "ratelimit": "ratelimit_rate", "retry_after": "retry_after"}
+        profile = cls()
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition(":")
+            attr = names[key.strip()]
+            setattr(profile, attr, type(getattr(profile, attr))(float(value)))
+        return profile
+
+
+@dataclass
+class StubConfig:
+    profiles: Dict[str, Profile] = field(default_factory=lambda: {group: Profile() for group in GROUPS})
+    videos_per_channel: int = 500
+    private_ratio: float = 0.1
+    media_bytes: int = 2 * 1024 * 1024
+    counts: Dict[str, int] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+def video_id(index: int) -> str:
+    return f"vid{index:08d}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    config: StubConfig = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Dict[str, str] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _apply_profile(self, group: str) -> bool:
+        """Sleep and maybe inject a failure; True if a response was already sent"""
+        profile = self.config.profiles[group]
+        self.config.count(group)
+        delay = profile.latency_ms + random.uniform(-profile.jitter_ms, profile.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        roll = random.random()
+        if roll < profile.ratelimit_rate:
+            self.config.count(f"{group}:429")
+            self._send_json(429, {"message": "Too many requests"}, {"Retry-After": str(profile.retry_after)})
+            return True
+        if roll < profile.ratelimit_rate + profile.error_rate:
+            self.config.count(f"{group}:500")
+            self._send_json(500, {"message": "Injected failure"})
+            return True
+        return False
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        path = parsed.path
+
+        if path == "/tokeninfo":
+            if self._apply_profile("tokeninfo"):
+                return
+            if query.get("access_token") == "expired":
+                return self._send_json(400, {"error": "invalid_token"})
+            return self._send_json(200, {"expires_in": 3599, "scope": "youtube.readonly", "aud": "stub"})
+
+        if path.startswith("/youtube/v3/"):
+            if self._apply_profile("youtube"):
+                return
+            return self._youtube(path[len("/youtube/v3/"):], query)
+
+        if path.startswith("/get_m4a_download_link/") or path.startswith("/download_video/"):
+            if self._apply_profile("rapidapi"):
+                return
+            vid = path.rsplit("/", 1)[1]
+            ext = "m4a" if "m4a" in path else "mp4"
+            return self._send_json(200, {
+                "file": f"http://{self.headers.get('Host')}/media/{vid}.{ext}",
+                "title": f"Stub video {vid}",
+                "duration": 600,
+                "size": self.config.media_bytes,
+            })
+
+        if path.startswith("/media/"):
+            if self._apply_profile("media"):
+                return
+            body = b"\0" * self.config.media_bytes
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mp4" if path.endswith(".m4a") else "video/mp4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self._send_json(404, {"error": "not found"})
+
+    def _youtube(self, resource: str, query: Dict[str, str]):
+        total = self.config.videos_per_channel
+        if resource == "channels":
+            return self._send_json(200, {"items": [{
+                "id": "UCstub",
+                "snippet": {"title": "Stub Channel", "description": "Benchmark channel",
+                            "publishedAt": "2020-01-01T00:00:00Z"},
+                "contentDetails": {"relatedPlaylists": {"uploads": "UUstub"}},
+            }]})
+
+        if resource == "playlistItems":
+            page_size = min(int(query.get("maxResults", 5)), 50)
+            start = int(query.get("pageToken") or 0)
+            end = min(start + page_size, total)
+            items = [{
+                "snippet": {
+                    "resourceId": {"videoId": video_id(i)},
+                    "title": f"Episode {total - i}",
+                    "description": "Stub description " * 20,
+                    "publishedAt": f"2024-01-01T00:{i % 60:02d}:00Z",
+                    "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id(i)}/hq.jpg"},
+                                   "default": {"url": f"https://i.ytimg.com/vi/{video_id(i)}/d.jpg"}},
+                },
+                "contentDetails": {"videoId": video_id(i)},
+            } for i in range(start, end)]
+            body = {"items": items, "pageInfo": {"totalResults": total, "resultsPerPage": page_size}}
+            if end < total:
+                body["nextPageToken"] = str(end)
+            return self._send_json(200, body)
+
+        if resource == "videos":
+            ids = [vid for vid in query.get("id", "").split(",") if vid]
+            return self._send_json(200, {"items": [{
+                "id": vid,
+                "status": {"privacyStatus": "private" if int(vid[3:]) % 100 < self.config.private_ratio * 100 else "public"},
+            } for vid in ids]})
+
+        return self._send_json(404, {"error": f"unknown resource {resource}"})
+
+
+def start_stub_server(config: StubConfig, port: int = 0) -> ThreadingHTTPServer:
+    """Start the stubs on a background thread; returns the server (server_address has the port)"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_environment(base_url: str) -> Dict[str, str]:
+    """Env vars that point main.py and the conversion worker at the stubs"""
+    return {
+        "GOOGLE_TOKENINFO_URL": f"{base_url}/tokeninfo",
+        "YOUTUBE_API_URL": f"{base_url}/youtube/v3",
+        "RAPIDAPI_BASE_URL": base_url,
+        "RAPIDAPI_KEY": "stub-rapidapi-key",
+        "CONVERSION_API_KEY": "stub-conversion-key",
+        "YOUTUBE_WATCH_URL": f"{base_url}/media/{{video_id}}.m4a",
+    }
+
+
+def parse_profiles(specs) -> Dict[str, Profile]:
+    profiles = {group: Profile() for group in GROUPS}
+    for spec in specs or []:
+        group, _, values = spec.partition("=")
+        if group not in profiles:
+            raise ValueError(f"Unknown stub group '{group}', expected one of {GROUPS}")
+        profiles[group] = Profile.parse(values)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--profile", action="append", help="group=latency:MS,jitter:MS,error:RATE,ratelimit:RATE")
+    parser.add_argument("--videos-per-channel", type=int, default=500)
+    args = parser.parse_args()
+
+    config = StubConfig(profiles=parse_profiles(args.profile), videos_per_channel=args.videos_per_channel)
+    server = start_stub_server(config, args.port)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Stubs listening on {base_url}")
+    for key, value in stub_environment(base_url).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,65 @@
 # Custom YouTube Conversion API
 # Built for scale: 100 users × 100-500 videos each
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Query
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, Header, Request
 from fastapi.responses import JSONResponse
 import asyncio
-import aioredis
-import yt_dlp
+from opentelemetry import context as otel_context
+from opentelemetry.trace import SpanKind
 import uuid
 import os
+import time
+import shutil
+import importlib
 import subprocess
 from typing import List, Optional
 from pydantic import BaseModel
-import boto3
-from datetime import datetime
 import logging
+from lib.audio_formats import AUDIO_FORMATS, resolve_audio_format, build_audio_options
+from lib.artifact_cache import ArtifactCache
+from lib.storage import ColdStorage, ArtifactURLService, artifact_key
+from lib.temp_space import TempSpaceBudget, TempSpaceExhausted, estimate_job_bytes
+from lib.partials import PartialDownloads
+from lib.feeds import FeedStore
+from lib.json_response import FastJSONResponse
+from lib.compression import CompressionMiddleware
+from lib.admission import AdmissionController
+from lib.job_control import JobControl, JobInterrupted, PREEMPTION_ENABLED
+from lib.job_store import (
+    JobStore, JOB_LIST_MAX_LIMIT, IDEMPOTENCY_KEY_MAX_LENGTH, format_timestamp, idempotency_key, now_ms,
+)
+from lib.metrics import (
+    ACTIVE_JOBS, CACHE_EVENTS, ERRORS, JOBS_TOTAL, QUEUE_WAIT_SECONDS, STAGE_BYTES_PER_SECOND, STAGE_SECONDS,
+    InstrumentedRedis, http_metrics_middleware, metrics_response,
+)
+from lib.logging_setup import configure_logging, request_id_middleware, request_id_var
+from lib.tracing import configure_tracing, tracing_middleware, tracer, trace_context_fields, context_from_fields
 
-app = FastAPI(title="PodPay Conversion API", version="1.0.0")
+configure_logging()
+configure_tracing("conversion-api")
+logger = logging.getLogger("conversion_api")
+
+app = FastAPI(title="PodPay Conversion API", version="1.0.0", default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(request_id_middleware)
+app.middleware("http")(tracing_middleware)
 
 # Configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-AWS_BUCKET = os.getenv("AWS_BUCKET", "podpay-media")
 TEMP_DIR = "/tmp/conversions"
 MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "10"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+# How often one of the workers archives and removes expired jobs
+JOB_JANITOR_INTERVAL = int(os.getenv("JOB_JANITOR_INTERVAL", "300"))
+# Create heavy clients in the background after startup; 0 leaves them fully lazy
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+# Refuse submissions that would wait longer than ADMISSION_MAX_WAIT_SECONDS
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+WORKER_HEARTBEAT_INTERVAL = 10
+# Source URL per video; benchmarks point this at a local media stub
+YOUTUBE_WATCH_URL = os.getenv("YOUTUBE_WATCH_URL", "https://youtube.com/watch?v={video_id}")
+AUDIO_MIME_TYPES = {spec["ext"]: spec["mime"] for spec in AUDIO_FORMATS.values()}
 
 # Models
 class ConversionRequest(BaseModel):
@@ -29,6 +67,7 @@ class ConversionRequest(BaseModel):
     content_type: str  # 'audio' or 'video'
     title: Optional[str] = None
     quality: Optional[str] = "medium"  # low, medium, high
+    audio_format: Optional[str] = None  # m4a, opus (stream copy) or mp3 (re-encode)
     callback_url: Optional[str] = None
 
 class BatchConversionRequest(BaseModel):
@@ -36,22 +75,39 @@ class BatchConversionRequest(BaseModel):
     user_id: str
     priority: Optional[int] = 0
 
+class CancelBatchRequest(BaseModel):
+    job_ids: List[str]
+
 class ConversionStatus(BaseModel):
     job_id: str
-    status: str  # queued, processing, completed, failed
+    status: str  # queued, processing, completed, failed, cancelled
     progress: int
     download_url: Optional[str] = None
     error: Optional[str] = None
 
 # Global connections
 redis_client = None
-s3_client = boto3.client('s3')
+job_store = None
+admission = None
+feeds = None
+cold_storage = ColdStorage()
+artifact_urls = ArtifactURLService(cold_storage)
+artifact_cache = ArtifactCache()
+# Scratch space, only needed by workers (see init_scratch)
+partials = None
+temp_space = None
 
 @app.on_event("startup")
 async def startup():
-    global redis_client
-    redis_client = await aioredis.from_url(REDIS_URL)
-    os.makedirs(TEMP_DIR, exist_ok=True)
+    global redis_client, job_store, admission, feeds
+    import aioredis
+    redis_client = InstrumentedRedis(await aioredis.from_url(REDIS_URL, decode_responses=True))
+    job_store = JobStore(redis_client)
+    admission = AdmissionController(redis_client)
+    feeds = FeedStore(redis_client)
+    # Build the S3 client (used to sign download URLs) without blocking startup
+    if WARM_UP:
+        asyncio.get_event_loop().run_in_executor(None, warm_up)
 
 @app.on_event("shutdown") 
 async def shutdown():
@@ -65,46 +121,99 @@ class ConversionAPI:
         
     # Single video conversion
     @staticmethod
-    async def convert_single(video_id: str, content_type: str, quality: str = "medium"):
+    async def convert_single(video_id: str, content_type: str, quality: str = "medium", audio_format: Optional[str] = None,
+                             user_id: Optional[str] = None, client_key: Optional[str] = None):
         job_id = str(uuid.uuid4())
+        audio_format = resolve_audio_format(audio_format) if content_type == "audio" else ""
         
         # Add to Redis queue
         job_data = {
-            "job_id": job_id,
             "video_id": video_id,
             "content_type": content_type,
             "quality": quality,
-            "status": "queued",
-            "created_at": datetime.utcnow().isoformat(),
-            "progress": 0
+            "audio_format": audio_format,
+            "user_id": user_id,
+            "request_id": request_id_var.get(),
+            **trace_context_fields()
         }
         
-        await redis_client.hset(f"job:{job_id}", mapping=job_data)
+        idempotency = idempotency_key(user_id, video_id, content_type, quality, audio_format, client_key)
+        
+        if ADMISSION_ENABLED:
+            try:
+                await admission.admit(1)
+            except HTTPException:
+                # A retry of an already accepted job still gets its answer
+                existing_job_id = await job_store.live_job_for(idempotency[0])
+                if not existing_job_id:
+                    raise
+                return await ConversionAPI.duplicate_response(existing_job_id)
+        
+        # Retries (client timeouts, n8n re-runs) resolve to the job already queued
+        existing_job_id = await job_store.create(job_id, job_data, idempotency)
+        if existing_job_id:
+            return await ConversionAPI.duplicate_response(existing_job_id)
+        CACHE_EVENTS.labels("idempotency", "miss").inc()
+        
         await redis_client.lpush("conversion_queue", job_id)
+        await admission.record_arrivals(1)
         
         return {"job_id": job_id, "status": "queued"}
     
+    @staticmethod
+    async def duplicate_response(existing_job_id: str):
+        CACHE_EVENTS.labels("idempotency", "hit").inc()
+        status, = await job_store.get_fields(existing_job_id, "status")
+        return {"job_id": existing_job_id, "status": status, "duplicate": True}
+    
     # Batch conversion
     @staticmethod
-    async def convert_batch(batch_request: BatchConversionRequest):
+    async def convert_batch(batch_request: BatchConversionRequest, client_key: Optional[str] = None):
         job_ids = []
+        duplicates = 0
+        
+        audio_formats = [
+            resolve_audio_format(video.audio_format) if video.content_type == "audio" else ""
+            for video in batch_request.videos
+        ]
+        idempotency_keys = [
+            idempotency_key(batch_request.user_id, video.video_id, video.content_type, video.quality or "medium",
+                            audio_format, client_key)
+            for video, audio_format in zip(batch_request.videos, audio_formats)
+        ]
+        
+        if ADMISSION_ENABLED:
+            # A retried batch still gets its job ids: only videos without a live
+            # job (counted once each) need admitting
+            new_keys = set()
+            for key, _ in idempotency_keys:
+                if key not in new_keys and not await job_store.live_job_for(key):
+                    new_keys.add(key)
+            if new_keys:
+                await admission.admit(len(new_keys), priority=batch_request.priority > 0)
         
-        for video in batch_request.videos:
+        for video, audio_format, idempotency in zip(batch_request.videos, audio_formats, idempotency_keys):
             job_id = str(uuid.uuid4())
             
             job_data = {
-                "job_id": job_id,
                 "video_id": video.video_id,
                 "content_type": video.content_type,
                 "quality": video.quality or "medium",
+                "audio_format": audio_format,
                 "user_id": batch_request.user_id,
                 "priority": batch_request.priority,
-                "status": "queued",
-                "created_at": datetime.utcnow().isoformat(),
-                "progress": 0
+                "title": video.title,
+                "request_id": request_id_var.get(),
+                **trace_context_fields()
             }
             
-            await redis_client.hset(f"job:{job_id}", mapping=job_data)
+            existing_job_id = await job_store.create(job_id, job_data, idempotency)
+            if existing_job_id:
+                CACHE_EVENTS.labels("idempotency", "hit").inc()
+                job_ids.append(existing_job_id)
+                duplicates += 1
+                continue
+            CACHE_EVENTS.labels("idempotency", "miss").inc()
             
             # Higher priority jobs go to front of queue
             if batch_request.priority > 0:
@@ -114,143 +223,350 @@ class ConversionAPI:
             
             job_ids.append(job_id)
         
-        return {"job_ids": job_ids, "status": "queued", "count": len(job_ids)}
+        await admission.record_arrivals(len(job_ids) - duplicates)
+        return {"job_ids": job_ids, "status": "queued", "count": len(job_ids), "duplicates": duplicates}
     
     # Get job status
     @staticmethod
     async def get_status(job_id: str):
-        job_data = await redis_client.hgetall(f"job:{job_id}")
+        job_data = await job_store.get(job_id)
         
         if not job_data:
             raise HTTPException(status_code=404, detail="Job not found")
         
+        # Signed URLs are issued per request (cached until near expiry), never stored
+        if job_data.get("artifact_key"):
+            job_data["download_url"] = artifact_urls.url_for(job_data["artifact_key"])
+        
         return ConversionStatus(**job_data)
     
+    # Cancel queued or running jobs
+    @staticmethod
+    async def cancel_job(job_id: str):
+        previous = (await job_store.cancel([job_id]))[job_id]
+        if previous is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if previous not in ("queued", "processing"):
+            raise HTTPException(status_code=409, detail=f"Job already {previous}")
+        logger.info("Job %s cancelled", job_id, extra={"fields": {"job_id": job_id, "previous_status": previous}})
+        return {"job_id": job_id, "status": "cancelled", "previous_status": previous}
+    
+    @staticmethod
+    async def cancel_jobs(job_ids: List[str]):
+        previous = await job_store.cancel(job_ids)
+        result = {"cancelled": [], "finished": [], "not_found": []}
+        for job_id, status in previous.items():
+            if status is None:
+                result["not_found"].append(job_id)
+            elif status in ("queued", "processing"):
+                result["cancelled"].append(job_id)
+            else:
+                result["finished"].append(job_id)
+        return result
+    
+    # List a user's jobs, newest first
+    @staticmethod
+    async def list_user_jobs(user_id: str, limit: int, cursor: Optional[str]):
+        try:
+            jobs, next_cursor = await job_store.list_user_jobs(user_id, limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        items = []
+        for job in jobs:
+            items.append({
+                "job_id": job["job_id"],
+                "video_id": job.get("video_id"),
+                "content_type": job.get("content_type"),
+                "status": job.get("status"),
+                "progress": job.get("progress", 0),
+                "created_at": format_timestamp(job.get("created_at")),
+                "download_url": artifact_urls.url_for(job["artifact_key"]) if job.get("artifact_key") else None,
+                "error": job.get("error"),
+            })
+        
+        return {"user_id": user_id, "jobs": items, "next_cursor": next_cursor}
+    
     # Process video conversion
-    async def process_video(self, job_id: str):
+    async def process_video(self, job_id: str, control: Optional[JobControl] = None):
+        job_data = {}
         try:
             # Update status to processing
-            await redis_client.hset(f"job:{job_id}", "status", "processing")
-            await redis_client.hset(f"job:{job_id}", "progress", "10")
+            await job_store.transition(job_id, "processing", progress=10)
             
             # Get job details
-            job_data = await redis_client.hgetall(f"job:{job_id}")
+            job_data = await job_store.get(job_id)
             video_id = job_data["video_id"]
             content_type = job_data["content_type"]
             quality = job_data.get("quality", "medium")
+            audio_format = job_data.get("audio_format") or None
             
             # Step 1: Download video
-            file_path = await self.download_video(job_id, video_id, content_type, quality)
+            file_path, info = await self.download_video(job_id, video_id, content_type, quality, audio_format, control)
             
-            # Step 2: Upload to cloud storage
-            await redis_client.hset(f"job:{job_id}", "progress", "80")
-            download_url = await self.upload_to_storage(file_path, video_id, content_type)
+            # Step 2: Upload to cloud storage; past this point the job is
+            # close enough to done that it is no longer worth preempting
+            if control:
+                control.raise_if_stopped()
+                control.preemptible = False
+            await job_store.set_progress(job_id, 80)
+            upload_started = time.perf_counter()
+            with tracer.start_as_current_span("s3.upload"):
+                s3_key = await self.upload_to_storage(file_path, video_id, quality)
+            upload_seconds = time.perf_counter() - upload_started
+            STAGE_SECONDS.labels("upload").observe(upload_seconds)
+            STAGE_BYTES_PER_SECOND.labels("upload").observe(os.path.getsize(file_path) / max(upload_seconds, 1e-6))
             
-            # Step 3: Complete job
-            await redis_client.hset(f"job:{job_id}", "status", "completed")
-            await redis_client.hset(f"job:{job_id}", "progress", "100")
-            await redis_client.hset(f"job:{job_id}", "download_url", download_url)
+            # Step 3: Complete job, unless it was cancelled since the last check
+            if control and await job_store.is_cancelled(job_id):
+                raise JobInterrupted("cancelled")
+            await job_store.transition(job_id, "completed", progress=100, artifact_key=s3_key)
             
-            # Cleanup
+            if job_data.get("user_id"):
+                await self.publish_episode(job_data, info, quality, file_path)
+            
+            # Keep the file in the node's hot tier for /download instead of deleting it
             if os.path.exists(file_path):
-                os.unlink(file_path)
+                try:
+                    with tracer.start_as_current_span("artifact_cache.put"):
+                        artifact_cache.put(artifact_name(video_id, quality, file_path), file_path)
+                except Exception as e:
+                    # The artifact is in S3 and the job is completed; /download fills from there
+                    ERRORS.labels("artifact_cache", type(e).__name__).inc()
+                    logger.warning("Caching artifact for job %s failed: %s", job_id, e)
+            
+            JOBS_TOTAL.labels("completed").inc()
+            return s3_key
             
-            return download_url
+        except JobInterrupted as e:
+            reason = e.reason
+            # Back to the consuming end of the queue, so it runs next; a cancel
+            # that landed meanwhile wins
+            if reason != "preempted" or not await job_store.requeue(job_id, "conversion_queue", front=True):
+                reason = "cancelled"
+                await self.finish_cancelled(job_id)
+            JOBS_TOTAL.labels(reason).inc()
+            logger.info("Job %s %s", job_id, reason, extra={"fields": {"job_id": job_id}})
+            return None
+            
+        except TempSpaceExhausted as e:
+            # Node is out of scratch space - hand the job back for any worker to retry
+            queue = "priority_queue" if int(job_data.get("priority") or 0) > 0 else "conversion_queue"
+            if not await job_store.requeue(job_id, queue):
+                await self.finish_cancelled(job_id)
+                JOBS_TOTAL.labels("cancelled").inc()
+                return None
+            JOBS_TOTAL.labels("requeued").inc()
+            logger.warning("Job %s requeued: %s", job_id, e)
+            return None
             
         except Exception as e:
-            await redis_client.hset(f"job:{job_id}", "status", "failed")
-            await redis_client.hset(f"job:{job_id}", "error", str(e))
-            logging.error(f"Job {job_id} failed: {e}")
+            await job_store.transition(job_id, "failed", error=str(e))
+            JOBS_TOTAL.labels("failed").inc()
+            ERRORS.labels("worker", type(e).__name__).inc()
+            logger.error("Job %s failed: %s", job_id, e, extra={"fields": {"job_id": job_id}})
             raise
+        
+        finally:
+            temp_space.release(job_id)
+            temp_space.cleanup_job(job_id)
+    
+    @staticmethod
+    async def finish_cancelled(job_id: str):
+        # The worker may have marked it processing after the cancel landed
+        await job_store.transition(job_id, "cancelled")
+        await job_store.consume_tombstone(job_id)
     
     # Download video using yt-dlp
-    async def download_video(self, job_id: str, video_id: str, content_type: str, quality: str):
+    async def download_video(self, job_id: str, video_id: str, content_type: str, quality: str, audio_format: Optional[str] = None,
+                             control: Optional[JobControl] = None):
+        # Only workers need yt-dlp; API replicas never import it
+        import yt_dlp
+        slot = None
         try:
-            await redis_client.hset(f"job:{job_id}", "progress", "20")
+            await job_store.set_progress(job_id, 20)
             
             # Quality settings
             quality_map = {
-                "low": {
-                    "audio": "ba[abr<=128]/best[abr<=128]",
-                    "video": "bv[height<=480]+ba/best[height<=480]"
-                },
-                "medium": {
-                    "audio": "ba[abr<=192]/best[abr<=192]", 
-                    "video": "bv[height<=720]+ba/best[height<=720]"
-                },
-                "high": {
-                    "audio": "ba/best",
-                    "video": "bv[height<=1080]+ba/best[height<=1080]"
-                }
+                "low": "bv[height<=480]+ba/best[height<=480]",
+                "medium": "bv[height<=720]+ba/best[height<=720]",
+                "high": "bv[height<=1080]+ba/best[height<=1080]"
             }
             
-            format_selector = quality_map[quality][content_type]
-            file_extension = "mp3" if content_type == "audio" else "mp4"
-            output_path = os.path.join(TEMP_DIR, f"{job_id}.{file_extension}")
-            
-            ydl_opts = {
-                'format': format_selector,
-                'outtmpl': output_path,
-                'noplaylist': True,
-                'extract_flat': False,
-            }
+            # Download under the video/format/quality key so a failed attempt
+            # can be resumed; if another job on this node has that key, fall
+            # back to a job-private path
+            slot = partials.claim(video_id, content_type, quality, audio_format)
+            base = slot.base if slot else os.path.join(TEMP_DIR, job_id)
             
             if content_type == "audio":
-                ydl_opts.update({
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192' if quality == "medium" else '128' if quality == "low" else '320',
-                    }]
-                })
+                # Stream-copy the native track into the requested container;
+                # MP3 is only re-encoded when the client asked for it
+                audio_opts = build_audio_options(resolve_audio_format(audio_format), quality)
+                output_path = f"{base}.{audio_opts['ext']}"
+                ydl_opts = {
+                    'format': audio_opts['format'],
+                    'outtmpl': f"{base}.%(ext)s",
+                    'postprocessors': audio_opts['postprocessors'],
+                    'noplaylist': True,
+                    'extract_flat': False,
+                }
+            else:
+                output_path = f"{base}.mp4"
+                ydl_opts = {
+                    'format': quality_map[quality],
+                    'outtmpl': output_path,
+                    'noplaylist': True,
+                    'extract_flat': False,
+                }
+            # Pick up an existing .part file with an HTTP Range request
+            ydl_opts['continuedl'] = True
             
-            await redis_client.hset(f"job:{job_id}", "progress", "40")
+            await job_store.set_progress(job_id, 40)
             
-            # Use yt-dlp in subprocess for better control
-            youtube_url = f"https://youtube.com/watch?v={video_id}"
+            youtube_url = YOUTUBE_WATCH_URL.format(video_id=video_id)
+            loop = asyncio.get_event_loop()
+            
+            def check_stopped(d):
+                # Raised on yt-dlp's thread between chunks and before/after each ffmpeg step
+                if control and control.reason:
+                    raise yt_dlp.utils.DownloadCancelled(control.reason)
+            
+            ydl_opts['progress_hooks'] = [check_stopped, observe_download]
+            if slot:
+                # Resumed files are checked before they are merged or transcoded
+                ydl_opts['progress_hooks'].append(slot.verify_hook)
+            # Hooks run on the executor thread, so hand them the trace context explicitly
+            ydl_opts['postprocessor_hooks'] = [check_stopped, TranscodeTimer(otel_context.get_current()).hook]
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                await asyncio.get_event_loop().run_in_executor(
-                    None, ydl.download, [youtube_url]
-                )
+                # Resolve formats first so the job's disk usage can be reserved
+                with tracer.start_as_current_span("yt-dlp.extract_info"):
+                    info = await loop.run_in_executor(
+                        None, lambda: ydl.extract_info(youtube_url, download=False)
+                    )
+                with tracer.start_as_current_span("temp_space.reserve"):
+                    await temp_space.reserve(job_id, estimate_job_bytes(info), control=control,
+                                             partial_key=slot.key if slot else None)
+                with tracer.start_as_current_span("yt-dlp.download"):
+                    try:
+                        await loop.run_in_executor(
+                            None, lambda: ydl.process_ie_result(info, download=True)
+                        )
+                    except Exception:
+                        if not (slot and slot.corrupt):
+                            raise
+                        # The bad file was deleted by the check; fetch it once more from scratch
+                        logger.warning("Resumed download of %s failed verification, restarting", video_id)
+                        slot.corrupt = False
+                        await loop.run_in_executor(
+                            None, lambda: ydl.process_ie_result(info, download=True)
+                        )
             
-            await redis_client.hset(f"job:{job_id}", "progress", "60")
+            await job_store.set_progress(job_id, 60)
             
             if not os.path.exists(output_path):
                 raise Exception("File not created after download")
             
-            return output_path
+            if slot:
+                # Hand the finished file to the job and drop the key's leftovers
+                job_path = os.path.join(TEMP_DIR, f"{job_id}{os.path.splitext(output_path)[1]}")
+                shutil.move(output_path, job_path)
+                slot.discard()
+                output_path = job_path
+            
+            return output_path, info
             
+        except (TempSpaceExhausted, JobInterrupted):
+            raise
         except Exception as e:
+            if control and control.reason:
+                raise JobInterrupted(control.reason)
             raise Exception(f"Download failed: {str(e)}")
+        finally:
+            if slot:
+                slot.release()
+    
+    # Add a completed job to its owner's podcast feed
+    @staticmethod
+    async def publish_episode(job_data: dict, info: dict, quality: str, file_path: str):
+        try:
+            await feeds.add_episode(job_data["user_id"], {
+                "title": job_data.get("title") or info.get("title") or job_data["video_id"],
+                "video_id": job_data["video_id"],
+                "artifact": artifact_name(job_data["video_id"], quality, file_path),
+                "size": os.path.getsize(file_path),
+                "duration": info.get("duration"),
+                "published": now_ms(),
+            })
+        except Exception as e:
+            # The conversion itself succeeded; the feed picks the video up on its next conversion
+            ERRORS.labels("feed", type(e).__name__).inc()
+            logger.warning("Feed update failed for job %s: %s", job_data.get("job_id"), e)
     
     # Upload to cloud storage
-    async def upload_to_storage(self, file_path: str, video_id: str, content_type: str):
+    async def upload_to_storage(self, file_path: str, video_id: str, quality: str):
         try:
-            file_extension = "mp3" if content_type == "audio" else "mp4"
-            s3_key = f"conversions/{video_id}.{file_extension}"
+            file_extension = os.path.splitext(file_path)[1].lstrip(".")
+            s3_key = artifact_key(artifact_name(video_id, quality, file_path))
+            mime_type = AUDIO_MIME_TYPES.get(file_extension, "video/mp4")
             
-            # Upload to S3
+            # Upload to S3 (private unless STORAGE_MODE=public)
             await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: s3_client.upload_file(
-                    file_path, 
-                    AWS_BUCKET, 
-                    s3_key,
-                    ExtraArgs={
-                        'ContentType': f'{content_type}/{"mpeg" if content_type == "audio" else "mp4"}',
-                        'ACL': 'public-read'
-                    }
-                )
+                None, cold_storage.upload, file_path, s3_key, mime_type
             )
+            artifact_urls.invalidate(s3_key)
             
-            # Generate public URL
-            download_url = f"https://{AWS_BUCKET}.s3.amazonaws.com/{s3_key}"
-            return download_url
+            return s3_key
             
         except Exception as e:
             raise Exception(f"Upload failed: {str(e)}")
 
+def warm_up(*modules: str):
+    """Import heavy modules and create the S3 client off the request path"""
+    started = time.perf_counter()
+    try:
+        for module in modules:
+            importlib.import_module(module)
+        cold_storage.client
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+        return
+    logger.info("Warm-up finished", extra={"fields": {
+        "modules": list(modules), "seconds": round(time.perf_counter() - started, 3)
+    }})
+
+def observe_download(d):
+    """yt-dlp progress hook: record download duration and rate per file"""
+    if d.get("status") == "finished" and d.get("elapsed"):
+        STAGE_SECONDS.labels("download").observe(d["elapsed"])
+        downloaded = d.get("total_bytes") or d.get("downloaded_bytes") or 0
+        STAGE_BYTES_PER_SECOND.labels("download").observe(downloaded / max(d["elapsed"], 1e-6))
+
+class TranscodeTimer:
+    """yt-dlp postprocessor hook: time and trace each ffmpeg postprocessing step"""
+    def __init__(self, parent_context=None):
+        self.parent_context = parent_context
+        self.started = {}
+    
+    def hook(self, d):
+        name = d.get("postprocessor")
+        if d.get("status") == "started":
+            span = tracer.start_span(f"ffmpeg {name}", context=self.parent_context)
+            self.started[name] = (time.perf_counter(), span)
+        elif d.get("status") == "finished" and name in self.started:
+            started, span = self.started.pop(name)
+            STAGE_SECONDS.labels("transcode").observe(time.perf_counter() - started)
+            span.end()
+
+def artifact_name(video_id: str, quality: str, file_path: str) -> str:
+    """
+    Public artifact name ("<video_id>-<quality>.<ext>") shared by S3 and the
+    local cache; the extension carries the format, so conversions of one
+    video at different settings never overwrite each other
+    """
+    return f"{video_id}-{quality}{os.path.splitext(file_path)[1]}"
+
 # API instance
 conversion_api = ConversionAPI()
 
@@ -259,60 +575,208 @@ conversion_api = ConversionAPI()
 async def convert_video(
     video_id: str = Query(..., description="YouTube video ID"),
     content_type: str = Query(..., description="'audio' or 'video'"),
-    quality: str = Query("medium", description="Quality: low, medium, high")
+    quality: str = Query("medium", description="Quality: low, medium, high"),
+    audio_format: Optional[str] = Query(None, description="Audio container: m4a or opus (no re-encode), mp3 (re-encode)"),
+    user_id: Optional[str] = Query(None, description="Owner, for /users/{user_id}/jobs listings"),
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=IDEMPOTENCY_KEY_MAX_LENGTH)
 ):
     """Convert single YouTube video"""
-    return await conversion_api.convert_single(video_id, content_type, quality)
+    return await conversion_api.convert_single(video_id, content_type, quality, audio_format, user_id, client_key)
 
 @app.post("/convert/batch")
-async def convert_batch(batch_request: BatchConversionRequest):
+async def convert_batch(
+    batch_request: BatchConversionRequest,
+    client_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=IDEMPOTENCY_KEY_MAX_LENGTH)
+):
     """Convert multiple videos in batch"""
-    return await conversion_api.convert_batch(batch_request)
+    return await conversion_api.convert_batch(batch_request, client_key)
 
 @app.get("/status/{job_id}")
 async def get_job_status(job_id: str):
     """Get conversion job status"""
-    return await conversion_api.get_status(job_id)
+    return FastJSONResponse(await conversion_api.get_status(job_id))
+
+@app.delete("/status/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; running jobs stop at their next check"""
+    return await conversion_api.cancel_job(job_id)
+
+@app.post("/cancel/batch")
+async def cancel_batch(cancel_request: CancelBatchRequest):
+    """Cancel several jobs at once"""
+    return await conversion_api.cancel_jobs(cancel_request.job_ids)
+
+@app.delete("/users/{user_id}/jobs")
+async def cancel_user_jobs(user_id: str):
+    """Cancel every queued or running job of a user"""
+    result = await conversion_api.cancel_jobs(await job_store.live_user_jobs(user_id))
+    return {"user_id": user_id, "cancelled": len(result["cancelled"])}
+
+@app.get("/users/{user_id}/jobs")
+async def list_user_jobs(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=JOB_LIST_MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """List a user's conversion jobs, newest first"""
+    return FastJSONResponse(await conversion_api.list_user_jobs(user_id, limit, cursor))
+
+@app.api_route("/feeds/{user_id}.xml", methods=["GET", "HEAD"])
+async def user_feed(user_id: str, request: Request):
+    """Podcast RSS feed of a user's completed conversions"""
+    response = await feeds.response(user_id, request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Feed not found")
+    return response
+
+@app.get("/autoscale")
+async def autoscale():
+    """Desired worker count and the queue signals behind it, for an external autoscaler"""
+    return await admission.autoscale()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return metrics_response()
 
 @app.get("/queue/stats")
 async def get_queue_stats():
     """Get queue statistics"""
     queue_length = await redis_client.llen("conversion_queue")
     priority_length = await redis_client.llen("priority_queue")
+    # Workers run in separate processes and count themselves in Redis
+    active_jobs = int(await redis_client.get("active_jobs") or 0)
     
     return {
         "queue_length": queue_length,
         "priority_queue_length": priority_length,
-        "active_jobs": conversion_api.active_jobs,
-        "max_concurrent": conversion_api.max_concurrent
+        "active_jobs": active_jobs,
+        "max_concurrent": conversion_api.max_concurrent,
+        "jobs_by_state": await job_store.count_by_state(),
+        "estimated_wait_seconds": await admission.current_wait()
     }
 
 # Background worker (separate process)
 async def worker():
     """Background worker to process conversion jobs"""
+    if redis_client is None:
+        await startup()
+    # Load yt-dlp before the first job needs it
+    if WARM_UP:
+        asyncio.get_event_loop().run_in_executor(None, warm_up, "yt_dlp")
+    if WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(WORKER_METRICS_PORT)
+    # Heartbeats run beside the loop, so a worker stays counted while it converts
+    heartbeats = asyncio.create_task(worker_heartbeat())
+    try:
+        await worker_loop()
+    finally:
+        heartbeats.cancel()
+        await admission.retire()
+
+async def worker_heartbeat():
+    """Advertise this worker's capacity and load to admission control until cancelled"""
+    while True:
+        try:
+            # Jobs run one at a time in the worker loop, so it contributes a single slot
+            await admission.heartbeat(slots=1, busy=min(conversion_api.active_jobs, 1))
+        except Exception as e:
+            logger.warning("Worker heartbeat failed: %s", e)
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+def init_scratch():
+    """Set up the scratch dir and its budget on first use by a worker"""
+    global partials, temp_space
+    if temp_space is not None:
+        return
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    # Interrupted downloads, resumed by the next attempt at the same video/format/quality
+    partials = PartialDownloads()
+    temp_space = TempSpaceBudget(TEMP_DIR, partials_dir=partials.directory)
+    # Reclaim scratch space from jobs that died before their cleanup ran
+    temp_space.janitor()
+
+async def worker_loop():
+    """Take jobs off the queues and run them one at a time"""
+    init_scratch()
+    next_janitor_run = 0.0
     while True:
         try:
+            # One worker at a time archives and drops finished jobs past their TTL
+            if time.monotonic() >= next_janitor_run:
+                next_janitor_run = time.monotonic() + JOB_JANITOR_INTERVAL
+                # Partials are local to the node, so every worker sweeps them,
+                # keeping them within what the scratch budget can spare
+                await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: partials.expire(temp_space.partials_allowance())
+                )
+                if await redis_client.set("jobs:janitor", "1", nx=True, ex=JOB_JANITOR_INTERVAL):
+                    await job_store.expire_finished()
+            
+            # Don't take work this node has no scratch space for
+            if temp_space.available() <= 0:
+                await asyncio.sleep(5)
+                continue
+            
             # Check priority queue first
             job_id = await redis_client.brpop("priority_queue", timeout=1)
             if not job_id:
                 job_id = await redis_client.brpop("conversion_queue", timeout=1)
             
             if job_id:
-                job_id = job_id[1].decode()
+                queue_name, job_id = job_id
+                
+                # Cancelled while queued: drop it here rather than searching the list
+                if await job_store.consume_tombstone(job_id):
+                    JOBS_TOTAL.labels("cancelled").inc()
+                    continue
+                
+                created_at, request_id, traceparent, tracestate = await job_store.get_fields(
+                    job_id, "created_at", "request_id", "traceparent", "tracestate"
+                )
+                if created_at:
+                    QUEUE_WAIT_SECONDS.labels(queue_name).observe((now_ms() - created_at) / 1000)
+                
+                # Correlate worker logs with the request that submitted the job
+                request_id_var.set(request_id or job_id)
                 
                 if conversion_api.active_jobs < conversion_api.max_concurrent:
                     conversion_api.active_jobs += 1
+                    ACTIVE_JOBS.inc()
+                    await redis_client.incr("active_jobs")
+                    # Report the busy slot now rather than at the next periodic heartbeat
+                    await admission.heartbeat(slots=1, busy=1)
+                    job_started = time.perf_counter()
+                    requeued = False
+                    # Only backfill jobs make way for waiting priority jobs
+                    control = JobControl(job_id, preemptible=PREEMPTION_ENABLED and queue_name == "conversion_queue")
+                    watcher = asyncio.create_task(control.watch(job_store, redis_client))
                     try:
-                        await conversion_api.process_video(job_id)
+                        # Resume the trace started by /convert
+                        with tracer.start_as_current_span(
+                            "conversion.job",
+                            context=context_from_fields({"traceparent": traceparent, "tracestate": tracestate}),
+                            kind=SpanKind.CONSUMER,
+                            attributes={"job.id": job_id, "messaging.source": queue_name},
+                        ):
+                            requeued = await conversion_api.process_video(job_id, control) is None
                     finally:
+                        watcher.cancel()
                         conversion_api.active_jobs -= 1
+                        ACTIVE_JOBS.dec()
+                        await redis_client.decr("active_jobs")
+                        await admission.heartbeat(slots=1, busy=0)
+                        # Requeued, preempted and cancelled jobs return early and would skew the service time
+                        if not requeued:
+                            await admission.record_service_time(time.perf_counter() - job_started)
                 else:
                     # Put job back in queue if at capacity
                     await redis_client.lpush("conversion_queue", job_id)
                     await asyncio.sleep(1)
             
         except Exception as e:
-            logging.error(f"Worker error: {e}")
+            logger.exception("Worker error: %s", e)
             await asyncio.sleep(5)
 
 if __name__ == "__main__":
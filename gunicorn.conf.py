@@ -0,0 +1,57 @@
+# Production launcher for main.py
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# The app (FastAPI, pydantic models, boto3, OpenTelemetry, ...) is imported
+# once in the master and workers are forked from it, so the imported code and
+# data stay shared copy-on-write instead of being loaded per worker. Set
+# SHARED_STATE_URL so workers share the tokeninfo cache, channel sync state
+# (required for /sync_user_videos?enqueue=true), RapidAPI rate limits
+# and circuit state; without it each worker keeps its own.
+
+import gc
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# RapidAPI calls are allowed up to 90s
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+# Metrics from every worker are aggregated through this directory; it has to
+# be set before prometheus_client is imported by the preloaded app
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/yt-converter-metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # Drop files left by a previous run; the preloaded master has already
+    # created its own, which are kept
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    for name in os.listdir(metrics_dir):
+        if not name.endswith(f"_{os.getpid()}.db"):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    # Keep the preloaded heap out of the collector so GC passes in the
+    # workers don't write to (and un-share) the parent's pages
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,225 @@
+import os
+import math
+import time
+import socket
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from lib.metrics import ADMISSION_DECISIONS
+
+# Reject new work whose projected queue wait exceeds this
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "1800"))
+# Per-job service time assumed until workers have reported any
+ADMISSION_DEFAULT_SERVICE_SECONDS = float(os.getenv("ADMISSION_DEFAULT_SERVICE_SECONDS", "60"))
+# Recent job durations kept for the rolling service time
+ADMISSION_SAMPLE_SIZE = int(os.getenv("ADMISSION_SAMPLE_SIZE", "200"))
+# Queue statistics are re-read from Redis at most this often per process
+ADMISSION_CACHE_SECONDS = float(os.getenv("ADMISSION_CACHE_SECONDS", "2"))
+# Workers that haven't heartbeated for this long don't count as capacity
+WORKER_HEARTBEAT_TTL = float(os.getenv("WORKER_HEARTBEAT_TTL", "30"))
+
+# Autoscaling targets
+AUTOSCALE_TARGET_UTILIZATION = float(os.getenv("AUTOSCALE_TARGET_UTILIZATION", "0.7"))
+AUTOSCALE_DRAIN_SECONDS = float(os.getenv("AUTOSCALE_DRAIN_SECONDS", "600"))
+AUTOSCALE_MIN_WORKERS = int(os.getenv("AUTOSCALE_MIN_WORKERS", "1"))
+AUTOSCALE_MAX_WORKERS = int(os.getenv("AUTOSCALE_MAX_WORKERS", "20"))
+
+ARRIVAL_BUCKET_SECONDS = 60
+ARRIVAL_WINDOW_BUCKETS = 5
+
+SERVICE_TIMES_KEY = "admission:service_seconds"
+HEARTBEAT_KEY = "admission:workers"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class AdmissionController:
+    """
+    Queue-aware admission control and autoscaling signals
+
+    Workers report each job's duration and, from a background task that
+    keeps running while they convert, a heartbeat with their slot count
+    and how many of those slots are busy. From those and the queue depths,
+    the estimated wait for a new job is:
+
+        0 if a slot is free for it, else
+        (jobs ahead of it + busy slots / 2) x rolling mean service time / live worker slots
+
+    counting each in-flight job as half done on average.
+
+    Submissions whose estimated wait exceeds ADMISSION_MAX_WAIT_SECONDS are
+    refused with a Retry-After of the time until the backlog has drained
+    back under the SLO.
+    """
+
+    def __init__(self, redis, normal_queue: str = "conversion_queue", priority_queue: str = "priority_queue",
+                 max_wait_seconds: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.redis = redis
+        self.normal_queue = normal_queue
+        self.priority_queue = priority_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_at = 0.0
+
+    # Worker side
+
+    async def record_service_time(self, seconds: float):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(SERVICE_TIMES_KEY, f"{seconds:.3f}")
+            pipe.ltrim(SERVICE_TIMES_KEY, 0, ADMISSION_SAMPLE_SIZE - 1)
+            await pipe.execute()
+
+    async def heartbeat(self, slots: int, busy: int = 0, ident: Optional[str] = None):
+        await self.redis.hset(HEARTBEAT_KEY, ident or worker_id(), f"{time.time():.0f} {slots} {busy}")
+
+    async def retire(self, ident: Optional[str] = None):
+        await self.redis.hdel(HEARTBEAT_KEY, ident or worker_id())
+
+    # API side
+
+    async def record_arrivals(self, count: int):
+        bucket = int(time.time() // ARRIVAL_BUCKET_SECONDS)
+        key = f"admission:arrivals:{bucket}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(key, count)
+            pipe.expire(key, ARRIVAL_BUCKET_SECONDS * (ARRIVAL_WINDOW_BUCKETS + 1))
+            await pipe.execute()
+
+    async def snapshot(self, refresh: bool = False) -> Dict[str, Any]:
+        """Queue depths, live capacity, service time and arrival rate (cached briefly)"""
+        if not refresh and self._snapshot and time.monotonic() - self._snapshot_at < ADMISSION_CACHE_SECONDS:
+            return self._snapshot
+
+        now = time.time()
+        current_bucket = int(now // ARRIVAL_BUCKET_SECONDS)
+        arrival_keys = [f"admission:arrivals:{current_bucket - n}" for n in range(ARRIVAL_WINDOW_BUCKETS)]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.normal_queue)
+            pipe.llen(self.priority_queue)
+            pipe.lrange(SERVICE_TIMES_KEY, 0, -1)
+            pipe.hgetall(HEARTBEAT_KEY)
+            pipe.mget(arrival_keys)
+            normal_depth, priority_depth, samples, heartbeats, arrivals = await pipe.execute()
+
+        workers, slots, busy, stale = 0, 0, 0, []
+        for ident, value in heartbeats.items():
+            try:
+                seen, worker_slots, worker_busy = value.split()
+                seen, worker_slots, worker_busy = float(seen), int(worker_slots), int(worker_busy)
+            except ValueError:
+                # Unreadable entries are dropped along with the stale ones
+                seen = 0.0
+            if now - seen > WORKER_HEARTBEAT_TTL:
+                stale.append(ident)
+                continue
+            workers += 1
+            slots += worker_slots
+            busy += min(worker_busy, worker_slots)
+        if stale:
+            await self.redis.hdel(HEARTBEAT_KEY, *stale)
+
+        durations = [float(sample) for sample in samples]
+        # The current bucket is partial, so count only the time elapsed in it
+        window = (ARRIVAL_WINDOW_BUCKETS - 1) * ARRIVAL_BUCKET_SECONDS + (now % ARRIVAL_BUCKET_SECONDS)
+
+        self._snapshot = {
+            "queue_depth": normal_depth + priority_depth,
+            "normal_queue_depth": normal_depth,
+            "priority_queue_depth": priority_depth,
+            "workers": workers,
+            "slots": slots,
+            "busy_slots": busy,
+            "free_slots": slots - busy,
+            "service_seconds": sum(durations) / len(durations) if durations else ADMISSION_DEFAULT_SERVICE_SECONDS,
+            "service_samples": len(durations),
+            "arrival_rate": sum(int(count or 0) for count in arrivals) / window,
+        }
+        self._snapshot_at = time.monotonic()
+        return self._snapshot
+
+    @staticmethod
+    def estimated_wait(snapshot: Dict[str, Any], jobs_ahead: int) -> float:
+        """Seconds until a job with `jobs_ahead` queued before it starts; inf with no workers"""
+        if snapshot["slots"] <= 0:
+            return math.inf
+        if jobs_ahead < snapshot["free_slots"]:
+            return 0.0
+        # In-flight jobs are on average half done
+        work = (jobs_ahead + snapshot["busy_slots"] / 2) * snapshot["service_seconds"]
+        return work / snapshot["slots"]
+
+    async def current_wait(self) -> Optional[float]:
+        """Estimated wait for a job submitted now, None when no worker is alive"""
+        snapshot = await self.snapshot()
+        wait = self.estimated_wait(snapshot, snapshot["queue_depth"])
+        return None if wait == math.inf else round(wait, 1)
+
+    async def admit(self, count: int = 1, priority: bool = False):
+        """
+        Admit `count` new jobs or refuse them
+
+        Args:
+            count: Jobs being submitted together
+            priority: Whether they go to the priority queue (which only
+                waits behind other priority jobs)
+
+        Raises:
+            HTTPException: 503 when no worker is alive, 429 when the
+                projected wait exceeds the SLO; both carry Retry-After
+        """
+        snapshot = await self.snapshot()
+        ahead = snapshot["priority_queue_depth"] if priority else snapshot["queue_depth"]
+        # The last of the new jobs waits behind the other count - 1 as well
+        wait = self.estimated_wait(snapshot, ahead + count - 1)
+
+        if wait == math.inf:
+            ADMISSION_DECISIONS.labels("no_workers").inc()
+            raise HTTPException(
+                status_code=503,
+                detail="No conversion workers are available. Please retry later.",
+                headers={"Retry-After": str(int(WORKER_HEARTBEAT_TTL))},
+            )
+        if wait > self.max_wait_seconds:
+            ADMISSION_DECISIONS.labels("rejected").inc()
+            retry_after = math.ceil(wait - self.max_wait_seconds)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Conversion queue is full (estimated wait {wait:.0f}s). Please retry later.",
+                headers={"Retry-After": str(retry_after)},
+            )
+        ADMISSION_DECISIONS.labels("admitted").inc()
+
+    async def autoscale(self) -> Dict[str, Any]:
+        """
+        Desired worker count for an external autoscaler
+
+        Enough slots to carry the arrival rate at the target utilisation,
+        plus enough to drain the current backlog within
+        AUTOSCALE_DRAIN_SECONDS, clamped to the configured bounds.
+        """
+        snapshot = await self.snapshot(refresh=True)
+        service = snapshot["service_seconds"]
+        slots_per_worker = snapshot["slots"] / snapshot["workers"] if snapshot["workers"] else 1
+
+        steady_slots = snapshot["arrival_rate"] * service / AUTOSCALE_TARGET_UTILIZATION
+        backlog_slots = snapshot["queue_depth"] * service / AUTOSCALE_DRAIN_SECONDS
+        desired = math.ceil((steady_slots + backlog_slots) / slots_per_worker)
+        desired = max(AUTOSCALE_MIN_WORKERS, min(AUTOSCALE_MAX_WORKERS, desired))
+
+        wait = self.estimated_wait(snapshot, snapshot["queue_depth"])
+        utilization = snapshot["arrival_rate"] * service / snapshot["slots"] if snapshot["slots"] else None
+        return {
+            "desired_workers": desired,
+            "current_workers": snapshot["workers"],
+            "slots": snapshot["slots"],
+            "busy_slots": snapshot["busy_slots"],
+            "free_slots": snapshot["free_slots"],
+            "queue_depth": snapshot["queue_depth"],
+            "arrival_rate_per_second": round(snapshot["arrival_rate"], 4),
+            "service_seconds": round(service, 2),
+            "service_samples": snapshot["service_samples"],
+            "estimated_wait_seconds": None if wait == math.inf else round(wait, 1),
+            "max_wait_seconds": self.max_wait_seconds,
+            "utilization": None if utilization is None else round(utilization, 3),
+        }
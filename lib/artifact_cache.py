@@ -0,0 +1,193 @@
+import os
+import time
+import shutil
+import fcntl
+from contextlib import contextmanager
+from typing import Optional, Callable, Dict, List, Tuple
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", os.path.join(os.getcwd(), "downloads"))
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+
+# A fill marker older than this is assumed to belong to a dead process
+FILL_MARKER_TIMEOUT = 600
+USED_MARKER_SUFFIX = ".used"
+
+
+class ArtifactCache:
+    """
+    Disk-backed LRU cache of finished conversion artifacts (the hot tier)
+
+    All state lives in the cache directory itself, so every API process and
+    worker on a node shares one cache. An entry's recency is the mtime of its
+    `.<name>.used` marker, touched on every hit (atime is unreliable under
+    noatime/relatime, and the artifact's own mtime must stay stable for HTTP
+    validators). Writers serialise eviction through an flock on `.lock`.
+    Files starting with "." are in-flight writes or markers and never served
+    or evicted directly.
+    """
+
+    def __init__(self, cache_dir: str = ARTIFACT_CACHE_DIR, max_bytes: int = ARTIFACT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.cache_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def path_for(self, name: str) -> str:
+        """
+        Map an artifact name to its path in the cache
+
+        Raises:
+            ValueError: If the name could escape the cache directory
+        """
+        if not name or name.startswith(".") or "\x00" in name or os.path.basename(name) != name:
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        path = os.path.join(self.cache_dir, name)
+        # Also refuse symlinks planted in the cache that point elsewhere
+        if os.path.dirname(os.path.realpath(path)) != os.path.realpath(self.cache_dir):
+            raise ValueError(f"Invalid artifact name: {name!r}")
+        return path
+
+    def _used_marker(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f".{name}{USED_MARKER_SUFFIX}")
+
+    def _touch(self, name: str) -> bool:
+        """Mark an entry recently used; False if the artifact is gone (e.g. evicted meanwhile)"""
+        marker = self._used_marker(name)
+        try:
+            os.utime(marker)
+            return True
+        except FileNotFoundError:
+            pass
+        if not os.path.isfile(os.path.join(self.cache_dir, name)):
+            return False
+        os.close(os.open(marker, os.O_CREAT | os.O_WRONLY))
+        os.utime(marker)
+        # An eviction between the check and the create would leave the marker orphaned
+        if not os.path.isfile(os.path.join(self.cache_dir, name)):
+            try:
+                os.unlink(marker)
+            except FileNotFoundError:
+                pass
+            return False
+        return True
+
+    def get(self, name: str) -> Optional[str]:
+        """Return the cached path for `name` and mark it recently used, or None"""
+        path = self.path_for(name)
+        if not os.path.isfile(path) or not self._touch(name):
+            return None
+        return path
+
+    def put(self, name: str, src_path: str) -> Optional[str]:
+        """
+        Move a finished file into the cache, evicting LRU entries to fit
+
+        Args:
+            name: Artifact name, e.g. "<video_id>-medium.m4a"
+            src_path: File to take ownership of (it is moved, not copied)
+
+        Returns:
+            Cached path, or None if the file is larger than the whole budget
+        """
+        path = self.path_for(name)
+        size = os.path.getsize(src_path)
+        if size > self.max_bytes:
+            os.unlink(src_path)
+            return None
+
+        # Stage under a dot-name so readers never see a half-moved file
+        staging_path = os.path.join(self.cache_dir, f".{name}.{os.getpid()}.tmp")
+        shutil.move(src_path, staging_path)
+        with self._lock():
+            self._evict(self.max_bytes - size)
+            os.replace(staging_path, path)
+            self._touch(name)
+        return path
+
+    def fill(self, name: str, fetch: Callable[[str], None]) -> Optional[str]:
+        """
+        Populate an entry from the cold tier unless another process already is
+
+        Args:
+            name: Artifact name
+            fetch: Callable that writes the artifact to the given path
+
+        Returns:
+            Cached path, or None if a fill was already in progress
+        """
+        marker = os.path.join(self.cache_dir, f".{name}.filling")
+        try:
+            if time.time() - os.path.getmtime(marker) > FILL_MARKER_TIMEOUT:
+                os.unlink(marker)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+
+        download_path = f"{marker}.{os.getpid()}.part"
+        try:
+            fetch(download_path)
+            return self.put(name, download_path)
+        finally:
+            for leftover in (download_path, marker):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+
+    def _scan(self) -> Tuple[Dict[str, os.stat_result], Dict[str, float]]:
+        """Artifact stats and used-marker mtimes, both by artifact name"""
+        files, used = {}, {}
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if entry.name.startswith("."):
+                    if entry.name.endswith(USED_MARKER_SUFFIX):
+                        used[entry.name[1:-len(USED_MARKER_SUFFIX)]] = entry.stat().st_mtime
+                    continue
+                files[entry.name] = entry.stat()
+        return files, used
+
+    @staticmethod
+    def _to_entries(files: Dict[str, os.stat_result], used: Dict[str, float]) -> List[Tuple[float, int, str]]:
+        return [(used.get(name, stat.st_mtime), stat.st_size, name) for name, stat in files.items()]
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(last used, size, name) of each entry; entries never touched fall back to their mtime"""
+        return self._to_entries(*self._scan())
+
+    def _evict(self, target_bytes: int):
+        """
+        Delete least recently used entries until usage <= target_bytes, and
+        used markers whose artifact is gone (lock held)
+        """
+        files, used = self._scan()
+        for name in used.keys() - files.keys():
+            try:
+                os.unlink(self._used_marker(name))
+            except FileNotFoundError:
+                pass
+        entries = sorted(self._to_entries(files, used))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= target_bytes:
+                break
+            for path in (os.path.join(self.cache_dir, name), self._used_marker(name)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def usage(self) -> int:
+        """Total bytes currently held in the cache"""
+        return sum(size for _, size, _ in self._entries())
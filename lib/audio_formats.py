@@ -0,0 +1,101 @@
+import os
+from typing import Dict, Any, Optional
+from fastapi import HTTPException
+
+# Output containers the conversion worker can deliver for audio jobs.
+# "native" formats are filled by stream-copying YouTube's own audio track
+# (AAC for m4a, Opus for opus) - no decode/encode. MP3 always re-encodes.
+AUDIO_FORMATS = {
+    "m4a": {
+        "ext": "m4a",
+        "mime": "audio/mp4",
+        "stream": "ba[ext=m4a]",
+        "native": True,
+    },
+    "opus": {
+        "ext": "opus",
+        "mime": "audio/ogg",
+        "stream": "ba[acodec=opus]",
+        "native": True,
+    },
+    "mp3": {
+        "ext": "mp3",
+        "mime": "audio/mpeg",
+        "stream": "ba",
+        "native": False,
+    },
+}
+
+DEFAULT_AUDIO_FORMAT = os.getenv("DEFAULT_AUDIO_FORMAT", "m4a")
+
+# Upper bound on source bitrate per quality level (None = best available)
+AUDIO_BITRATE_LIMITS = {"low": 128, "medium": 192, "high": None}
+
+# Target bitrate when MP3 re-encoding is explicitly requested
+MP3_BITRATES = {"low": "128", "medium": "192", "high": "320"}
+
+
+def resolve_audio_format(requested: Optional[str]) -> str:
+    """
+    Normalise the client's requested audio container
+
+    Args:
+        requested: Container name from the request, or None for the default
+
+    Returns:
+        A key of AUDIO_FORMATS
+
+    Raises:
+        HTTPException: If the container is not supported
+    """
+    audio_format = (requested or DEFAULT_AUDIO_FORMAT).lower()
+    if audio_format not in AUDIO_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported audio format '{requested}'. Use one of: {', '.join(AUDIO_FORMATS)}"
+        )
+    return audio_format
+
+
+def build_audio_options(audio_format: str, quality: str) -> Dict[str, Any]:
+    """
+    Build yt-dlp options for an audio job
+
+    Native containers prefer a source stream whose codec already fits, so the
+    FFmpegExtractAudio step degrades to a remux (`-acodec copy`). Only when no
+    such stream exists does ffmpeg fall back to encoding.
+
+    Args:
+        audio_format: A key of AUDIO_FORMATS
+        quality: low, medium or high
+
+    Returns:
+        Dict with the yt-dlp 'format' selector, 'postprocessors', and the
+        output 'ext' and 'mime'
+    """
+    spec = AUDIO_FORMATS[audio_format]
+    limit = AUDIO_BITRATE_LIMITS.get(quality)
+    abr = f"[abr<={limit}]" if limit else ""
+
+    if spec["native"]:
+        # Matching codec within the bitrate cap, then matching codec at any
+        # bitrate, then anything (transcode fallback)
+        format_selector = f"{spec['stream']}{abr}/{spec['stream']}/ba{abr}/ba/best"
+        postprocessor = {
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': audio_format,
+        }
+    else:
+        format_selector = f"ba{abr}/best{abr}" if abr else "ba/best"
+        postprocessor = {
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': MP3_BITRATES.get(quality, "192"),
+        }
+
+    return {
+        "format": format_selector,
+        "postprocessors": [postprocessor],
+        "ext": spec["ext"],
+        "mime": spec["mime"],
+    }
@@ -1,14 +1,27 @@
+import os
+import json
 import time
+import hashlib
 import requests
 from typing import Optional, Dict, Any
 from fastapi import HTTPException
+from lib.http_client import upstream_get, upstream_request
+from lib.metrics import CACHE_EVENTS, TOKENINFO_SECONDS
+from lib.shared_state import SharedState
+
+# Upper bound on how long a successful tokeninfo lookup is reused
+TOKENINFO_CACHE_TTL = int(os.getenv("TOKENINFO_CACHE_TTL", "300"))
+# Tokens this close to expiry are rejected (and never served from cache)
+TOKEN_MIN_REMAINING_SECONDS = 60
 
 class TokenManager:
     """Handles OAuth token validation, refresh, and error handling"""
     
-    def __init__(self):
-        self.google_token_info_url = "https://oauth2.googleapis.com/tokeninfo"
-        self.youtube_api_url = "https://www.googleapis.com/youtube/v3"
+    def __init__(self, state: Optional[SharedState] = None):
+        # Shared across workers when backed by Redis, so a token is checked once per TTL
+        self.state = state
+        self.google_token_info_url = os.getenv("GOOGLE_TOKENINFO_URL", "https://oauth2.googleapis.com/tokeninfo")
+        self.youtube_api_url = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
     
     def validate_token(self, access_token: str) -> Dict[str, Any]:  # Removed async
         """
@@ -23,12 +36,21 @@ class TokenManager:
         Raises:
             HTTPException: If token is invalid or expired
         """
+        cache_key = f"tokeninfo:{hashlib.sha256(access_token.encode()).hexdigest()}"
+        cached = self._cached_token_info(cache_key)
+        if cached is not None:
+            return cached
+        
+        started = time.perf_counter()
         try:
-            response = requests.get(
+            response = upstream_get(
                 self.google_token_info_url,
                 params={"access_token": access_token},
                 timeout=10.0
             )
+            TOKENINFO_SECONDS.labels("valid" if response.status_code == 200 else "invalid").observe(
+                time.perf_counter() - started
+            )
             
             if response.status_code == 400:
                 # Token is invalid or expired
@@ -46,25 +68,49 @@ class TokenManager:
             
             # Check if token is expired
             expires_in = int(token_info.get('expires_in', 0))
-            if expires_in <= 60:  # Token expires in less than 1 minute
+            if expires_in <= TOKEN_MIN_REMAINING_SECONDS:  # Token expires in less than 1 minute
                 raise HTTPException(
                     status_code=401,
                     detail="Token will expire soon. Please re-authenticate."
                 )
             
+            if self.state is not None:
+                cache_ttl = min(TOKENINFO_CACHE_TTL, expires_in - TOKEN_MIN_REMAINING_SECONDS)
+                self.state.set(cache_key, json.dumps(dict(token_info, expires_at=time.time() + expires_in)), cache_ttl)
+            
             return token_info
             
         except requests.exceptions.Timeout:
+            TOKENINFO_SECONDS.labels("timeout").observe(time.perf_counter() - started)
             raise HTTPException(
                 status_code=408,
                 detail="Token validation timed out. Please try again."
             )
         except requests.exceptions.RequestException as e:
+            TOKENINFO_SECONDS.labels("error").observe(time.perf_counter() - started)
             raise HTTPException(
                 status_code=503,
                 detail=f"Network error during token validation: {str(e)}"
             )
     
+    def _cached_token_info(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Token info from a recent successful validation, with expires_in brought up to date"""
+        if self.state is None:
+            return None
+        cached = self.state.get(cache_key)
+        if cached is None:
+            CACHE_EVENTS.labels("tokeninfo", "miss").inc()
+            return None
+        
+        token_info = json.loads(cached)
+        expires_in = int(token_info.pop("expires_at") - time.time())
+        if expires_in <= TOKEN_MIN_REMAINING_SECONDS:
+            CACHE_EVENTS.labels("tokeninfo", "miss").inc()
+            return None
+        CACHE_EVENTS.labels("tokeninfo", "hit").inc()
+        token_info["expires_in"] = str(expires_in)
+        return token_info
+    
     # Google OAuth credential methods removed - not used in current implementation
 
 class APIErrorHandler:
@@ -126,7 +172,7 @@ class APIErrorHandler:
         
         for attempt in range(max_retries + 1):
             try:
-                response = requests.request(method, url, **kwargs)
+                response = upstream_request(method, url, **kwargs)
                 
                 # Handle rate limiting
                 if response.status_code == 429:
@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+from fastapi import HTTPException
+from lib.auth import APIErrorHandler
+from lib.http_client import upstream_get
+from lib.metrics import CACHE_EVENTS, CHANNEL_SYNC_CHANGES
+from lib.quota import QuotaPlan
+from lib.shared_state import SharedState
+
+# How long a channel's last-seen playlist state is kept between syncs
+CHANNEL_SYNC_STATE_TTL = int(os.getenv("CHANNEL_SYNC_STATE_TTL", str(30 * 24 * 3600)))
+# Token -> channel/uploads playlist lookups are reused for this long
+CHANNEL_LOOKUP_TTL = int(os.getenv("CHANNEL_LOOKUP_TTL", "3600"))
+# Most recent uploads tracked per channel
+CHANNEL_SYNC_MAX_ITEMS = int(os.getenv("CHANNEL_SYNC_MAX_ITEMS", "500"))
+# Privacy is re-checked on every sync for uploads published this recently...
+CHANNEL_SYNC_RECENT_DAYS = int(os.getenv("CHANNEL_SYNC_RECENT_DAYS", "7"))
+# ...and for everything else once its last check is older than this
+CHANNEL_SYNC_RECHECK_SECONDS = int(os.getenv("CHANNEL_SYNC_RECHECK_SECONDS", "86400"))
+
+# YouTube Data API page and id-list limit
+PAGE_SIZE = 50
+
+
+def video_summary(item: Dict[str, Any]) -> Dict[str, Any]:
+    """The /list_user_videos shape of a playlistItems entry"""
+    snippet = item["snippet"]
+    thumbnails = snippet.get("thumbnails", {})
+    thumbnail = thumbnails.get("high") or thumbnails.get("default") or {}
+    return {
+        "videoId": snippet["resourceId"]["videoId"],
+        "title": snippet.get("title", ""),
+        "description": snippet.get("description", ""),
+        "publishedAt": snippet.get("publishedAt"),
+        "thumbnail": thumbnail.get("url"),
+    }
+
+
+class ChannelSync:
+    """
+    Delta sync of a channel's uploads against its last-seen state
+
+    Per channel the state holds the uploads playlist's first-page ETag,
+    its total and, for the newest CHANNEL_SYNC_MAX_ITEMS uploads, the
+    video ID, publishedAt and privacy status. A delta sync:
+
+    - asks for the first playlist page with If-None-Match, so an
+      unchanged playlist costs one 304
+    - otherwise pages only until it reaches a known video, falling back
+      to a full listing when the playlist total shows something was
+      removed
+    - re-checks privacy only for new uploads, uploads from the last
+      CHANNEL_SYNC_RECENT_DAYS, and ones whose last check is older than
+      CHANNEL_SYNC_RECHECK_SECONDS
+
+    and reports additions, removals and privacy changes only.
+    """
+
+    def __init__(self, state: SharedState, api_url: str = None):
+        self.state = state
+        self.api_url = api_url or os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+        self.error_handler = APIErrorHandler()
+
+    def _get(self, path: str, token: str, params: Dict[str, Any], plan: Optional[QuotaPlan] = None,
+             etag: Optional[str] = None):
+        headers = {"Authorization": f"Bearer {token}"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = upstream_get(f"{self.api_url}/{path}", params=params, headers=headers, timeout=30)
+        if plan is not None:
+            # Conditional requests are charged even when they come back 304
+            plan.charge(path, params.get("part", ""), response)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=self.error_handler.get_user_friendly_error(response.status_code, response.text)
+            )
+        return response.json()
+
+    def channel(self, token: str, plan: Optional[QuotaPlan] = None) -> Dict[str, Any]:
+        """Channel info and uploads playlist for the token's account (cached per token)"""
+        cache_key = f"channel:{hashlib.sha256(token.encode()).hexdigest()}"
+        cached = self.state.get(cache_key)
+        if cached is not None:
+            CACHE_EVENTS.labels("channel", "hit").inc()
+            return json.loads(cached)
+        CACHE_EVENTS.labels("channel", "miss").inc()
+
+        data = self._get("channels", token, {"part": "contentDetails,snippet", "mine": "true"}, plan)
+        if not data.get("items"):
+            raise HTTPException(status_code=404, detail="No YouTube channel found for this account")
+        item = data["items"][0]
+        channel = {
+            "id": item["id"],
+            "title": item["snippet"]["title"],
+            "description": item["snippet"]["description"],
+            "publishedAt": item["snippet"]["publishedAt"],
+            "uploads": item["contentDetails"]["relatedPlaylists"]["uploads"],
+        }
+        self.state.set(cache_key, json.dumps(channel), CHANNEL_LOOKUP_TTL)
+        return channel
+
+    def _privacy(self, token: str, video_ids: List[str], plan: Optional[QuotaPlan]) -> Dict[str, str]:
+        """Privacy status per video; videos missing from the result no longer exist"""
+        privacy = {}
+        for start in range(0, len(video_ids), PAGE_SIZE):
+            chunk = video_ids[start:start + PAGE_SIZE]
+            data = self._get("videos", token, {"part": "status", "id": ",".join(chunk)}, plan)
+            for item in data.get("items", []):
+                privacy[item["id"]] = item.get("status", {}).get("privacyStatus", "unknown")
+        return privacy
+
+    def _list_uploads(self, token: str, uploads: str, previous: Optional[Dict[str, Any]],
+                      plan: Optional[QuotaPlan]) -> Dict[str, Any]:
+        """
+        List the uploads playlist, newest first, only as far as needed
+
+        Without previous state (or after a removal) the newest
+        CHANNEL_SYNC_MAX_ITEMS are listed and "relisted" is set; otherwise
+        listing stops at the first known video and "videos" holds only the
+        new ones. On an economy plan a removal doesn't trigger a relist; the
+        stored total is left short so a later sync still notices it.
+        """
+        params = {"part": "snippet", "playlistId": uploads, "maxResults": PAGE_SIZE}
+        page = self._get("playlistItems", token, params, plan, etag=previous["etag"] if previous else None)
+        if page is None:
+            # 304: nothing was added or removed since the last sync
+            CACHE_EVENTS.labels("channel_sync_etag", "hit").inc()
+            return {"etag": previous["etag"], "total": previous["total"], "videos": [], "relisted": False}
+        if previous:
+            CACHE_EVENTS.labels("channel_sync_etag", "miss").inc()
+
+        etag = page.get("etag")
+        total = page.get("pageInfo", {}).get("totalResults", 0)
+        known = {entry["videoId"] for entry in previous["items"]} if previous else set()
+        relist = previous is None
+        listed = []
+        while True:
+            listed += [video_summary(item) for item in page.get("items", [])]
+            if not relist:
+                first_known = next((i for i, video in enumerate(listed) if video["videoId"] in known), None)
+                if first_known is not None:
+                    if total == previous["total"] + first_known:
+                        return {"etag": etag, "total": total, "videos": listed[:first_known], "relisted": False}
+                    if plan is not None and plan.economy:
+                        return {"etag": etag, "total": previous["total"] + first_known,
+                                "videos": listed[:first_known], "relisted": False}
+                    # The totals don't add up, so something was removed: list the rest too
+                    relist = True
+            page_token = page.get("nextPageToken")
+            if not page_token or len(listed) >= CHANNEL_SYNC_MAX_ITEMS:
+                break
+            page = self._get("playlistItems", token, dict(params, pageToken=page_token), plan)
+
+        truncated = bool(page_token) or len(listed) > CHANNEL_SYNC_MAX_ITEMS
+        listed = listed[:CHANNEL_SYNC_MAX_ITEMS]
+        return {
+            "etag": etag,
+            "total": total,
+            "videos": listed,
+            "relisted": True,
+            # Known videos older than a truncated listing weren't seen, which doesn't mean they're gone
+            "oldest": listed[-1]["publishedAt"] if truncated and listed else None,
+        }
+
+    def sync(self, token: str, full: bool = False,
+             on_published: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]]], Any]] = None,
+             plan: Optional[QuotaPlan] = None) -> Dict[str, Any]:
+        """
+        Sync the token's channel and return what changed since the last sync
+
+        Args:
+            token: OAuth access token (already validated)
+            full: Ignore the stored state and list and check everything again
+            on_published: Called with the channel and the uploads that became
+                public (new public uploads and flips to public); its return
+                value is included as "enqueued". A dict with an "error" key
+                means the enqueue failed: those uploads are kept in the state
+                and offered again, while still public, on the next sync. Not
+                called on the first sync, which only records a baseline.
+            plan: Quota plan to charge calls to; an economy plan skips the
+                periodic privacy re-check of older uploads
+
+        Returns:
+            Channel info with additions, removals and privacyChanges
+
+        Raises:
+            HTTPException: When YouTube rejects a request
+        """
+        channel = self.channel(token, plan)
+        state_key = f"channel_sync:{channel['id']}"
+        stored = self.state.get(state_key)
+        previous = json.loads(stored) if stored else None
+        baseline = previous is None or previous.get("uploads") != channel["uploads"]
+        if baseline:
+            previous = None
+        known = {entry["videoId"]: entry for entry in previous["items"]} if previous else {}
+
+        listing = self._list_uploads(token, channel["uploads"], None if full else previous, plan)
+        additions = [video for video in listing["videos"] if video["videoId"] not in known]
+        removals = []
+        if listing["relisted"]:
+            listed_ids = {video["videoId"] for video in listing["videos"]}
+            oldest = listing.get("oldest")
+            removals = [
+                video_id for video_id, entry in known.items()
+                if video_id not in listed_ids and (oldest is None or (entry.get("publishedAt") or "") >= oldest)
+            ]
+            items = [
+                known.get(video["videoId"]) or {"videoId": video["videoId"], "publishedAt": video["publishedAt"]}
+                for video in listing["videos"]
+            ]
+        else:
+            items = [{"videoId": video["videoId"], "publishedAt": video["publishedAt"]} for video in additions]
+            items += previous["items"]
+        items = items[:CHANNEL_SYNC_MAX_ITEMS]
+
+        # Re-check privacy only where it's likely to have changed
+        now = time.time()
+        recheck_stale = plan is None or not plan.economy
+        recent = (datetime.now(timezone.utc) - timedelta(days=CHANNEL_SYNC_RECENT_DAYS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        to_check = [
+            entry for entry in items
+            if full or "privacy" not in entry
+            or (entry.get("publishedAt") or "") >= recent
+            or (recheck_stale and now - entry.get("checkedAt", 0) > CHANNEL_SYNC_RECHECK_SECONDS)
+        ]
+        privacy = self._privacy(token, [entry["videoId"] for entry in to_check], plan) if to_check else {}
+
+        privacy_changes = []
+        deleted = set()
+        for entry in to_check:
+            status = privacy.get(entry["videoId"])
+            if status is None:
+                # Listed but no longer returned by videos.list: deleted
+                deleted.add(entry["videoId"])
+                continue
+            if "privacy" in entry and entry["privacy"] != status:
+                privacy_changes.append({"videoId": entry["videoId"], "from": entry["privacy"], "to": status})
+            entry["privacy"] = status
+            entry["checkedAt"] = int(now)
+        if deleted:
+            removals += [video_id for video_id in deleted if video_id in known and video_id not in removals]
+            items = [entry for entry in items if entry["videoId"] not in deleted]
+            additions = [video for video in additions if video["videoId"] not in deleted]
+
+        status_by_id = {entry["videoId"]: entry["privacy"] for entry in items}
+        for video in additions:
+            video["privacyStatus"] = status_by_id.get(video["videoId"], "unknown")
+
+        # Uploads whose enqueue failed last time are offered again while still public
+        pending = [] if baseline else [
+            video for video in previous.get("pending", []) if status_by_id.get(video["videoId"]) == "public"
+        ]
+        enqueued = None
+        if on_published and not baseline:
+            flipped = {change["videoId"] for change in privacy_changes if change["to"] == "public"}
+            published = [video for video in additions if video["privacyStatus"] == "public"]
+            published += [{"videoId": video_id} for video_id in flipped]
+            new_ids = {video["videoId"] for video in published}
+            published = [video for video in pending if video["videoId"] not in new_ids] + published
+            pending = []
+            if published:
+                # Called before the state is saved, so if it raises the delta is seen again
+                enqueued = on_published(channel, published)
+                if isinstance(enqueued, dict) and "error" in enqueued:
+                    pending = published
+
+        state = {
+            "uploads": channel["uploads"],
+            "etag": listing["etag"],
+            "total": listing["total"],
+            "items": items,
+        }
+        if pending:
+            state["pending"] = pending
+        self.state.set(state_key, json.dumps(state, separators=(",", ":")), CHANNEL_SYNC_STATE_TTL)
+
+        CHANNEL_SYNC_CHANGES.labels("addition").inc(len(additions))
+        CHANNEL_SYNC_CHANGES.labels("removal").inc(len(removals))
+        CHANNEL_SYNC_CHANGES.labels("privacy").inc(len(privacy_changes))
+
+        return {
+            "channel": {key: channel[key] for key in ("id", "title", "description", "publishedAt")},
+            "baseline": baseline,
+            "additions": additions,
+            "removals": removals,
+            "privacyChanges": privacy_changes,
+            "trackedVideos": len(items),
+            "privacyChecked": len(to_check),
+            "economy": bool(plan and plan.economy),
+            "enqueued": enqueued,
+        }
@@ -0,0 +1,134 @@
+import os
+import gzip
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from lib.metrics import RESPONSE_COMPRESSION
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Favour speed: these are dynamic responses compressed on every request
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header
+
+    Honours q-values (q=0 refuses a coding, `*` covers unlisted ones) and
+    prefers brotli over gzip when the client weights them equally.
+
+    Returns:
+        "br", "gzip", or None to send the body as-is
+    """
+    weights = {}
+    for entry in accept_encoding.lower().split(","):
+        coding, _, params = entry.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip()] = q
+
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(content_type: str) -> bool:
+    mime = content_type.split(";", 1)[0].strip().lower()
+    return mime.startswith("text/") or mime.endswith("json") or mime.endswith("xml")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated gzip/brotli compression of API responses
+
+    Only complete (single-message) text, JSON and XML bodies of at least
+    COMPRESSION_MIN_BYTES are compressed. Streamed bodies, partial content
+    and anything already encoded pass through untouched, which keeps media
+    downloads and their byte ranges exact. Unlike Starlette's
+    GZipMiddleware it speaks brotli and respects q-values.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            # First body message: decide once for the whole response
+            passthrough = True
+            headers = MutableHeaders(raw=start["headers"])
+            eligible = (
+                start["status"] not in (204, 206, 304)
+                and "content-encoding" not in headers
+                and compressible(headers.get("content-type", ""))
+            )
+            if not eligible:
+                await send(start)
+                await send(message)
+                return
+
+            # The representation depends on Accept-Encoding even when this one is sent as-is
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if encoding is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                RESPONSE_COMPRESSION.labels("identity").inc()
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            RESPONSE_COMPRESSION.labels(encoding).inc()
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            # The compressed bytes differ from the identity body the ETag was computed over
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,280 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Dict, Mapping, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr, unescape
+from starlette.responses import Response
+from lib.job_store import now_ms
+from lib.media_response import guess_media_type, not_modified
+from lib.metrics import CACHE_EVENTS
+from lib.storage import DOWNLOAD_URL_TTL, download_expiry, download_query
+
+# Public base URL of main.py; episode enclosures point at its /download route
+FEED_MEDIA_BASE_URL = os.getenv("FEED_MEDIA_BASE_URL", "http://localhost:8000")
+# Newest episodes kept per feed
+FEED_MAX_EPISODES = int(os.getenv("FEED_MAX_EPISODES", "300"))
+# How long aggregators and CDNs may reuse a feed without revalidating
+FEED_MAX_AGE_SECONDS = int(os.getenv("FEED_MAX_AGE_SECONDS", "300"))
+# Rendered feeds kept in each API process
+FEED_LOCAL_CACHE_SIZE = int(os.getenv("FEED_LOCAL_CACHE_SIZE", "256"))
+FEED_TITLE = os.getenv("FEED_TITLE", "PodPay conversions for {user_id}")
+
+FEED_MEDIA_TYPE = "application/rss+xml; charset=utf-8"
+WATCH_URL = "https://www.youtube.com/watch?v={video_id}"
+# Stored items carry this in place of the /download query string; the
+# signature (which expires) is filled in when the document is served
+LINK_PLACEHOLDER = "?{download-query}"
+_PLACEHOLDER_LINK = re.compile(rb'/download/([^"?]+)' + re.escape(LINK_PLACEHOLDER.encode()))
+
+# Add or replace one rendered episode and splice it into the stored
+# document: a replaced or dropped item is cut out, the new one inserted
+# after its predecessor in publish order (newest first) and the channel
+# header swapped. Stored items are only read back to rebuild a document
+# that predates the stored header length, or one that doesn't match its
+# items. Runs as one script so readers always see a document that matches
+# its version.
+# KEYS: meta hash, episode hash (guid -> item XML), order zset, document
+# ARGV: guid, item XML, published ms, max episodes, document head, document tail, updated ms
+# Returns the new version
+ADD_EPISODE = """
+local unpack = unpack or table.unpack
+-- nil when the item isn't there: the document is out of step and gets rebuilt
+local function cut(body, item)
+    local first = string.find(body, item, 1, true)
+    return first and string.sub(body, 1, first - 1) .. string.sub(body, first + #item)
+end
+
+local document = redis.call('GET', KEYS[4])
+local head_len = tonumber(redis.call('HGET', KEYS[1], 'head_len'))
+local body = document and head_len and string.sub(document, head_len + 1)
+local replaced = redis.call('HGET', KEYS[2], ARGV[1])
+if body and replaced then
+    body = cut(body, replaced)
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+local excess = redis.call('ZCARD', KEYS[3]) - tonumber(ARGV[4])
+if excess > 0 then
+    local dropped = redis.call('ZRANGE', KEYS[3], 0, excess - 1)
+    if body then
+        for _, item in ipairs(redis.call('HMGET', KEYS[2], unpack(dropped))) do
+            if body and item and item ~= ARGV[2] then
+                body = cut(body, item)
+            end
+        end
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[3], 0, excess - 1)
+    redis.call('HDEL', KEYS[2], unpack(dropped))
+end
+
+local rank = redis.call('ZREVRANK', KEYS[3], ARGV[1])
+if body and rank then
+    local at = 1
+    if rank > 0 then
+        local previous = redis.call('HGET', KEYS[2], redis.call('ZREVRANGE', KEYS[3], rank - 1, rank - 1)[1])
+        local first = string.find(body, previous, 1, true)
+        at = first and first + #previous
+    end
+    body = at and string.sub(body, 1, at - 1) .. ARGV[2] .. string.sub(body, at)
+end
+if not body then
+    local guids = redis.call('ZREVRANGE', KEYS[3], 0, -1)
+    body = table.concat(redis.call('HMGET', KEYS[2], unpack(guids))) .. ARGV[6]
+end
+redis.call('SET', KEYS[4], ARGV[5] .. body)
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'updated', ARGV[7], 'head_len', #ARGV[5])
+return version
+"""
+
+
+def rfc822(ms: int) -> str:
+    return formatdate(ms / 1000, usegmt=True)
+
+
+def episode_guid(user_id: str, video_id: str) -> str:
+    """One episode per video in a user's feed, whatever quality or format it was converted to"""
+    return f"{user_id}:{video_id}"
+
+
+def render_item(guid: str, episode: Dict[str, Any]) -> str:
+    """RSS <item> for one episode"""
+    url = f"{FEED_MEDIA_BASE_URL.rstrip('/')}/download/{episode['artifact']}{LINK_PLACEHOLDER}"
+    parts = [
+        "<item>",
+        f"<title>{escape(episode['title'])}</title>",
+        f'<guid isPermaLink="false">{escape(guid)}</guid>',
+        f"<link>{escape(WATCH_URL.format(video_id=episode['video_id']))}</link>",
+        f"<pubDate>{rfc822(episode['published'])}</pubDate>",
+        f"<enclosure url={quoteattr(url)} length=\"{int(episode['size'])}\" "
+        f"type={quoteattr(guess_media_type(episode['artifact']))}/>",
+    ]
+    if episode.get("duration"):
+        parts.append(f"<itunes:duration>{round(episode['duration'])}</itunes:duration>")
+    parts.append("</item>")
+    return "".join(parts)
+
+
+def render_head(user_id: str, updated_ms: int) -> str:
+    title = escape(FEED_TITLE.format(user_id=user_id))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">'
+        f"<channel><title>{title}</title>"
+        f"<link>{escape(FEED_MEDIA_BASE_URL)}</link>"
+        f"<description>{title}</description>"
+        f"<lastBuildDate>{rfc822(updated_ms)}</lastBuildDate>"
+    )
+
+
+FEED_TAIL = "</channel></rss>"
+
+
+def sign_links(body: bytes, expires: int) -> bytes:
+    """Fill in the /download query strings of a stored document"""
+    def sign(match):
+        name = match.group(1)
+        query = download_query(unescape(name.decode()), expires)
+        return b"/download/" + name + (b"?" + escape(query).encode() if query else b"")
+    return _PLACEHOLDER_LINK.sub(sign, body)
+
+
+def links_window(updated: int, expires: int) -> int:
+    """
+    Effective modification time (ms) of a document whose links expire at
+    `expires`: its links are re-signed at the start of each expiry window
+    """
+    return max(updated, (expires - 2 * DOWNLOAD_URL_TTL) * 1000)
+
+
+class FeedStore:
+    """
+    Per-user podcast RSS feeds of completed conversions
+
+    Each feed is stored rendered. When a job completes only its <item> is
+    rendered and spliced into the stored document in Redis (replacing the
+    video's earlier episode and trimming the oldest past the cap), and the
+    version bumped. Serving a feed is one HMGET of the
+    version for conditional requests, plus one GET when this process
+    doesn't hold the current version yet.
+
+    Enclosure links are stored unsigned and signed per process when the
+    document is loaded, once per download link expiry window (see
+    lib.storage.download_expiry), so links in a long-lived feed never go
+    stale. The start of the window counts as a modification for the
+    feed's validators.
+    """
+
+    def __init__(self, redis, max_episodes: int = FEED_MAX_EPISODES):
+        self.redis = redis
+        self.max_episodes = max_episodes
+        self._documents: "OrderedDict[str, Tuple[int, int, int, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys(user_id: str) -> Tuple[str, str, str, str]:
+        base = f"feed:{user_id}"
+        return base, f"{base}:episodes", f"{base}:order", f"{base}:xml"
+
+    async def add_episode(self, user_id: str, episode: Dict[str, Any]) -> int:
+        """
+        Add a completed conversion to the user's feed
+
+        Re-converting a video, at any quality or format, replaces its
+        episode (the guid is the user and video) rather than adding a
+        second one.
+
+        Args:
+            user_id: Feed owner
+            episode: title, video_id, artifact ("<video_id>-<quality>.<ext>"),
+                size in bytes, duration in seconds (optional) and published ms
+
+        Returns:
+            The feed's new version
+        """
+        updated = now_ms()
+        guid = episode_guid(user_id, episode["video_id"])
+        return int(await self.redis.eval(
+            ADD_EPISODE, 4, *self.keys(user_id),
+            guid, render_item(guid, episode), episode["published"], self.max_episodes,
+            render_head(user_id, updated), FEED_TAIL, updated
+        ))
+
+    async def validators(self, user_id: str) -> Optional[Tuple[int, int]]:
+        """Current (version, updated ms) of a feed, None if it has no episodes"""
+        version, updated = await self.redis.hmget(self.keys(user_id)[0], ["version", "updated"])
+        if version is None:
+            return None
+        return int(version), int(updated)
+
+    async def document(self, user_id: str, version: int,
+                       expires: Optional[int] = None) -> Optional[Tuple[int, int, bytes]]:
+        """
+        (version, updated ms, XML) of a feed with its links signed until
+        `expires`, from this process's cache when it holds `version`, else
+        from Redis (which may be newer)
+        """
+        expires = download_expiry() if expires is None else expires
+        with self._lock:
+            cached = self._documents.get(user_id)
+            hit = cached is not None and cached[:2] == (version, expires)
+            if hit:
+                self._documents.move_to_end(user_id)
+        if hit:
+            CACHE_EVENTS.labels("feed", "hit").inc()
+            return cached[0], cached[2], cached[3]
+
+        CACHE_EVENTS.labels("feed", "miss").inc()
+        # The document and its validators are written together, so read them together
+        meta_key, _, _, document_key = self.keys(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hmget(meta_key, ["version", "updated"])
+            pipe.get(document_key)
+            (stored_version, updated), body = await pipe.execute()
+        if body is None:
+            return None
+        body = sign_links(body.encode() if isinstance(body, str) else body, expires)
+        cached = (int(stored_version), expires, int(updated), body)
+        with self._lock:
+            self._documents[user_id] = cached
+            self._documents.move_to_end(user_id)
+            while len(self._documents) > FEED_LOCAL_CACHE_SIZE:
+                self._documents.popitem(last=False)
+        return cached[0], cached[2], cached[3]
+
+    async def response(self, user_id: str, request_headers: Mapping[str, str]) -> Optional[Response]:
+        """
+        The feed as an HTTP response, honouring If-None-Match and If-Modified-Since
+
+        Returns:
+            200 with the document, 304 when the client's copy is current,
+            or None when the user has no feed
+        """
+        current = await self.validators(user_id)
+        if current is None:
+            return None
+        expires = download_expiry()
+        version, modified = current[0], links_window(current[1], expires)
+        if not_modified(request_headers, self.etag(version, modified), modified / 1000):
+            CACHE_EVENTS.labels("feed", "not_modified").inc()
+            return Response(status_code=304, headers=self.headers(version, modified))
+
+        document = await self.document(user_id, version, expires)
+        if document is None:
+            return None
+        version, updated, body = document
+        modified = links_window(updated, expires)
+        return Response(body, media_type=FEED_MEDIA_TYPE, headers=self.headers(version, modified))
+
+    @staticmethod
+    def etag(version: int, updated: int) -> str:
+        return f'"{version:x}-{updated:x}"'
+
+    def headers(self, version: int, updated: int) -> Dict[str, str]:
+        return {
+            "etag": self.etag(version, updated),
+            "last-modified": rfc822(updated),
+            "cache-control": f"public, max-age={FEED_MAX_AGE_SECONDS}",
+        }
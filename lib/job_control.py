@@ -0,0 +1,67 @@
+import os
+import asyncio
+import logging
+from typing import Optional
+from lib.job_store import JobStore, now_ms
+
+# How often a running job checks for cancellation (and preemption)
+JOB_CONTROL_POLL_SECONDS = float(os.getenv("JOB_CONTROL_POLL_SECONDS", "2"))
+# Let waiting priority jobs stop running backfill jobs, which are requeued
+PREEMPTION_ENABLED = os.getenv("PREEMPTION_ENABLED", "0") == "1"
+# ...once the next priority job has waited this long for a free worker
+PREEMPT_AFTER_SECONDS = float(os.getenv("PREEMPT_AFTER_SECONDS", "30"))
+
+
+class JobInterrupted(Exception):
+    """Raised inside a job that was cancelled or preempted"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Job {reason}")
+        self.reason = reason
+
+
+class JobControl:
+    """
+    Cooperative stop signal for one running job
+
+    `watch` runs next to the job and sets `reason` when the job is
+    cancelled or (if `preemptible`) preempted by a waiting priority job.
+    yt-dlp's progress and postprocessor hooks, and the job between its
+    stages, check it and unwind; nothing is killed from outside.
+    """
+
+    def __init__(self, job_id: str, preemptible: bool = False):
+        self.job_id = job_id
+        self.preemptible = preemptible
+        self.reason: Optional[str] = None
+
+    def stop(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+
+    def raise_if_stopped(self):
+        if self.reason is not None:
+            raise JobInterrupted(self.reason)
+
+    async def watch(self, job_store: JobStore, redis, priority_queue: str = "priority_queue"):
+        """Poll for cancellation and preemption until stopped or cancelled"""
+        while self.reason is None:
+            await asyncio.sleep(JOB_CONTROL_POLL_SECONDS)
+            try:
+                if await job_store.is_cancelled(self.job_id):
+                    self.stop("cancelled")
+                elif self.preemptible and await self._priority_job_waiting(job_store, redis, priority_queue):
+                    self.stop("preempted")
+            except Exception as e:
+                logging.getLogger(__name__).warning("Job control check failed: %s", e)
+
+    async def _priority_job_waiting(self, job_store: JobStore, redis, priority_queue: str) -> bool:
+        # The job the next BRPOP would take
+        waiting = await redis.lindex(priority_queue, -1)
+        if waiting is None:
+            return False
+        created_at, = await job_store.get_fields(waiting, "created_at")
+        if not created_at or now_ms() - created_at < PREEMPT_AFTER_SECONDS * 1000:
+            return False
+        # One backfill job makes way per waiting priority job
+        return bool(await redis.set(f"jobs:preempt:{waiting}", self.job_id, nx=True, ex=300))
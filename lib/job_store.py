@@ -0,0 +1,522 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Finished jobs are archived and removed this long after they finish
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+# Redis-side expiry backstop past the TTL, in case no janitor runs
+JOB_EXPIRY_GRACE_SECONDS = int(os.getenv("JOB_EXPIRY_GRACE_SECONDS", str(24 * 3600)))
+# JSON-lines file that expired jobs are appended to; empty disables archival
+JOB_ARCHIVE_PATH = os.getenv("JOB_ARCHIVE_PATH", "")
+JOB_LIST_MAX_LIMIT = 100
+# How long a client-supplied Idempotency-Key maps to its job
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Keys derived from the request itself only absorb retries, not deliberate re-conversions
+DERIVED_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("DERIVED_IDEMPOTENCY_TTL_SECONDS", "900"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+TERMINAL_STATES = ("completed", "failed", "cancelled")
+# States a job can be cancelled from
+CANCELLABLE_STATES = ("queued", "processing")
+
+# Cancelled job ids scored by cancellation time. Queued jobs are skipped when
+# a worker dequeues them; running jobs are stopped by the worker's watcher.
+TOMBSTONES_KEY = "jobs:tombstones"
+
+# Long field name -> short hash field
+FIELDS = {
+    "video_id": "v",
+    "content_type": "t",
+    "quality": "q",
+    "audio_format": "f",
+    "user_id": "u",
+    "priority": "p",
+    "status": "s",
+    "progress": "g",
+    "created_at": "c",
+    "updated_at": "m",
+    "artifact_key": "k",
+    "error": "e",
+    "request_id": "r",
+    "traceparent": "tp",
+    "tracestate": "ts",
+    "title": "n",
+}
+SHORT_FIELDS = {short: name for name, short in FIELDS.items()}
+
+# Enum fields are stored as their index; append only, never reorder
+ENUMS = {
+    "status": ["queued", "processing", "completed", "failed", "cancelled"],
+    "content_type": ["audio", "video"],
+    "quality": ["low", "medium", "high"],
+    "audio_format": ["m4a", "opus", "mp3"],
+}
+INT_FIELDS = ("priority", "progress", "created_at", "updated_at")
+
+# Create a job unless its idempotency key already maps to a live one. Runs as
+# one script so a concurrent retry can't see the key before the job exists.
+# KEYS: idempotency key, job hash, state index, user index ('' for none)
+# ARGV: job id, key TTL, failed status code, cancelled status code, created ms,
+#       hash field/value pairs...
+CREATE_IF_ABSENT = """
+local unpack = unpack or table.unpack
+local existing = redis.call('GET', KEYS[1])
+if existing then
+    local status = redis.call('HGET', 'job:' .. existing, 's')
+    if status and status ~= ARGV[3] and status ~= ARGV[4] then
+        return existing
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('HSET', KEYS[2], unpack(ARGV, 6))
+redis.call('ZADD', KEYS[3], ARGV[5], ARGV[1])
+if KEYS[4] ~= '' then
+    redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+end
+return false
+"""
+
+# Cancel jobs that are still queued or processing, leaving a tombstone for
+# the workers. Runs as one script so a job finishing concurrently is never
+# marked cancelled.
+# KEYS: queued state index, processing state index, cancelled state index, tombstones
+# ARGV: updated ms, expiry seconds, queued code, processing code, cancelled code, job ids...
+# Returns each job's status code before the call ('' if it doesn't exist)
+CANCEL_JOBS = """
+local previous = {}
+for i = 6, #ARGV do
+    local id = ARGV[i]
+    local key = 'job:' .. id
+    local status = redis.call('HGET', key, 's')
+    previous[#previous + 1] = status or ''
+    if status == ARGV[3] or status == ARGV[4] then
+        redis.call('HSET', key, 's', ARGV[5], 'm', ARGV[1])
+        redis.call('EXPIRE', key, ARGV[2])
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('ZADD', KEYS[3], ARGV[1], id)
+        redis.call('ZADD', KEYS[4], ARGV[1], id)
+    end
+end
+return previous
+"""
+
+# Hand a processing job back to a queue, unless its status changed meanwhile
+# or it has a tombstone (a cancel the worker's own "processing" transition
+# overwrote). Runs as one script so a concurrent cancel is never replaced
+# by "queued".
+# KEYS: job hash, processing state index, queued state index, queue list, tombstones
+# ARGV: job id, processing code, queued code, updated ms, LPUSH or RPUSH
+# Returns 1 if requeued, 0 if not
+REQUEUE_IF_PROCESSING = """
+if redis.call('HGET', KEYS[1], 's') ~= ARGV[2] or redis.call('ZSCORE', KEYS[5], ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 's', ARGV[3], 'm', ARGV[4], 'g', '0')
+redis.call('PERSIST', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+redis.call(ARGV[5], KEYS[4], ARGV[1])
+return 1
+"""
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def format_timestamp(ms: Optional[int]) -> Optional[str]:
+    """Render a stored millisecond timestamp as ISO 8601 UTC"""
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def idempotency_key(user_id: Optional[str], video_id: str, content_type: str, quality: Optional[str],
+                    audio_format: Optional[str], client_key: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Redis key and TTL deduplicating a job submission
+
+    Args:
+        user_id: Submitting user, scopes client keys so users can't collide
+        video_id: YouTube video ID
+        content_type: 'audio' or 'video'
+        quality: Requested quality
+        audio_format: Resolved audio format ('' for video)
+        client_key: Idempotency-Key header value, if the client sent one
+
+    Returns:
+        (key, ttl_seconds)
+    """
+    if client_key:
+        parts, ttl = (user_id or "", client_key, video_id, content_type), IDEMPOTENCY_TTL_SECONDS
+    else:
+        parts, ttl = (user_id or "", video_id, content_type, quality or "", audio_format or ""), DERIVED_IDEMPOTENCY_TTL_SECONDS
+    digest = hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+    return f"idem:{digest}", ttl
+
+
+def encode_job(fields: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Encode job fields into the compact hash representation
+
+    Empty values are dropped, enum values become their index and
+    timestamps are integer milliseconds. Values outside an enum are
+    stored as-is so nothing is lost.
+
+    Args:
+        fields: Job fields keyed by their long names
+
+    Returns:
+        Mapping of short field names to string values
+    """
+    encoded = {}
+    for name, value in fields.items():
+        if name not in FIELDS or value is None or value == "":
+            continue
+        if name in ENUMS and value in ENUMS[name]:
+            value = ENUMS[name].index(value)
+        encoded[FIELDS[name]] = str(value)
+    return encoded
+
+
+def decode_job(job_id: str, raw: Dict[str, str]) -> Dict[str, Any]:
+    """Inverse of encode_job; missing fields are omitted"""
+    if "status" in raw:
+        # Hash written before the compact encoding
+        job = dict(raw)
+        job["job_id"] = job_id
+        return job
+
+    job = {"job_id": job_id}
+    for short, value in raw.items():
+        name = SHORT_FIELDS.get(short)
+        if name is None:
+            continue
+        if name in ENUMS and value.isdigit() and int(value) < len(ENUMS[name]):
+            value = ENUMS[name][int(value)]
+        elif name in INT_FIELDS:
+            value = int(value)
+        job[name] = value
+    job.setdefault("progress", 0)
+    return job
+
+
+class JobStore:
+    """
+    Conversion job state in Redis
+
+    Each job is a compact hash under `job:{id}` (see encode_job). Two kinds
+    of sorted-set index are maintained alongside it:
+
+      jobs:user:{user_id}   job ids scored by creation time
+      jobs:state:{status}   job ids scored by time of the last transition
+
+    The user index backs paginated listings; the state index lets the
+    janitor find finished jobs past their TTL without scanning keys.
+    """
+
+    def __init__(self, redis, ttl_seconds: int = JOB_TTL_SECONDS, archive_path: str = JOB_ARCHIVE_PATH):
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+        self.archive_path = archive_path
+
+    @staticmethod
+    def job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def user_index(user_id: str) -> str:
+        return f"jobs:user:{user_id}"
+
+    @staticmethod
+    def state_index(status: str) -> str:
+        return f"jobs:state:{status}"
+
+    async def create(self, job_id: str, fields: Dict[str, Any],
+                     idempotency: Optional[Tuple[str, int]] = None) -> Optional[str]:
+        """
+        Store a new queued job and add it to the indexes
+
+        With an idempotency key, the job is only created if the key is
+        unclaimed or belongs to a job that has failed or expired, so a
+        retried submission resolves to the original job.
+
+        Args:
+            job_id: New job id
+            fields: Job fields keyed by their long names
+            idempotency: (key, ttl_seconds) from idempotency_key()
+
+        Returns:
+            None if the job was created, otherwise the id of the live job
+            already holding the idempotency key
+        """
+        created = now_ms()
+        fields = dict(fields, status=fields.get("status", "queued"), created_at=created, updated_at=created)
+        encoded = encode_job(fields)
+        user_index = self.user_index(fields["user_id"]) if fields.get("user_id") else ""
+
+        if idempotency:
+            key, ttl_seconds = idempotency
+            pairs = [item for pair in encoded.items() for item in pair]
+            return await self.redis.eval(
+                CREATE_IF_ABSENT, 4, key, self.job_key(job_id), self.state_index(fields["status"]), user_index,
+                job_id, ttl_seconds, ENUMS["status"].index("failed"), ENUMS["status"].index("cancelled"),
+                created, *pairs
+            )
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.job_key(job_id), mapping=encoded)
+            pipe.zadd(self.state_index(fields["status"]), {job_id: created})
+            if user_index:
+                pipe.zadd(user_index, {job_id: created})
+            await pipe.execute()
+        return None
+
+    async def live_job_for(self, key: str) -> Optional[str]:
+        """Id of the live (not failed, cancelled or expired) job holding an idempotency key"""
+        job_id = await self.redis.get(key)
+        if job_id is None:
+            return None
+        status = await self.redis.hget(self.job_key(job_id), FIELDS["status"])
+        if status is None or status in {str(ENUMS["status"].index(state)) for state in ("failed", "cancelled")}:
+            return None
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis.hgetall(self.job_key(job_id))
+        return decode_job(job_id, raw) if raw else None
+
+    async def get_fields(self, job_id: str, *names: str) -> List[Any]:
+        """Fetch selected fields (long names) without reading the whole hash"""
+        raw = await self.redis.hmget(self.job_key(job_id), [FIELDS[name] for name in names])
+        decoded = decode_job(job_id, {FIELDS[name]: value for name, value in zip(names, raw) if value is not None})
+        return [decoded.get(name) for name in names]
+
+    async def set_progress(self, job_id: str, progress: int):
+        await self.redis.hset(self.job_key(job_id), FIELDS["progress"], str(progress))
+
+    async def transition(self, job_id: str, status: str, **fields):
+        """
+        Move a job to a new status, updating the state index atomically
+
+        Terminal states also get a Redis expiry as a backstop; normally the
+        janitor archives and removes the job first.
+
+        Args:
+            job_id: Job to update
+            status: New status
+            **fields: Other fields to set alongside the status
+        """
+        updated = now_ms()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.job_key(job_id), mapping=encode_job(dict(fields, status=status, updated_at=updated)))
+            for state in ENUMS["status"]:
+                if state != status:
+                    pipe.zrem(self.state_index(state), job_id)
+            pipe.zadd(self.state_index(status), {job_id: updated})
+            if status in TERMINAL_STATES:
+                pipe.expire(self.job_key(job_id), self.ttl_seconds + JOB_EXPIRY_GRACE_SECONDS)
+            else:
+                pipe.persist(self.job_key(job_id))
+            await pipe.execute()
+
+    async def requeue(self, job_id: str, queue: str, front: bool = False) -> bool:
+        """
+        Move a processing job back to queued and push it onto `queue`
+
+        Args:
+            job_id: Job to hand back
+            queue: Queue list to push it onto
+            front: Push to the consuming end (RPUSH), so it runs next
+
+        Returns:
+            False if the job was no longer processing or was cancelled
+            meanwhile, in which case nothing was changed
+        """
+        codes = [str(ENUMS["status"].index(state)) for state in ("processing", "queued")]
+        return bool(await self.redis.eval(
+            REQUEUE_IF_PROCESSING, 5,
+            self.job_key(job_id), self.state_index("processing"), self.state_index("queued"), queue, TOMBSTONES_KEY,
+            job_id, *codes, now_ms(), "RPUSH" if front else "LPUSH"
+        ))
+
+    async def cancel(self, job_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Cancel queued or processing jobs
+
+        Cancelled jobs get a tombstone: a queued job is skipped when a
+        worker dequeues it, a running one is stopped by its worker.
+
+        Args:
+            job_ids: Jobs to cancel
+
+        Returns:
+            Each job's status before the call (None if it doesn't exist);
+            jobs that were queued or processing are now cancelled
+        """
+        if not job_ids:
+            return {}
+        codes = [str(ENUMS["status"].index(state)) for state in (*CANCELLABLE_STATES, "cancelled")]
+        previous = await self.redis.eval(
+            CANCEL_JOBS, 4, *(self.state_index(state) for state in (*CANCELLABLE_STATES, "cancelled")), TOMBSTONES_KEY,
+            now_ms(), self.ttl_seconds + JOB_EXPIRY_GRACE_SECONDS, *codes, *job_ids
+        )
+        return {
+            job_id: decode_job(job_id, {FIELDS["status"]: code}).get("status") if code else None
+            for job_id, code in zip(job_ids, previous)
+        }
+
+    async def live_user_jobs(self, user_id: str, batch_size: int = 500) -> List[str]:
+        """Ids of a user's jobs that are still queued or processing"""
+        index = self.user_index(user_id)
+        live_codes = {str(ENUMS["status"].index(state)) for state in CANCELLABLE_STATES}
+        live, start = [], 0
+        while True:
+            job_ids = await self.redis.zrange(index, start, start + batch_size - 1)
+            if not job_ids:
+                return live
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for job_id in job_ids:
+                    pipe.hget(self.job_key(job_id), FIELDS["status"])
+                statuses = await pipe.execute()
+            live += [job_id for job_id, code in zip(job_ids, statuses) if code in live_codes]
+            start += batch_size
+
+    async def is_cancelled(self, job_id: str) -> bool:
+        return await self.redis.zscore(TOMBSTONES_KEY, job_id) is not None
+
+    async def consume_tombstone(self, job_id: str) -> bool:
+        """Remove a job's tombstone; True if it had one (the job was cancelled)"""
+        return bool(await self.redis.zrem(TOMBSTONES_KEY, job_id))
+
+    async def list_user_jobs(self, user_id: str, limit: int = 20,
+                             cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a user's jobs, newest first
+
+        The cursor is "<score>:<job_id>" of the last job on the previous
+        page. Paging resumes from that job's rank, falling back to its
+        score if the job has since expired, so each page costs
+        O(log n + limit).
+
+        Args:
+            user_id: Owner of the jobs
+            limit: Page size, capped at JOB_LIST_MAX_LIMIT
+            cursor: next_cursor from the previous page
+
+        Returns:
+            (jobs, next_cursor); next_cursor is None on the last page
+
+        Raises:
+            ValueError: If the cursor isn't one this method returned
+        """
+        limit = max(1, min(limit, JOB_LIST_MAX_LIMIT))
+        index = self.user_index(user_id)
+
+        if cursor:
+            raw_score, _, last_id = cursor.partition(":")
+            try:
+                score = int(raw_score)
+            except ValueError:
+                score = None
+            if score is None or not last_id:
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+            rank = await self.redis.zrevrank(index, last_id)
+            if rank is not None:
+                entries = await self.redis.zrevrange(index, rank + 1, rank + limit, withscores=True)
+            else:
+                entries = await self.redis.zrevrangebyscore(
+                    index, f"({score}", "-inf", start=0, num=limit, withscores=True
+                )
+        else:
+            entries = await self.redis.zrevrange(index, 0, limit - 1, withscores=True)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for job_id, _ in entries:
+                pipe.hgetall(self.job_key(job_id))
+            hashes = await pipe.execute()
+
+        jobs, missing = [], []
+        for (job_id, _), raw in zip(entries, hashes):
+            if raw:
+                jobs.append(decode_job(job_id, raw))
+            else:
+                missing.append(job_id)
+        if missing:
+            # Expired by the Redis backstop rather than the janitor
+            await self.redis.zrem(index, *missing)
+
+        next_cursor = None
+        if len(entries) == limit:
+            last_id, last_score = entries[-1]
+            next_cursor = f"{int(last_score)}:{last_id}"
+        return jobs, next_cursor
+
+    async def count_by_state(self) -> Dict[str, int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for state in ENUMS["status"]:
+                pipe.zcard(self.state_index(state))
+            counts = await pipe.execute()
+        return dict(zip(ENUMS["status"], counts))
+
+    async def expire_finished(self, batch_size: int = 500) -> int:
+        """
+        Archive and delete finished jobs older than the TTL
+
+        Args:
+            batch_size: Jobs handled per round trip
+
+        Returns:
+            Number of jobs removed
+        """
+        cutoff = now_ms() - self.ttl_seconds * 1000
+        removed = 0
+        for state in TERMINAL_STATES:
+            index = self.state_index(state)
+            while True:
+                job_ids = await self.redis.zrangebyscore(index, "-inf", cutoff, start=0, num=batch_size)
+                if not job_ids:
+                    break
+
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for job_id in job_ids:
+                        pipe.hgetall(self.job_key(job_id))
+                    hashes = await pipe.execute()
+                jobs = [decode_job(job_id, raw) for job_id, raw in zip(job_ids, hashes) if raw]
+
+                if self.archive_path and jobs:
+                    await asyncio.get_event_loop().run_in_executor(None, self._archive, jobs)
+
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    for job in jobs:
+                        pipe.delete(self.job_key(job["job_id"]))
+                        if job.get("user_id"):
+                            pipe.zrem(self.user_index(job["user_id"]), job["job_id"])
+                    pipe.zrem(index, *job_ids)
+                    await pipe.execute()
+
+                removed += len(job_ids)
+                if len(job_ids) < batch_size:
+                    break
+
+        # Tombstones of jobs no worker ever dequeued (e.g. the queue was flushed)
+        await self.redis.zremrangebyscore(TOMBSTONES_KEY, "-inf", cutoff)
+
+        if removed:
+            logging.getLogger(__name__).info("Expired %d finished jobs", removed)
+        return removed
+
+    def _archive(self, jobs: List[Dict[str, Any]]):
+        with open(self.archive_path, "a") as f:
+            for job in jobs:
+                record = dict(job)
+                for name in ("created_at", "updated_at"):
+                    if isinstance(record.get(name), int):
+                        record[name] = format_timestamp(record[name])
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
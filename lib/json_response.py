@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, List, Optional
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from lib.metrics import CACHE_EVENTS
+
+# Encoded list items kept per process for reuse across responses
+JSON_FRAGMENT_CACHE_SIZE = int(os.getenv("JSON_FRAGMENT_CACHE_SIZE", "20000"))
+
+
+def _default(obj: Any) -> Any:
+    """orjson fallback for the types FastAPI's encoder would otherwise handle"""
+    if isinstance(obj, BaseModel):
+        # pydantic isn't pinned and FastAPI still runs on v1, which lacks model_dump
+        return obj.model_dump() if hasattr(obj, "model_dump") else obj.dict()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson
+
+    Endpoints that return one of these directly skip FastAPI's
+    jsonable_encoder pass as well as the stdlib encoder. Content may embed
+    orjson.Fragment values (see FragmentCache), which are written out
+    as-is.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class FragmentCache:
+    """
+    Bounded LRU of pre-encoded JSON values
+
+    List endpoints encode each item once per version and splice the cached
+    bytes into later responses, so identical or overlapping listings only
+    pay for the items that changed. The key must change whenever the
+    encoded value would (e.g. the upstream ETag of the item).
+    """
+
+    def __init__(self, name: str, max_items: int = JSON_FRAGMENT_CACHE_SIZE):
+        self.name = name
+        self.max_items = max_items
+        self._items: "OrderedDict[Hashable, orjson.Fragment]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fragments(self, values: Iterable[Any], key: Callable[[Any], Optional[Hashable]],
+                  build: Callable[[Any], Any]) -> List[orjson.Fragment]:
+        """
+        Encoded form of each value, encoding only the ones not cached
+
+        Args:
+            values: Source items, e.g. upstream API items
+            key: Version key of an item; None encodes it without caching
+            build: Turns an item into the value to encode
+
+        Returns:
+            orjson.Fragment per item, to place in a FastJSONResponse's content
+        """
+        encoded, hits, misses = [], 0, 0
+        with self._lock:
+            for value in values:
+                version = key(value)
+                fragment = self._items.get(version) if version is not None else None
+                if fragment is not None:
+                    hits += 1
+                    self._items.move_to_end(version)
+                else:
+                    fragment = orjson.Fragment(dumps(build(value)))
+                    if version is not None:
+                        misses += 1
+                        self._items[version] = fragment
+                encoded.append(fragment)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        # One metric update per response; per-item updates cost more than the encoding saved
+        if misses:
+            CACHE_EVENTS.labels(self.name, "miss").inc(misses)
+        if hits:
+            CACHE_EVENTS.labels(self.name, "hit").inc(hits)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
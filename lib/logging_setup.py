@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from starlette.requests import Request
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+
+# Fraction of records kept per level, e.g. LOG_SAMPLE_DEBUG=0.01
+LOG_SAMPLE_RATES = {
+    logging.DEBUG: float(os.getenv("LOG_SAMPLE_DEBUG", "0.05")),
+    logging.INFO: float(os.getenv("LOG_SAMPLE_INFO", "1.0")),
+    logging.WARNING: float(os.getenv("LOG_SAMPLE_WARNING", "1.0")),
+}
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Keys whose values never reach the log output
+SENSITIVE_KEYS = {"x-rapidapi-key", "api_key", "authorization", "access_token", "token", "rapidapi_key"}
+SENSITIVE_PATTERN = re.compile(
+    r"((?:x-rapidapi-key|api_key|access_token|authorization|bearer)[\"']?\s*[:=]?\s*[\"']?(?:bearer\s+)?)[^\s\"',&}]+",
+    re.IGNORECASE
+)
+REDACTED = "[REDACTED]"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener = None
+
+
+def truncate(value: str, limit: int = LOG_MAX_FIELD_CHARS) -> str:
+    """Cap a string at `limit` characters, noting how much was dropped"""
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}...[{len(value) - limit} more chars]"
+
+
+def redact(value: Any) -> Any:
+    """Recursively mask credentials in dicts, lists and strings, truncating long strings"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in SENSITIVE_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value[:50]]
+    if isinstance(value, str):
+        return truncate(SENSITIVE_PATTERN.sub(lambda m: m.group(1) + REDACTED, value))
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with request correlation and redacted fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry["exc"] = truncate(self.formatException(record.exc_info), LOG_MAX_FIELD_CHARS * 4)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a per-level fraction of records; ERROR and above are always kept"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = LOG_SAMPLE_RATES.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request ID on the calling thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handoff to the listener thread
+
+    Records are enqueued unformatted (formatting, redaction and the write all
+    happen on the listener thread) and dropped rather than blocking when the
+    queue is full.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """
+    Route the root logger through a sampled, queue-backed JSON handler
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RequestContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_stop_listener)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork():
+    """
+    Give a forked child (pre-forked server worker) its own queue and listener
+
+    The parent's listener thread doesn't exist in the child, and its queue's
+    locks may have been held mid-operation at fork time.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=False)
+    _listener.start()
+
+
+async def request_id_middleware(request: Request, call_next):
+    """Adopt or mint a request ID, expose it to log records and echo it back"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
@@ -0,0 +1,262 @@
+import os
+import uuid
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# mimetypes knows mp4 but not the audio containers the worker produces
+MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".opus": "audio/ogg",
+    ".mp4": "video/mp4",
+}
+
+CHUNK_SIZE = 256 * 1024
+
+# More ranges than this is not a media player, serve the whole file instead
+MAX_RANGES = 16
+
+
+def guess_media_type(filename: str) -> str:
+    """MIME type for a converted artifact"""
+    ext = os.path.splitext(filename)[1].lower()
+    return MEDIA_TYPES.get(ext) or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    candidates = [value.strip() for value in header.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified(request_headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    """Whether a conditional GET can be answered with 304 (If-None-Match wins over If-Modified-Since)"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range: bytes=...` header into inclusive (start, end) pairs
+
+    Args:
+        header: Raw Range header value
+        size: Length of the representation
+
+    Returns:
+        Sorted, coalesced ranges; an empty list if none are satisfiable;
+        None if the header is malformed and must be ignored (RFC 7233 3.1)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                # Suffix range: the final N bytes
+                length = int(last)
+                if length == 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+class MediaFileResponse(Response):
+    """
+    File response for podcast/media clients
+
+    Adds what starlette's FileResponse lacks: single and multi-range
+    requests (206 / multipart/byteranges / 416), strong ETags with
+    If-None-Match, If-Modified-Since and If-Range. Artifacts are replaced
+    atomically, so size + mtime + inode is a strong validator.
+
+    The file is opened (and its validators taken from that descriptor) on
+    construction, so a concurrent eviction can neither fail the send after
+    the headers went out nor make the body disagree with them. Body bytes
+    are read with pread in a thread, CHUNK_SIZE at a time.
+
+    Raises:
+        FileNotFoundError: From the constructor, if the file is gone
+    """
+
+    media_type = None
+
+    def __init__(
+        self,
+        path: str,
+        request_headers: Mapping[str, str],
+        method: str = "GET",
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None,
+        max_age: int = 86400,
+    ):
+        self.path = path
+        self.background = None
+        self.send_body = method != "HEAD"
+        self.ranges: List[Tuple[int, int]] = []
+        self.boundary = None
+
+        self._fd: Optional[int] = os.open(path, os.O_RDONLY)
+        try:
+            stat_result = os.fstat(self._fd)
+        except OSError:
+            self._close()
+            raise
+        self.size = stat_result.st_size
+        self.content_type = media_type or guess_media_type(filename or path)
+        etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_ino:x}"'
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "cache-control": f"public, max-age={max_age}",
+        }
+        if filename:
+            headers["content-disposition"] = f'inline; filename="{filename}"'
+
+        if not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            self.send_body = False
+            self.init_headers(headers)
+            self._close()
+            return
+
+        range_header = request_headers.get("range")
+        ranges = None
+        if range_header and self._if_range_matches(request_headers.get("if-range"), etag, stat_result.st_mtime):
+            ranges = parse_range_header(range_header, self.size)
+
+        if ranges is None:
+            self.status_code = 200
+            self.ranges = [(0, self.size - 1)] if self.size else []
+            headers["content-type"] = self.content_type
+            headers["content-length"] = str(self.size)
+        elif not ranges:
+            self.status_code = 416
+            self.send_body = False
+            headers["content-range"] = f"bytes */{self.size}"
+            headers["content-length"] = "0"
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.ranges = ranges
+            headers["content-type"] = self.content_type
+            headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            headers["content-length"] = str(end - start + 1)
+        else:
+            self.status_code = 206
+            self.ranges = ranges
+            self.boundary = uuid.uuid4().hex
+            headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            headers["content-length"] = str(self._multipart_length())
+
+        self.init_headers(headers)
+        if not self.send_body or not self.ranges:
+            self._close()
+
+    def _close(self):
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self):
+        # Responses built but never sent
+        self._close()
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, mtime: float) -> bool:
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"'):
+            # If-Range requires strong comparison
+            return if_range == etag
+        if if_range.startswith("W/"):
+            return False
+        try:
+            return int(mtime) == int(parsedate_to_datetime(if_range).timestamp())
+        except (TypeError, ValueError):
+            return False
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+        ).encode("latin-1")
+
+    def _multipart_length(self) -> int:
+        length = 0
+        for start, end in self.ranges:
+            length += len(self._part_header(start, end)) + (end - start + 1) + 2
+        return length + len(f"--{self.boundary}--\r\n")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body or not self.ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        fd = self._fd
+        try:
+            for start, end in self.ranges:
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": self._part_header(start, end), "more_body": True})
+                offset = start
+                while offset <= end:
+                    chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, end - offset + 1), offset)
+                    if not chunk:
+                        # Truncated in place: abort rather than send fewer bytes than announced
+                        raise RuntimeError(f"{self.path} shrank while being sent")
+                    offset += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+            closing = f"--{self.boundary}--\r\n".encode("latin-1") if self.boundary else b""
+            await send({"type": "http.response.body", "body": closing, "more_body": False})
+        finally:
+            self._close()
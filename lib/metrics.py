@@ -0,0 +1,153 @@
+import os
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from opentelemetry.trace import SpanKind
+from starlette.requests import Request
+from starlette.responses import Response
+from lib.tracing import tracer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+THROUGHPUT_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(-4, 9))  # 64 KiB/s .. 256 MiB/s
+
+# HTTP layer (both services)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Inbound HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+
+RESPONSE_COMPRESSION = Counter(
+    "http_response_compression_total", "Compressible responses by content coding sent", ["encoding"]
+)
+
+# Outbound calls from main.py
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Outbound HTTP latency by upstream host and status",
+    ["host", "status"], buckets=LATENCY_BUCKETS
+)
+TOKENINFO_SECONDS = Histogram(
+    "tokeninfo_request_duration_seconds", "Google tokeninfo validation latency",
+    ["outcome"], buckets=LATENCY_BUCKETS
+)
+
+# Conversion pipeline
+QUEUE_WAIT_SECONDS = Histogram(
+    "conversion_queue_wait_seconds", "Time from enqueue to a worker picking the job up",
+    ["queue"], buckets=STAGE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "conversion_stage_duration_seconds", "Per-stage job duration (download, transcode, upload)",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_BYTES_PER_SECOND = Histogram(
+    "conversion_stage_bytes_per_second", "Per-stage transfer rate",
+    ["stage"], buckets=THROUGHPUT_BUCKETS
+)
+JOBS_TOTAL = Counter("conversion_jobs_total", "Finished conversion jobs by outcome", ["outcome"])
+ACTIVE_JOBS = Gauge("conversion_active_jobs", "Jobs currently running in this worker", multiprocess_mode="livesum")
+ADMISSION_DECISIONS = Counter(
+    "conversion_admission_decisions_total", "Submissions admitted or refused by admission control", ["outcome"]
+)
+CHANNEL_SYNC_CHANGES = Counter(
+    "channel_sync_changes_total", "Changes found by channel delta syncs", ["kind"]
+)
+YOUTUBE_QUOTA_UNITS = Counter("youtube_quota_units_total", "YouTube Data API units spent by method", ["method"])
+YOUTUBE_QUOTA_REMAINING = Gauge(
+    "youtube_quota_remaining_units", "YouTube Data API units left today (global ledger)", multiprocess_mode="mostrecent"
+)
+YOUTUBE_QUOTA_DECISIONS = Counter(
+    "youtube_quota_decisions_total", "Quota planner decisions by request class and outcome", ["priority", "outcome"]
+)
+
+# Shared infrastructure
+REDIS_COMMANDS = Counter("redis_commands_total", "Redis round trips by command", ["command"])
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds", "Redis round-trip latency", ["command"], buckets=LATENCY_BUCKETS
+)
+CACHE_EVENTS = Counter("cache_events_total", "Cache lookups by cache and result", ["cache", "result"])
+ERRORS = Counter("errors_total", "Errors by component and kind", ["component", "kind"])
+
+
+def metrics_response() -> Response:
+    """Render metrics, aggregating across processes when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def http_metrics_middleware(request: Request, call_next):
+    """Record latency for every inbound request, labelled by route template"""
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), status
+        ).observe(time.perf_counter() - started)
+
+
+async def _timed_round_trip(name: str, call, *args, **kwargs):
+    started = time.perf_counter()
+    with tracer.start_as_current_span(
+        f"redis {name}", kind=SpanKind.CLIENT,
+        attributes={"db.system": "redis", "db.operation": name},
+    ):
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            REDIS_COMMANDS.labels(name).inc()
+            REDIS_COMMAND_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+class InstrumentedPipeline:
+    """Pipeline proxy: queued commands pass through, execute() counts as one "pipeline" round trip"""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    async def __aenter__(self):
+        await self._pipe.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._pipe.__aexit__(*exc_info)
+
+    async def execute(self, *args, **kwargs):
+        return await _timed_round_trip("pipeline", self._pipe.execute, *args, **kwargs)
+
+
+class InstrumentedRedis:
+    """Async Redis client proxy that counts, times and traces every command"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def pipeline(self, *args, **kwargs) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self._client.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name == "pubsub":
+            return attr
+
+        async def command(*args, **kwargs):
+            return await _timed_round_trip(name, attr, *args, **kwargs)
+
+        return command
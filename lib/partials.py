@@ -0,0 +1,227 @@
+import os
+import re
+import glob
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import subprocess
+from typing import Any, Dict, Optional
+from lib.metrics import CACHE_EVENTS, ERRORS
+
+# Downloads in progress live here, named by video/format/quality rather than
+# job, so a retry on any worker sharing the directory picks up where the
+# last attempt stopped. A dot-directory inside the per-job scratch dir, so it
+# shares that mount and filesystem: the temp-space budget counts both, and a
+# finished download is moved into the scratch dir rather than copied
+PARTIALS_DIR = os.getenv("PARTIALS_DIR", "/tmp/conversions/.partials")
+# Partials untouched for this long are abandoned and removed
+PARTIAL_MAX_AGE_SECONDS = int(os.getenv("PARTIAL_MAX_AGE_SECONDS", str(24 * 3600)))
+# Oldest partials are removed first once the directory grows past this (0 = no cap)
+PARTIALS_MAX_BYTES = int(os.getenv("PARTIALS_MAX_BYTES", str(20 * 1024 ** 3)))
+# A probed duration this far short of the expected one counts as truncated
+DURATION_TOLERANCE = 0.02
+# Keys are locked through a fixed pool of lock files, so none ever need deleting;
+# two keys sharing one only means the second downloads without resuming
+LOCK_SLOTS = 256
+
+
+class PartialCorrupt(Exception):
+    """Raised when a downloaded file fails its integrity check"""
+
+
+def partial_key(video_id: str, content_type: str, quality: str, audio_format: Optional[str]) -> str:
+    """File-name-safe key for one video in one output format and quality"""
+    parts = (video_id, content_type, quality or "", audio_format or "native")
+    return re.sub(r"[^A-Za-z0-9_-]", "_", "-".join(parts))
+
+
+class PartialSlot:
+    """
+    Exclusive use of one partial download
+
+    Holds the key's flock so only one job on the node writes to its files
+    at a time. `base` is the output path stem to hand to yt-dlp; its .part
+    files stay behind if the job fails and are resumed (HTTP Range
+    continuation) by the next job that claims the key.
+    """
+
+    def __init__(self, directory: str, key: str, lock_file):
+        self.directory = directory
+        self.key = key
+        self.base = os.path.join(directory, key)
+        self.corrupt = False
+        self._lock_file = lock_file
+
+    def resumable_bytes(self) -> int:
+        return sum(os.path.getsize(path) for path in glob.glob(f"{glob.escape(self.base)}*.part"))
+
+    def discard(self):
+        """Remove the key's files, e.g. after the output was moved out"""
+        for path in glob.glob(f"{glob.escape(self.base)}.*"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def verify_hook(self, d: Dict[str, Any]):
+        """
+        yt-dlp progress hook: check each finished file before postprocessing
+
+        A file that is shorter than announced or that ffprobe can't read
+        through to the expected duration is deleted, so it is downloaded
+        again rather than resumed.
+
+        Raises:
+            PartialCorrupt: If the file fails the check
+        """
+        if d.get("status") != "finished" or not d.get("filename"):
+            return
+        path = d["filename"]
+        info = d.get("info_dict") or {}
+        try:
+            # The format's announced size; total_bytes only counts what was transferred
+            verify_media(path, info.get("filesize") or d.get("total_bytes"), info.get("duration"))
+        except PartialCorrupt:
+            self.corrupt = True
+            ERRORS.labels("partial_download", "corrupt").inc()
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def release(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class PartialDownloads:
+    """Resumable download scratch area shared by the workers on a node"""
+
+    def __init__(self, directory: str = PARTIALS_DIR, max_age_seconds: int = PARTIAL_MAX_AGE_SECONDS,
+                 max_bytes: int = PARTIALS_MAX_BYTES):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.locks_dir = os.path.join(directory, ".locks")
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    def _lock_path(self, key: str) -> str:
+        slot = int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) % LOCK_SLOTS
+        return os.path.join(self.locks_dir, f"{slot:03d}.lock")
+
+    def claim(self, video_id: str, content_type: str, quality: str,
+              audio_format: Optional[str] = None) -> Optional[PartialSlot]:
+        """
+        Take the partial download for a video/format/quality
+
+        Returns:
+            The slot, or None if another job on the node holds it (the
+            caller then downloads to a job-private path)
+        """
+        key = partial_key(video_id, content_type, quality, audio_format)
+        lock_file = open(self._lock_path(key), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            CACHE_EVENTS.labels("partial_download", "busy").inc()
+            return None
+        slot = PartialSlot(self.directory, key, lock_file)
+        CACHE_EVENTS.labels("partial_download", "resume" if slot.resumable_bytes() else "miss").inc()
+        return slot
+
+    def expire(self, budget_bytes: Optional[int] = None) -> int:
+        """
+        Remove abandoned partials: older than the max age, then oldest first
+        while over the size cap. Files of a claimed key are never touched.
+
+        Args:
+            budget_bytes: Tighter cap for this sweep, e.g. what the temp-space
+                budget can spare (TempSpaceBudget.partials_allowance)
+
+        Returns:
+            Bytes freed
+        """
+        now = time.time()
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            if not os.path.isfile(path):
+                continue
+            try:
+                stat_result = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat_result.st_mtime, stat_result.st_size, path))
+
+        caps = [cap for cap in (self.max_bytes or None, budget_bytes) if cap is not None]
+        max_bytes = min(caps) if caps else None
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        freed = 0
+        for mtime, size, path in files:
+            too_old = now - mtime > self.max_age_seconds
+            over_cap = max_bytes is not None and total > max_bytes
+            if not (too_old or over_cap):
+                continue
+            key = os.path.basename(path).split(".", 1)[0]
+            if self._remove_unclaimed(key, path):
+                freed += size
+                total -= size
+
+        if freed:
+            logging.getLogger(__name__).info("Expired %d bytes of partial downloads", freed)
+        return freed
+
+    def _remove_unclaimed(self, key: str, path: str) -> bool:
+        with open(self._lock_path(key), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                os.unlink(path)
+                return True
+            except FileNotFoundError:
+                return False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def verify_media(path: str, expected_bytes: Optional[int] = None, expected_duration: Optional[float] = None):
+    """
+    Check a downloaded media file is complete
+
+    Compares the size with what the server announced and, when ffprobe is
+    installed, probes the container and its duration.
+
+    Raises:
+        PartialCorrupt: If the file is truncated or unreadable
+    """
+    size = os.path.getsize(path)
+    if expected_bytes and size != expected_bytes:
+        raise PartialCorrupt(f"{os.path.basename(path)} is {size} bytes, expected {expected_bytes}")
+
+    ffprobe = shutil.which("ffprobe")
+    if not ffprobe:
+        return
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+        capture_output=True, text=True, timeout=60,
+    )
+    if result.returncode != 0:
+        raise PartialCorrupt(f"ffprobe rejected {os.path.basename(path)}: {result.stderr.strip()[:200]}")
+    if expected_duration:
+        try:
+            duration = float(json.loads(result.stdout)["format"]["duration"])
+        except (KeyError, ValueError, TypeError):
+            return
+        if duration < expected_duration * (1 - DURATION_TOLERANCE):
+            raise PartialCorrupt(
+                f"{os.path.basename(path)} is {duration:.1f}s, expected {expected_duration:.1f}s"
+            )
@@ -0,0 +1,182 @@
+import os
+import json
+import math
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException
+from lib.metrics import YOUTUBE_QUOTA_DECISIONS, YOUTUBE_QUOTA_REMAINING, YOUTUBE_QUOTA_UNITS
+from lib.shared_state import SharedState
+
+# Project-wide YouTube Data API units per day
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+# Units any one user may spend per day (0 = no per-user cap)
+YOUTUBE_USER_DAILY_QUOTA = int(os.getenv("YOUTUBE_USER_DAILY_QUOTA", "500"))
+# Share of the daily quota only interactive requests may spend
+QUOTA_INTERACTIVE_RESERVE = float(os.getenv("QUOTA_INTERACTIVE_RESERVE", "0.2"))
+# Below this share of the daily quota, requests use their economy plan
+QUOTA_ECONOMY_THRESHOLD = float(os.getenv("QUOTA_ECONOMY_THRESHOLD", "0.4"))
+# The quota resets at midnight in this zone
+QUOTA_RESET_TIMEZONE = os.getenv("QUOTA_RESET_TIMEZONE", "America/Los_Angeles")
+
+# Unit cost per call by method. Every list call costs 1 today; search is 100
+QUOTA_METHOD_COSTS = {"channels": 1, "playlistItems": 1, "videos": 1, "search": 100}
+QUOTA_METHOD_COSTS.update(json.loads(os.getenv("QUOTA_METHOD_COSTS", "{}")))
+# Extra units per requested part, for cost models that charge by part (0 under current pricing)
+QUOTA_PART_COST = int(os.getenv("QUOTA_PART_COST", "0"))
+
+
+def reset_zone():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(QUOTA_RESET_TIMEZONE)
+    except Exception:
+        logging.getLogger(__name__).warning("Unknown QUOTA_RESET_TIMEZONE %s, using UTC", QUOTA_RESET_TIMEZONE)
+        return timezone.utc
+
+
+def quota_user(token_info: Dict[str, Any], token: str) -> str:
+    """Stable per-user ledger key: the Google account when tokeninfo names it, else the token"""
+    return str(token_info.get("sub") or token_info.get("email") or hashlib.sha256(token.encode()).hexdigest()[:32])
+
+
+def call_cost(method: str, part: str = "") -> int:
+    parts = [name for name in part.split(",") if name]
+    return QUOTA_METHOD_COSTS.get(method, 1) + QUOTA_PART_COST * len(parts)
+
+
+class QuotaLedger:
+    """
+    Daily YouTube Data API unit counts, global and per user
+
+    Counters live in shared state (Redis when SHARED_STATE_URL is set) under
+    the current quota day, so they reset with the API's own quota and every
+    worker charges the same ledger.
+    """
+
+    def __init__(self, state: SharedState, daily_limit: int = YOUTUBE_DAILY_QUOTA,
+                 user_daily_limit: int = YOUTUBE_USER_DAILY_QUOTA):
+        self.state = state
+        self.daily_limit = daily_limit
+        self.user_daily_limit = user_daily_limit
+        self.zone = reset_zone()
+
+    def _day(self) -> Tuple[str, float]:
+        """Current quota day and seconds until it resets"""
+        now = datetime.now(self.zone)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=self.zone)
+        return now.strftime("%Y%m%d"), max(1.0, (midnight - now).total_seconds())
+
+    def seconds_until_reset(self) -> float:
+        return self._day()[1]
+
+    def used(self, user_id: Optional[str] = None) -> Tuple[int, int]:
+        """Units spent today globally and by `user_id`"""
+        day, _ = self._day()
+        used = int(self.state.get(f"quota:{day}") or 0)
+        user_used = int(self.state.get(f"quota:{day}:user:{user_id}") or 0) if user_id else 0
+        return used, user_used
+
+    def charge(self, method: str, part: str = "", user_id: Optional[str] = None) -> int:
+        """Charge one call to both ledgers and return the global total"""
+        units = call_cost(method, part)
+        day, ttl = self._day()
+        # Keep the counters a little past the reset so late readers don't see zero early
+        used = self.state.incr(f"quota:{day}", ttl + 3600, units)
+        if user_id:
+            self.state.incr(f"quota:{day}:user:{user_id}", ttl + 3600, units)
+        YOUTUBE_QUOTA_UNITS.labels(method).inc(units)
+        YOUTUBE_QUOTA_REMAINING.set(max(0, self.daily_limit - used))
+        return used
+
+    def exhaust(self):
+        """Record that YouTube reported the quota spent, whatever the ledger says"""
+        day, ttl = self._day()
+        used, _ = self.used()
+        if used < self.daily_limit:
+            self.state.incr(f"quota:{day}", ttl + 3600, self.daily_limit - used)
+        YOUTUBE_QUOTA_REMAINING.set(0)
+        logging.getLogger(__name__).warning("YouTube quota exhausted until reset")
+
+
+class QuotaPlan:
+    """
+    The planner's answer for one request
+
+    Pass it along with the request's YouTube calls: `parts` picks the
+    part= set for the current budget and `charge` books each call.
+    """
+
+    def __init__(self, ledger: QuotaLedger, user_id: Optional[str], economy: bool):
+        self.ledger = ledger
+        self.user_id = user_id
+        self.economy = economy
+
+    def parts(self, full: str, economy: str) -> str:
+        return economy if self.economy else full
+
+    def charge(self, method: str, part: str = "", response=None):
+        """Book a call; a quotaExceeded response marks the day's quota spent"""
+        self.ledger.charge(method, part, self.user_id)
+        if response is not None and response.status_code == 403 and "quotaExceeded" in response.text:
+            self.ledger.exhaust()
+
+
+class QuotaPlanner:
+    """
+    Budget-aware admission for YouTube Data API work
+
+    Interactive requests may spend the whole daily quota. Background work
+    (scheduled syncs) is deferred once only the reserved share
+    (QUOTA_INTERACTIVE_RESERVE) is left, so dashboards keep working late
+    in the day. Below QUOTA_ECONOMY_THRESHOLD remaining, requests get the
+    economy plan: smaller part= sets and skipped optional calls.
+    """
+
+    def __init__(self, ledger: QuotaLedger, reserve: float = QUOTA_INTERACTIVE_RESERVE,
+                 economy_threshold: float = QUOTA_ECONOMY_THRESHOLD):
+        self.ledger = ledger
+        self.reserve_units = int(ledger.daily_limit * reserve)
+        self.economy_units = int(ledger.daily_limit * economy_threshold)
+
+    def plan(self, user_id: Optional[str], interactive: bool = True, estimated_units: int = 1) -> QuotaPlan:
+        """
+        Decide whether a request may spend quota now, and how
+
+        Args:
+            user_id: Per-user ledger key (see quota_user)
+            interactive: False for background work that can wait
+            estimated_units: Units the request expects to spend
+
+        Returns:
+            QuotaPlan for the request's calls
+
+        Raises:
+            HTTPException: 429 with Retry-After (the next quota reset) when
+                the request has to wait
+        """
+        priority = "interactive" if interactive else "background"
+        used, user_used = self.ledger.used(user_id)
+        remaining = self.ledger.daily_limit - used
+        YOUTUBE_QUOTA_REMAINING.set(max(0, remaining))
+
+        floor = 0 if interactive else self.reserve_units
+        if remaining - estimated_units < floor:
+            YOUTUBE_QUOTA_DECISIONS.labels(priority, "deferred").inc()
+            self._defer("YouTube API quota exceeded. Please try again tomorrow." if interactive else
+                        "YouTube API quota is reserved for interactive requests. Background sync deferred.")
+        if user_id and self.ledger.user_daily_limit and user_used + estimated_units > self.ledger.user_daily_limit:
+            YOUTUBE_QUOTA_DECISIONS.labels(priority, "user_limit").inc()
+            self._defer("Daily YouTube sync limit reached for this account. Please try again tomorrow.")
+
+        economy = remaining - floor < self.economy_units
+        YOUTUBE_QUOTA_DECISIONS.labels(priority, "economy" if economy else "full").inc()
+        return QuotaPlan(self.ledger, user_id, economy)
+
+    def _defer(self, detail: str):
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(math.ceil(self.ledger.seconds_until_reset()))}
+        )
@@ -0,0 +1,259 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from lib.metrics import ERRORS
+
+# redis://... shares caches, rate limits and circuit state across workers and
+# containers; empty keeps them per process (fine for a single worker)
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "ytapi:")
+SHARED_STATE_TIMEOUT = float(os.getenv("SHARED_STATE_TIMEOUT", "0.25"))
+# How long a tripped circuit waits in half-open for its trial call before it
+# forgets the trip and closes
+CIRCUIT_HALF_OPEN_TTL = float(os.getenv("CIRCUIT_HALF_OPEN_TTL", "3600"))
+
+
+class LocalBackend:
+    """In-process key/value store with per-key expiry"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl_seconds)
+            if len(self._data) > 100000:
+                # Expired entries are otherwise only dropped when read
+                now = time.monotonic()
+                self._data = {k: v for k, v in self._data.items() if v[1] > now}
+
+    def add(self, key: str, value: str, ttl_seconds: float) -> bool:
+        """Set a key only if it is absent; True if it was set"""
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._data[key] = (value, time.monotonic() + ttl_seconds)
+            return True
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        """Increment a counter, starting its expiry when it is created"""
+        with self._lock:
+            current = self._live(key)
+            if current is None:
+                self._data[key] = (str(amount), time.monotonic() + ttl_seconds)
+                return amount
+            value = int(current) + amount
+            self._data[key] = (str(value), self._data[key][1])
+            return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    """
+    Redis-backed store shared by every worker process and container
+
+    Shared state only saves upstream calls, so Redis errors are logged
+    and treated as a miss (get/incr/add) or ignored (set/delete) rather than
+    failing the request.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    @property
+    def client(self):
+        # Connect lazily so each pre-forked worker gets its own pool
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(
+                self.url, decode_responses=True,
+                socket_timeout=SHARED_STATE_TIMEOUT, socket_connect_timeout=SHARED_STATE_TIMEOUT,
+            )
+        return self._client
+
+    def _failed(self, operation: str, error: Exception):
+        ERRORS.labels("shared_state", type(error).__name__).inc()
+        logging.getLogger(__name__).warning("Shared state %s failed: %s", operation, error)
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.client.get(key)
+        except Exception as e:
+            self._failed("get", e)
+            return None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        try:
+            self.client.set(key, value, px=max(1, int(ttl_seconds * 1000)))
+        except Exception as e:
+            self._failed("set", e)
+
+    def add(self, key: str, value: str, ttl_seconds: float) -> bool:
+        """Set a key only if it is absent; True if it was set"""
+        try:
+            return bool(self.client.set(key, value, nx=True, px=max(1, int(ttl_seconds * 1000))))
+        except Exception as e:
+            self._failed("add", e)
+            return True
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        """Increment a counter, starting its expiry when it is created"""
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.set(key, 0, nx=True, px=max(1, int(ttl_seconds * 1000)))
+            pipe.incrby(key, amount)
+            return pipe.execute()[1]
+        except Exception as e:
+            self._failed("incr", e)
+            return 0
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(key)
+        except Exception as e:
+            self._failed("delete", e)
+
+
+class SharedState:
+    """Namespaced view over the configured backend"""
+
+    def __init__(self, backend, prefix: str = SHARED_STATE_PREFIX):
+        self.backend = backend
+        self.prefix = prefix
+
+    @property
+    def shared(self) -> bool:
+        """True when state is visible to other processes"""
+        return not isinstance(self.backend, LocalBackend)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.backend.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self.backend.set(self.prefix + key, value, ttl_seconds)
+
+    def add(self, key: str, value: str, ttl_seconds: float) -> bool:
+        return self.backend.add(self.prefix + key, value, ttl_seconds)
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        return self.backend.incr(self.prefix + key, ttl_seconds, amount)
+
+    def delete(self, key: str):
+        self.backend.delete(self.prefix + key)
+
+
+def create_shared_state(url: str = SHARED_STATE_URL) -> SharedState:
+    return SharedState(RedisBackend(url) if url else LocalBackend())
+
+
+class RateLimiter:
+    """
+    Fixed-window request budget, counted in shared state
+
+    With a Redis backend the budget is global, so adding workers or
+    containers doesn't multiply the rate sent upstream.
+    """
+
+    def __init__(self, state: SharedState, name: str, limit: int, window_seconds: float = 60.0):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    def acquire(self) -> Optional[float]:
+        """
+        Take one request from the current window
+
+        Returns:
+            None if allowed, otherwise seconds until the next window
+        """
+        if self.limit <= 0:
+            return None
+        now = time.time()
+        window = int(now // self.window_seconds)
+        count = self.state.incr(f"rate:{self.name}:{window}", self.window_seconds)
+        if count <= self.limit:
+            return None
+        return (window + 1) * self.window_seconds - now
+
+
+class CircuitBreaker:
+    """
+    Shared circuit breaker for an upstream
+
+    After `failure_threshold` failures within `reset_seconds` the circuit
+    opens and callers fail fast until it expires. It then goes half-open:
+    one caller at a time (across all workers) gets a trial call, and the
+    rest keep failing fast. A successful trial closes the circuit; a failed
+    one opens it again. Upstreams that send Retry-After can open it directly.
+    """
+
+    def __init__(self, state: SharedState, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 trial_seconds: float = 10.0):
+        self.state = state
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        # Trial lock lifetime, so a trial whose outcome is never recorded doesn't wedge the circuit
+        self.trial_seconds = trial_seconds
+
+    def retry_after(self) -> Optional[float]:
+        """
+        Seconds until calls may be retried, or None if this call may proceed
+
+        In half-open, None also hands this caller the trial; report its
+        outcome with record_success/record_failure.
+        """
+        open_until = self.state.get(f"circuit:{self.name}:open")
+        if open_until is not None:
+            remaining = float(open_until) - time.time()
+            if remaining > 0:
+                return remaining
+        if self.state.get(f"circuit:{self.name}:tripped") is None:
+            return None
+        if self.state.add(f"circuit:{self.name}:trial", "1", self.trial_seconds):
+            return None
+        return self.trial_seconds
+
+    def record_success(self):
+        self.state.delete(f"circuit:{self.name}:failures")
+        if self.state.get(f"circuit:{self.name}:tripped") is not None:
+            self.state.delete(f"circuit:{self.name}:tripped")
+            self.state.delete(f"circuit:{self.name}:trial")
+            logging.getLogger(__name__).info("Circuit %s closed", self.name)
+
+    def record_failure(self):
+        if self.state.get(f"circuit:{self.name}:tripped") is not None:
+            # Failed trial (or a straggler from before the trip)
+            self.open(self.reset_seconds)
+            return
+        failures = self.state.incr(f"circuit:{self.name}:failures", self.reset_seconds)
+        if failures >= self.failure_threshold:
+            self.open(self.reset_seconds)
+
+    def open(self, seconds: float):
+        self.state.set(f"circuit:{self.name}:open", str(time.time() + seconds), seconds)
+        self.state.set(f"circuit:{self.name}:tripped", "1", seconds + CIRCUIT_HALF_OPEN_TTL)
+        self.state.delete(f"circuit:{self.name}:trial")
+        self.state.delete(f"circuit:{self.name}:failures")
+        logging.getLogger(__name__).warning("Circuit %s open for %.0fs", self.name, seconds)
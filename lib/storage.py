@@ -0,0 +1,259 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+from lib.metrics import CACHE_EVENTS
+
+AWS_BUCKET = os.getenv("AWS_BUCKET", "podpay-media")
+ARTIFACT_PREFIX = "conversions/"
+
+# "private" (default): no ACLs, artifacts are only reachable through signed URLs
+# "public": legacy public-read objects with static bucket URLs
+STORAGE_MODE = os.getenv("STORAGE_MODE", "private")
+
+# Point at MinIO/moto/etc. for local testing; unset means AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
+PRESIGNED_URL_TTL = int(os.getenv("PRESIGNED_URL_TTL", "3600"))
+# Re-sign once a cached URL has less than this many seconds left
+PRESIGNED_URL_REFRESH_MARGIN = int(os.getenv("PRESIGNED_URL_REFRESH_MARGIN", "300"))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+
+# Optional CloudFront signed URLs instead of S3 presigning
+CDN_BASE_URL = os.getenv("CDN_BASE_URL")
+CDN_KEY_PAIR_ID = os.getenv("CDN_KEY_PAIR_ID")
+CDN_PRIVATE_KEY_PATH = os.getenv("CDN_PRIVATE_KEY_PATH")
+
+# Signs main.py /download URLs (HMAC of the artifact name and expiry).
+# Unless STORAGE_MODE=public, /download refuses unsigned or expired
+# requests, and with no secret set it refuses all of them
+DOWNLOAD_URL_SECRET = os.getenv("DOWNLOAD_URL_SECRET", "")
+# Minimum lifetime of a /download link; links stay valid for up to twice this
+DOWNLOAD_URL_TTL = int(os.getenv("DOWNLOAD_URL_TTL", str(7 * 24 * 3600)))
+
+
+def download_expiry(now: Optional[float] = None, ttl: int = DOWNLOAD_URL_TTL) -> int:
+    """
+    Expiry (unix seconds) for /download links issued now
+
+    Expiries are aligned to `ttl`-long windows, so every link issued within
+    one window is identical (and cacheable) and valid for at least `ttl`.
+    """
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+
+def download_signature(name: str, expires: int, secret: Optional[str] = None) -> str:
+    """
+    Signature that authorises /download/{name} until `expires`
+
+    Args:
+        name: Artifact name
+        expires: Unix time the link stops working
+        secret: Signing key, DOWNLOAD_URL_SECRET unless given
+
+    Raises:
+        RuntimeError: If no secret is configured
+    """
+    secret = secret or DOWNLOAD_URL_SECRET
+    if not secret:
+        raise RuntimeError("DOWNLOAD_URL_SECRET is not configured")
+    return hmac.new(secret.encode(), f"{name}\n{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def download_query(name: str, expires: Optional[int] = None) -> str:
+    """Query string authorising /download/{name}; empty when storage is public"""
+    if STORAGE_MODE == "public":
+        return ""
+    expires = download_expiry() if expires is None else expires
+    return f"exp={expires}&sig={download_signature(name, expires)}"
+
+
+def download_path(name: str, expires: Optional[int] = None) -> str:
+    """Path of a /download URL for an artifact, signed unless storage is public"""
+    query = download_query(name, expires)
+    return f"/download/{name}?{query}" if query else f"/download/{name}"
+
+
+def download_allowed(name: str, signature: Optional[str], expires: Optional[str]) -> bool:
+    """Whether a /download request for `name` carries a valid, unexpired signature (or needs none)"""
+    if STORAGE_MODE == "public":
+        return True
+    if not DOWNLOAD_URL_SECRET or not signature or not expires:
+        return False
+    try:
+        expires_at = int(expires)
+    except ValueError:
+        return False
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(download_signature(name, expires_at), signature)
+
+
+def artifact_key(name: str) -> str:
+    """S3 key for an artifact name such as "<video_id>-medium.m4a\""""
+    return f"{ARTIFACT_PREFIX}{name}"
+
+
+class ColdStorage:
+    """S3 bucket holding every finished artifact (cold tier behind the local cache)"""
+
+    def __init__(self, bucket: str = AWS_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 is only imported once something actually needs S3; the lock
+        # covers a background warm-up racing the first request (boto3's
+        # default session isn't safe to initialise from two threads)
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def upload(self, file_path: str, key: str, mime_type: str):
+        """Upload a finished artifact, public-read only in legacy public mode"""
+        extra_args = {'ContentType': mime_type}
+        if STORAGE_MODE == "public":
+            extra_args['ACL'] = 'public-read'
+        self.client.upload_file(file_path, self.bucket, key, ExtraArgs=extra_args)
+
+    def public_url(self, key: str) -> str:
+        """Static object URL (only resolvable in public mode)"""
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def presigned_url(self, key: str, expires_in: int = PRESIGNED_URL_TTL) -> str:
+        """Short-lived GET URL for an object"""
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    def exists(self, key: str) -> bool:
+        """Whether an object is in the bucket"""
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def download(self, key: str, dest_path: str):
+        """Copy an object to a local path"""
+        self.client.download_file(self.bucket, key, dest_path)
+
+
+class ArtifactURLService:
+    """
+    Issues client-facing URLs for stored artifacts
+
+    Signs with CloudFront when a CDN key pair is configured, otherwise
+    presigns against S3; unsigned CDN URLs are only handed out in public
+    mode. Signed URLs are cached per key until shortly before they expire,
+    so status polling doesn't pay for a signature per request.
+    """
+
+    def __init__(self, storage: ColdStorage, ttl: int = PRESIGNED_URL_TTL,
+                 refresh_margin: int = PRESIGNED_URL_REFRESH_MARGIN, max_entries: int = SIGNED_URL_CACHE_SIZE):
+        self.storage = storage
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._cdn_signer = None
+        if STORAGE_MODE != "public" and CDN_BASE_URL and not (CDN_KEY_PAIR_ID and CDN_PRIVATE_KEY_PATH):
+            logging.getLogger(__name__).warning(
+                "CDN_BASE_URL is set without a CloudFront key pair; private artifacts are presigned against S3"
+            )
+
+    def url_for(self, key: str) -> str:
+        """
+        Get a URL the client can fetch `key` from
+
+        Args:
+            key: S3 object key
+
+        Returns:
+            Signed URL valid for at least refresh_margin seconds, or a static
+            URL in public mode
+        """
+        if STORAGE_MODE == "public" and not CDN_BASE_URL:
+            return self.storage.public_url(key)
+
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[1] - now > self.refresh_margin:
+                self._cache.move_to_end(key)
+                CACHE_EVENTS.labels("signed_url", "hit").inc()
+                return cached[0]
+        CACHE_EVENTS.labels("signed_url", "miss").inc()
+
+        url = self._sign(key)
+        with self._lock:
+            self._cache[key] = (url, now + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return url
+
+    def url_for_existing(self, key: str) -> Optional[str]:
+        """
+        Like url_for, but None when the object doesn't exist
+
+        A cached URL counts as proof of existence, so only misses pay for
+        a HEAD request.
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+        if not (cached and cached[1] - time.time() > self.refresh_margin) and not self.storage.exists(key):
+            CACHE_EVENTS.labels("signed_url", "not_found").inc()
+            return None
+        return self.url_for(key)
+
+    def invalidate(self, key: str):
+        """Drop a cached URL, e.g. after the object is replaced or deleted"""
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _sign(self, key: str) -> str:
+        if CDN_BASE_URL and CDN_KEY_PAIR_ID and CDN_PRIVATE_KEY_PATH:
+            expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+            return self._get_cdn_signer().generate_presigned_url(
+                f"{CDN_BASE_URL.rstrip('/')}/{key}", date_less_than=expires_at
+            )
+        if CDN_BASE_URL and STORAGE_MODE == "public":
+            # Unsigned CDN in front of a public bucket
+            return f"{CDN_BASE_URL.rstrip('/')}/{key}"
+        return self.storage.presigned_url(key, expires_in=self.ttl)
+
+    def _get_cdn_signer(self):
+        if self._cdn_signer is None:
+            from botocore.signers import CloudFrontSigner
+            from cryptography.hazmat.primitives import hashes, serialization
+            from cryptography.hazmat.primitives.asymmetric import padding
+
+            with open(CDN_PRIVATE_KEY_PATH, "rb") as key_file:
+                private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+
+            def rsa_signer(message):
+                return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+            self._cdn_signer = CloudFrontSigner(CDN_KEY_PAIR_ID, rsa_signer)
+        return self._cdn_signer
@@ -0,0 +1,269 @@
+import os
+import time
+import glob
+import shutil
+import socket
+import asyncio
+import fcntl
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+from lib.job_control import JobControl
+
+# 0 = derive the budget from free disk space in the temp dir
+TEMP_SPACE_BUDGET_BYTES = int(os.getenv("TEMP_SPACE_BUDGET_BYTES", "0"))
+# Always leave this much of the filesystem free
+TEMP_SPACE_HEADROOM_BYTES = int(os.getenv("TEMP_SPACE_HEADROOM_BYTES", str(1024 ** 3)))
+# Used when yt-dlp reports neither a size nor a bitrate
+TEMP_DEFAULT_JOB_BYTES = int(os.getenv("TEMP_DEFAULT_JOB_BYTES", str(512 * 1024 ** 2)))
+# How long a job waits for space before it is handed back to the queue
+TEMP_RESERVE_TIMEOUT = float(os.getenv("TEMP_RESERVE_TIMEOUT", "30"))
+# Reservations from other hosts can't be liveness-checked, so they age out
+TEMP_RESERVATION_TTL = int(os.getenv("TEMP_RESERVATION_TTL", str(6 * 3600)))
+# Unreserved files younger than this are left alone by the janitor
+TEMP_ORPHAN_GRACE = int(os.getenv("TEMP_ORPHAN_GRACE", "300"))
+
+# Download + postprocess output (remux, merge or MP3) coexist on disk
+POSTPROCESS_FACTOR = 2
+
+
+class TempSpaceExhausted(Exception):
+    """Raised when a job can't reserve scratch space within the timeout"""
+
+
+def estimate_job_bytes(info: Dict[str, Any]) -> int:
+    """
+    Estimate peak scratch usage for a job from yt-dlp's extracted info
+
+    Args:
+        info: Result of YoutubeDL.extract_info(download=False)
+
+    Returns:
+        Estimated bytes, including room for the postprocessed copy
+    """
+    formats = info.get("requested_formats") or [info]
+    duration = info.get("duration") or 0
+    total = 0
+    for fmt in formats:
+        size = fmt.get("filesize") or fmt.get("filesize_approx")
+        if not size and duration and fmt.get("tbr"):
+            size = duration * fmt["tbr"] * 1000 / 8
+        if not size:
+            return TEMP_DEFAULT_JOB_BYTES * POSTPROCESS_FACTOR
+        total += int(size)
+    return total * POSTPROCESS_FACTOR
+
+
+class TempSpaceBudget:
+    """
+    Disk-space reservations for the conversion scratch directory
+
+    Each running job holds a reservation file under `.reservations/` for its
+    estimated peak usage, so every worker sharing the directory (including
+    other containers on the same volume) sees the same budget. Reservation
+    changes are serialised through an flock.
+
+    Resumable partial downloads (see lib.partials) are scratch too and must
+    live on the same filesystem; a partials dir on another device is refused,
+    as free space would be read off the wrong disk. A job's reservation names the partial key
+    it downloads under, so those bytes are charged once, to the job; the
+    partials no running job owns are charged to the budget as they are.
+    """
+
+    def __init__(self, temp_dir: str, budget_bytes: int = TEMP_SPACE_BUDGET_BYTES,
+                 headroom_bytes: int = TEMP_SPACE_HEADROOM_BYTES, partials_dir: Optional[str] = None):
+        self.temp_dir = temp_dir
+        self.budget_bytes = budget_bytes
+        self.headroom_bytes = headroom_bytes
+        self.partials_dir = partials_dir
+        self.reservations_dir = os.path.join(temp_dir, ".reservations")
+        self.hostname = socket.gethostname()
+        os.makedirs(self.reservations_dir, exist_ok=True)
+        if partials_dir and os.path.isdir(partials_dir) and os.stat(partials_dir).st_dev != os.stat(temp_dir).st_dev:
+            raise ValueError(
+                f"Partials dir {partials_dir} is not on the same filesystem as {temp_dir}; "
+                f"point PARTIALS_DIR inside the scratch volume"
+            )
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.reservations_dir, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _is_live(self, path: str, host: str, pid: int) -> bool:
+        if host == self.hostname:
+            try:
+                os.kill(pid, 0)
+                return True
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                return True
+        return time.time() - os.path.getmtime(path) < TEMP_RESERVATION_TTL
+
+    def _reservations(self) -> Dict[str, Tuple[int, Optional[str]]]:
+        """
+        Live reservations by job ID as (bytes, partial key), dropping any
+        left by dead workers (lock held)
+        """
+        reservations = {}
+        for path in glob.glob(os.path.join(self.reservations_dir, "*")):
+            try:
+                with open(path) as f:
+                    host, pid, reserved, *partial_key = f.read().split()
+                live = self._is_live(path, host, int(pid))
+            except (OSError, ValueError):
+                live = False
+                reserved = 0
+            if live:
+                reservations[os.path.basename(path)] = (int(reserved), partial_key[0] if partial_key else None)
+            else:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        return reservations
+
+    @staticmethod
+    def _file_sizes(directory: str) -> Dict[str, int]:
+        sizes = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    try:
+                        sizes[entry.name] = entry.stat().st_size
+                    except FileNotFoundError:
+                        pass
+        return sizes
+
+    def _partial_bytes(self, owned_keys) -> Tuple[int, int]:
+        """(all, unowned) bytes of partial downloads; a file's key is its name up to the first dot"""
+        if not self.partials_dir or not os.path.isdir(self.partials_dir):
+            return 0, 0
+        total = unowned = 0
+        for name, size in self._file_sizes(self.partials_dir).items():
+            total += size
+            if name.split(".", 1)[0] not in owned_keys:
+                unowned += size
+        return total, unowned
+
+    def _limit(self, reservations: Dict[str, Tuple[int, Optional[str]]]) -> Tuple[int, int, int, int]:
+        """(scratch limit, bytes reserved, all partial bytes, unowned partial bytes) (lock held)"""
+        usage = shutil.disk_usage(self.temp_dir)
+        partial_total, partial_unowned = self._partial_bytes({key for _, key in reservations.values() if key})
+        # Scratch bytes already on disk show up as used, so add them back
+        # before subtracting the reservations and unowned partials they belong to
+        on_disk = sum(self._file_sizes(self.temp_dir).values()) + partial_total
+        disk_limit = usage.free + on_disk - self.headroom_bytes
+        limit = min(self.budget_bytes, disk_limit) if self.budget_bytes else disk_limit
+        return limit, sum(reserved for reserved, _ in reservations.values()), partial_total, partial_unowned
+
+    def _capacity(self, reservations: Dict[str, Tuple[int, Optional[str]]]) -> int:
+        limit, reserved, _, partial_unowned = self._limit(reservations)
+        return limit - reserved - partial_unowned
+
+    def available(self) -> int:
+        """Bytes that could be reserved right now"""
+        with self._lock():
+            return self._capacity(self._reservations())
+
+    def partials_allowance(self) -> int:
+        """
+        Bytes partial downloads may hold without eating into running jobs'
+        reservations; pass to PartialDownloads.expire as its cap
+        """
+        with self._lock():
+            limit, reserved, partial_total, partial_unowned = self._limit(self._reservations())
+        # Owned partial bytes are already inside their job's reservation
+        return max(0, limit - reserved + partial_total - partial_unowned)
+
+    def try_reserve(self, job_id: str, estimated_bytes: int, partial_key: Optional[str] = None) -> bool:
+        """Reserve space for a job if it fits in the budget"""
+        with self._lock():
+            reservations = self._reservations()
+            reservations.pop(job_id, None)
+            if partial_key:
+                # Count the key's bytes as the job's from here on
+                reservations[job_id] = (0, partial_key)
+            if estimated_bytes > self._capacity(reservations):
+                return False
+            with open(os.path.join(self.reservations_dir, job_id), "w") as f:
+                f.write(f"{self.hostname} {os.getpid()} {estimated_bytes} {partial_key or ''}".rstrip())
+            return True
+
+    async def reserve(self, job_id: str, estimated_bytes: int, timeout: float = TEMP_RESERVE_TIMEOUT,
+                      control: Optional[JobControl] = None, partial_key: Optional[str] = None):
+        """
+        Wait until a job's estimated bytes fit in the budget, then reserve them
+
+        Args:
+            job_id: Job the reservation belongs to
+            estimated_bytes: Peak scratch usage, see estimate_job_bytes
+            timeout: Seconds to wait for space
+            control: Interrupts the wait when the job is cancelled or preempted
+            partial_key: Partial download the job writes to, whose existing
+                bytes the reservation then covers
+
+        Raises:
+            TempSpaceExhausted: If space didn't free up within the timeout
+            JobInterrupted: If the job was cancelled or preempted while waiting
+        """
+        deadline = time.monotonic() + timeout
+        while not self.try_reserve(job_id, estimated_bytes, partial_key):
+            if control:
+                control.raise_if_stopped()
+            if time.monotonic() >= deadline:
+                raise TempSpaceExhausted(
+                    f"Not enough scratch space for job {job_id} ({estimated_bytes} bytes)"
+                )
+            await asyncio.sleep(1)
+
+    def release(self, job_id: str):
+        """Drop a job's reservation"""
+        try:
+            os.unlink(os.path.join(self.reservations_dir, job_id))
+        except FileNotFoundError:
+            pass
+
+    def cleanup_job(self, job_id: str):
+        """Remove every scratch file a job produced, finished or partial"""
+        for path in glob.glob(os.path.join(self.temp_dir, f"{glob.escape(job_id)}.*")):
+            try:
+                os.unlink(path)
+            except (FileNotFoundError, IsADirectoryError):
+                pass
+
+    def janitor(self) -> int:
+        """
+        Remove scratch files that no live reservation owns
+
+        Run at worker startup to reclaim space from jobs that crashed or were
+        killed before their cleanup ran.
+
+        Returns:
+            Bytes freed
+        """
+        freed = 0
+        now = time.time()
+        with self._lock():
+            live_jobs = set(self._reservations())
+            for path in glob.glob(os.path.join(self.temp_dir, "*")):
+                name = os.path.basename(path)
+                job_id = name.split(".", 1)[0]
+                if job_id in live_jobs or not os.path.isfile(path):
+                    continue
+                try:
+                    stat_result = os.stat(path)
+                    if now - stat_result.st_mtime < TEMP_ORPHAN_GRACE:
+                        continue
+                    os.unlink(path)
+                    freed += stat_result.st_size
+                except FileNotFoundError:
+                    pass
+        if freed:
+            logging.getLogger(__name__).info("Temp janitor freed %d bytes in %s", freed, self.temp_dir)
+        return freed
@@ -0,0 +1,86 @@
+import os
+import sys
+from typing import Dict, Optional
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.propagate import extract, inject
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from starlette.requests import Request
+
+# none | console | file | otlp
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "none").lower()
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "traces.jsonl")
+
+# Job hash fields carrying W3C trace context from /convert to the worker
+TRACE_CONTEXT_FIELDS = ("traceparent", "tracestate")
+
+tracer = trace.get_tracer("podpay")
+
+_configured = False
+
+
+def configure_tracing(service_name: str):
+    """
+    Install a tracer provider and exporter chosen by OTEL_TRACES_EXPORTER
+
+    With "none" (the default) spans are still created but never exported,
+    so instrumentation costs next to nothing. Safe to call more than once.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    if OTEL_TRACES_EXPORTER == "console":
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(out=sys.stdout)))
+    elif OTEL_TRACES_EXPORTER == "file":
+        trace_file = open(OTEL_TRACES_FILE, "a")
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+            out=trace_file, formatter=lambda span: span.to_json(indent=None) + "\n"
+        )))
+    elif OTEL_TRACES_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+
+def trace_context_fields() -> Dict[str, str]:
+    """Current trace context as job hash fields (empty when not tracing)"""
+    carrier: Dict[str, str] = {}
+    inject(carrier)
+    return {field: carrier[field] for field in TRACE_CONTEXT_FIELDS if field in carrier}
+
+
+def context_from_fields(fields: Dict[str, str]) -> Optional[otel_context.Context]:
+    """Rebuild the submitting request's trace context from a job hash"""
+    carrier = {field: fields[field] for field in TRACE_CONTEXT_FIELDS if fields.get(field)}
+    return extract(carrier) if carrier else None
+
+
+def record_exception(span, exc: BaseException):
+    """Mark a span failed with the exception attached"""
+    span.record_exception(exc)
+    span.set_status(Status(StatusCode.ERROR, str(exc)))
+
+
+async def tracing_middleware(request: Request, call_next):
+    """Server span per inbound request, continuing any incoming traceparent"""
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=extract(request.headers),
+        kind=SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.target": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR))
+        return response
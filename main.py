@@ -1,17 +1,35 @@
 import os
+import math
+import logging
 from datetime import datetime
-from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi import FastAPI, Query, HTTPException, Request, BackgroundTasks
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 import requests
 from lib.auth import TokenManager, APIErrorHandler
+from lib.shared_state import CircuitBreaker, RateLimiter, create_shared_state
+from lib.channel_sync import ChannelSync
+from lib.quota import QuotaLedger, QuotaPlanner, quota_user
+from lib.artifact_cache import ArtifactCache
+from lib.storage import ColdStorage, ArtifactURLService, artifact_key, download_allowed
+from lib.media_response import MediaFileResponse
+from lib.json_response import FastJSONResponse, FragmentCache
+from lib.compression import CompressionMiddleware
+from lib.http_client import upstream_get, upstream_request
+from lib.metrics import CACHE_EVENTS, http_metrics_middleware, metrics_response
+from lib.logging_setup import configure_logging, request_id_middleware
+from lib.tracing import configure_tracing, tracing_middleware
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+configure_logging()
+configure_tracing("yt-converter-api")
+logger = logging.getLogger("yt_converter_api")
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # CORS setup
 app.add_middleware(
@@ -21,14 +39,119 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+
+app.middleware("http")(http_metrics_middleware)
+app.middleware("http")(request_id_middleware)
+app.middleware("http")(tracing_middleware)
+
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+# Override to route RapidAPI calls to a stub (the X-RapidAPI-Host header still names the provider)
+RAPIDAPI_BASE_URL = os.getenv("RAPIDAPI_BASE_URL")
+# Requests per minute per RapidAPI host across all workers (0 = unlimited)
+RAPIDAPI_RATE_LIMIT_PER_MINUTE = int(os.getenv("RAPIDAPI_RATE_LIMIT_PER_MINUTE", "0"))
+# Consecutive timeouts/5xx before a host's circuit opens, and for how long
+RAPIDAPI_CIRCUIT_THRESHOLD = int(os.getenv("RAPIDAPI_CIRCUIT_THRESHOLD", "5"))
+RAPIDAPI_CIRCUIT_RESET_SECONDS = float(os.getenv("RAPIDAPI_CIRCUIT_RESET_SECONDS", "30"))
+# custom-conversion-api.py base URL; /sync_user_videos?enqueue=true queues newly public uploads there
+CONVERSION_API_URL = os.getenv("CONVERSION_API_URL", "")
+
+# Encoded videos of /list_user_videos, keyed by the playlist item's ETag
+video_fragments = FragmentCache("video_json")
+
+def video_entry(item: dict) -> dict:
+    """Listing entry for a playlistItems item"""
+    snippet = item["snippet"]
+    thumbnails = snippet["thumbnails"]
+    return {
+        "videoId": snippet["resourceId"]["videoId"],
+        "title": snippet["title"],
+        "description": snippet["description"],
+        "publishedAt": snippet["publishedAt"],
+        "thumbnail": thumbnails["high"]["url"] if "high" in thumbnails else thumbnails["default"]["url"]
+    }
+
+def video_version(item: dict):
+    return (item["id"], item["etag"]) if item.get("id") and item.get("etag") else None
 
-# Downloads directory removed - using RapidAPI for conversions
+def rapidapi_url(host: str, path: str) -> str:
+    """RapidAPI endpoint URL, honouring RAPIDAPI_BASE_URL"""
+    base = RAPIDAPI_BASE_URL.rstrip("/") if RAPIDAPI_BASE_URL else f"https://{host}"
+    return f"{base}{path}"
 
-YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+# Caches, rate limits and circuit state; Redis-backed when SHARED_STATE_URL is set
+# so multiple workers and containers share them
+shared_state = create_shared_state()
 
 # Initialize auth utilities
-token_manager = TokenManager()
+token_manager = TokenManager(shared_state)
 api_error_handler = APIErrorHandler()
+channel_sync = ChannelSync(shared_state, YOUTUBE_API_URL)
+# YouTube Data API units, charged per call against daily global and per-user budgets
+quota_planner = QuotaPlanner(QuotaLedger(shared_state))
+
+rapidapi_limiters = {}
+rapidapi_circuits = {}
+
+def rapidapi_get(host: str, path: str, **kwargs) -> requests.Response:
+    """
+    GET a RapidAPI endpoint through the shared rate limit and circuit breaker
+    
+    Args:
+        host: RapidAPI host, also the rate-limit and circuit key
+        path: Endpoint path
+        **kwargs: Passed through to upstream_get
+        
+    Returns:
+        HTTP response
+        
+    Raises:
+        HTTPException: 503 while the host's circuit is open, 429 when the
+            rate limit is spent (both with Retry-After)
+    """
+    circuit = rapidapi_circuits.setdefault(host, CircuitBreaker(
+        shared_state, host, RAPIDAPI_CIRCUIT_THRESHOLD, RAPIDAPI_CIRCUIT_RESET_SECONDS
+    ))
+    limiter = rapidapi_limiters.setdefault(host, RateLimiter(shared_state, host, RAPIDAPI_RATE_LIMIT_PER_MINUTE))
+    
+    wait = circuit.retry_after()
+    if wait:
+        raise HTTPException(
+            status_code=503,
+            detail="Conversion provider is unavailable. Please try again shortly.",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    wait = limiter.acquire()
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Conversion rate limit reached. Please try again shortly.",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    
+    try:
+        response = upstream_get(rapidapi_url(host, path), **kwargs)
+    except requests.exceptions.RequestException:
+        circuit.record_failure()
+        raise
+    
+    if response.status_code == 429:
+        # Back every worker off for as long as the provider asked
+        try:
+            retry_after = float(response.headers.get("Retry-After", RAPIDAPI_CIRCUIT_RESET_SECONDS))
+        except ValueError:
+            retry_after = RAPIDAPI_CIRCUIT_RESET_SECONDS
+        circuit.open(retry_after)
+    elif response.status_code >= 500:
+        circuit.record_failure()
+    else:
+        circuit.record_success()
+    return response
+
+# Finished artifacts: local LRU hot tier (shared with workers on this node), S3 cold tier
+artifact_cache = ArtifactCache()
+cold_storage = ColdStorage()
+artifact_urls = ArtifactURLService(cold_storage)
 
 # Request models
 class ConversionRequest(BaseModel):
@@ -45,9 +168,15 @@ def health_check():
         "status": "healthy",
         "service": "YouTube Conversion API",
         "rapidapi_configured": os.getenv("RAPIDAPI_KEY", "YOUR_RAPIDAPI_KEY") != "YOUR_RAPIDAPI_KEY",
-        "conversion_auth_configured": os.getenv("CONVERSION_API_KEY", "your-secret-conversion-key") != "your-secret-conversion-key"
+        "conversion_auth_configured": os.getenv("CONVERSION_API_KEY", "your-secret-conversion-key") != "your-secret-conversion-key",
+        "shared_state": shared_state.shared
     }
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+def metrics():
+    return metrics_response()
+
 # 📺 List user's uploaded videos
 @app.get("/list_user_videos")
 def list_user_videos(request: Request):
@@ -59,43 +188,60 @@ def list_user_videos(request: Request):
     
     try:
         # Validate token with comprehensive error handling
-        token_manager.validate_token(token)
+        token_info = token_manager.validate_token(token)
+        
+        # channels + playlistItems + videos
+        plan = quota_planner.plan(quota_user(token_info, token), interactive=True, estimated_units=3)
         
         # Step 1: get uploads playlist ID 
         try:
-            res = requests.get(
-                f"{YOUTUBE_API_URL}/channels",
-                params={
-                    "part": "contentDetails,snippet",
-                    "mine": "true"
-                },
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=30
-            )
-            
-            if res.status_code != 200:
-                error_detail = res.text
-                user_error = api_error_handler.get_user_friendly_error(res.status_code, error_detail)
-                raise HTTPException(status_code=res.status_code, detail=user_error)
-            
-            channel_data = res.json()
-            if not channel_data.get("items"):
-                raise HTTPException(status_code=404, detail="No YouTube channel found for this account")
-            
-            channel_info = channel_data["items"][0]
-            uploads_id = channel_info["contentDetails"]["relatedPlaylists"]["uploads"]
+            if plan.economy:
+                # Low on quota: reuse the cached channel lookup instead of spending a call
+                channel_info = channel_sync.channel(token, plan)
+                uploads_id = channel_info["uploads"]
+            else:
+                res = upstream_get(
+                    f"{YOUTUBE_API_URL}/channels",
+                    params={
+                        "part": "contentDetails,snippet",
+                        "mine": "true"
+                    },
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=30
+                )
+                plan.charge("channels", "contentDetails,snippet", res)
+                
+                if res.status_code != 200:
+                    error_detail = res.text
+                    user_error = api_error_handler.get_user_friendly_error(res.status_code, error_detail)
+                    raise HTTPException(status_code=res.status_code, detail=user_error)
+                
+                channel_data = res.json()
+                if not channel_data.get("items"):
+                    raise HTTPException(status_code=404, detail="No YouTube channel found for this account")
+                
+                channel_item = channel_data["items"][0]
+                channel_info = {
+                    "id": channel_item["id"],
+                    "title": channel_item["snippet"]["title"],
+                    "description": channel_item["snippet"]["description"],
+                    "publishedAt": channel_item["snippet"]["publishedAt"]
+                }
+                uploads_id = channel_item["contentDetails"]["relatedPlaylists"]["uploads"]
             
             # Step 2: get videos from playlist
-            res2 = requests.get(
+            playlist_parts = plan.parts("snippet,contentDetails", "snippet")
+            res2 = upstream_get(
                 f"{YOUTUBE_API_URL}/playlistItems",
                 params={
-                    "part": "snippet,contentDetails",
+                    "part": playlist_parts,
                     "playlistId": uploads_id,
                     "maxResults": 25
                 },
                 headers={"Authorization": f"Bearer {token}"},
                 timeout=30
             )
+            plan.charge("playlistItems", playlist_parts, res2)
             
             if res2.status_code != 200:
                 error_detail = res2.text
@@ -111,10 +257,10 @@ def list_user_videos(request: Request):
                 video_ids = [item["snippet"]["resourceId"]["videoId"] for item in video_items]
                 video_ids_str = ",".join(video_ids)
                 
-                print(f"[DEBUG] Checking privacy status for {len(video_ids)} videos")
+                logger.debug("Checking privacy status for %d videos", len(video_ids))
                 
                 # Get video details including privacy status
-                res3 = requests.get(
+                res3 = upstream_get(
                     f"{YOUTUBE_API_URL}/videos",
                     params={
                         "part": "status",
@@ -123,9 +269,12 @@ def list_user_videos(request: Request):
                     headers={"Authorization": f"Bearer {token}"},
                     timeout=30
                 )
+                plan.charge("videos", "status", res3)
                 
                 if res3.status_code != 200:
-                    print(f"[WARNING] Failed to get video privacy status: {res3.text}")
+                    logger.warning("Failed to get video privacy status", extra={"fields": {
+                        "status": res3.status_code, "body": res3.text
+                    }})
                     # Continue without filtering if privacy check fails
                     privacy_data = {"items": []}
                 else:
@@ -138,8 +287,6 @@ def list_user_videos(request: Request):
                     privacy_status = video_status.get("status", {}).get("privacyStatus", "unknown")
                     privacy_map[video_id] = privacy_status
                 
-                print(f"[DEBUG] Privacy status map: {privacy_map}")
-                
                 # Filter videos to only include public ones
                 public_videos = []
                 filtered_count = 0
@@ -152,33 +299,28 @@ def list_user_videos(request: Request):
                         public_videos.append(item)
                     else:
                         filtered_count += 1
-                        print(f"[DEBUG] Filtering out {privacy_status} video: {video_id} - {item['snippet']['title']}")
                 
-                print(f"[INFO] Privacy filtering results: {len(public_videos)} public videos, {filtered_count} private/unlisted videos filtered out")
+                logger.info("Privacy filtering results", extra={"fields": {
+                    "public_videos": len(public_videos), "filtered_out": filtered_count
+                }})
                 video_items = public_videos
             
             # Return structured response with channel info and only public videos
-            return {
+            return FastJSONResponse({
                 "channel": {
                     "id": channel_info["id"],
-                    "title": channel_info["snippet"]["title"],
-                    "description": channel_info["snippet"]["description"],
-                    "publishedAt": channel_info["snippet"]["publishedAt"]
+                    "title": channel_info["title"],
+                    "description": channel_info["description"],
+                    "publishedAt": channel_info["publishedAt"]
                 },
-                "videos": [{
-                    "videoId": item["snippet"]["resourceId"]["videoId"],
-                    "title": item["snippet"]["title"],
-                    "description": item["snippet"]["description"],
-                    "publishedAt": item["snippet"]["publishedAt"],
-                    "thumbnail": item["snippet"]["thumbnails"]["high"]["url"] if "high" in item["snippet"]["thumbnails"] else item["snippet"]["thumbnails"]["default"]["url"]
-                } for item in video_items],
+                "videos": video_fragments.fragments(video_items, video_version, video_entry),
                 "totalResults": len(video_items),  # Update to reflect filtered count
                 "nextPageToken": videos_data.get("nextPageToken"),
                 "privacyFiltered": {
                     "publicVideos": len(video_items),
                     "filteredOut": filtered_count if 'filtered_count' in locals() else 0
                 }
-            }
+            })
                 
         except HTTPException:
             raise
@@ -196,6 +338,71 @@ def list_user_videos(request: Request):
             detail=api_error_handler.get_user_friendly_error(500, str(e))
         )
 
+def enqueue_published(channel: dict, videos: list, user_id: str, content_type: str, quality: str) -> dict:
+    """Queue conversions for uploads that just became public"""
+    if not CONVERSION_API_URL:
+        return {"error": "CONVERSION_API_URL is not configured"}
+    try:
+        res = upstream_request(
+            "POST",
+            f"{CONVERSION_API_URL.rstrip('/')}/convert/batch",
+            json={
+                "user_id": user_id,
+                "videos": [{"video_id": video["videoId"], "content_type": content_type, "quality": quality,
+                            "title": video.get("title")} for video in videos]
+            },
+            # Per-video idempotency, so overlapping syncs don't queue a video twice
+            headers={"Idempotency-Key": f"channel-sync:{channel['id']}"},
+            timeout=10
+        )
+    except requests.exceptions.RequestException as e:
+        logger.warning("Auto-enqueue failed: %s", e)
+        return {"error": str(e)}
+    if res.status_code != 200:
+        logger.warning("Auto-enqueue rejected", extra={"fields": {"status": res.status_code, "body": res.text}})
+        return {"error": res.text, "status": res.status_code}
+    return res.json()
+
+# 🔄 Delta sync of the user's uploads: only additions, removals and privacy changes
+@app.get("/sync_user_videos")
+def sync_user_videos(
+    request: Request,
+    full: bool = Query(False, description="Ignore the stored state and re-list everything"),
+    enqueue: bool = Query(False, description="Queue conversions for uploads that became public (owned by the channel)"),
+    content_type: str = Query("audio", description="'audio' or 'video' for enqueued jobs"),
+    quality: str = Query("medium", description="Quality for enqueued jobs: low, medium, high"),
+    background: bool = Query(False, description="Scheduled sync: deferred (429) when quota runs low")
+):
+    auth = request.headers.get("Authorization")
+    if not auth or not auth.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+
+    # Per-process sync state would give every worker its own cursor, and each
+    # would enqueue the same delta again
+    if enqueue and not shared_state.shared:
+        raise HTTPException(status_code=503, detail="Auto-enqueue requires SHARED_STATE_URL")
+
+    token = auth.split(" ")[1]
+    token_info = token_manager.validate_token(token)
+    # channels (usually cached) + one playlist page + one privacy check
+    plan = quota_planner.plan(quota_user(token_info, token), interactive=not background, estimated_units=3)
+    
+    on_published = None
+    if enqueue:
+        # Jobs (and the podcast feed they land in) belong to the channel the token resolved to
+        def on_published(channel, videos):
+            return enqueue_published(channel, videos, channel["id"], content_type, quality)
+    
+    try:
+        return FastJSONResponse(channel_sync.sync(token, full=full, on_published=on_published, plan=plan))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to sync YouTube data: {str(e)}"
+        )
+
 # OLD CONVERSION METHODS REMOVED - NOW USING RAPIDAPI
 # The /api/rapidapi/convert endpoint below handles all conversions
 
@@ -212,10 +419,12 @@ def rapidapi_convert(request: ConversionRequest):
     
     rapidapi_key = os.getenv("RAPIDAPI_KEY", "YOUR_RAPIDAPI_KEY")
     
-    # Debug logging
-    print(f"[DEBUG] Converting video_id: {request.video_id}, content_type: {request.content_type}")
-    print(f"[DEBUG] RapidAPI key present: {'Yes' if rapidapi_key != 'YOUR_RAPIDAPI_KEY' else 'No'}")
-    print(f"[INFO] Request details - Quality: {request.quality}, Title: {request.title}")
+    logger.info("Conversion requested", extra={"fields": {
+        "video_id": request.video_id,
+        "content_type": request.content_type,
+        "quality": request.quality,
+        "rapidapi_configured": rapidapi_key != "YOUR_RAPIDAPI_KEY",
+    }})
     
     # Check for known problematic videos and provide specific error handling
     problematic_videos = {
@@ -224,7 +433,7 @@ def rapidapi_convert(request: ConversionRequest):
     }
     
     if request.video_id in problematic_videos:
-        print(f"[WARNING] Video {request.video_id} is known to cause issues: {problematic_videos[request.video_id]}")
+        logger.warning("Video %s is known to cause issues: %s", request.video_id, problematic_videos[request.video_id])
         # Still attempt conversion but with extra logging
     
     # Check if RapidAPI key is configured
@@ -240,19 +449,15 @@ def rapidapi_convert(request: ConversionRequest):
             audio_host = "youtube-mp3-audio-video-downloader.p.rapidapi.com"
             api_provider = "YouTube MP3 Audio Video downloader"
             
-            print(f"[DEBUG] Calling audio API: {audio_host}")
-            print(f"[DEBUG] Using endpoint: /get_m4a_download_link/{request.video_id}")
-            
             try:
-                download_response = requests.get(
-                    f"https://{audio_host}/get_m4a_download_link/{request.video_id}",
+                download_response = rapidapi_get(
+                    audio_host, f"/get_m4a_download_link/{request.video_id}",
                     headers={
                         "X-RapidAPI-Key": rapidapi_key,
                         "X-RapidAPI-Host": audio_host
                     },
                     timeout=90  # Increased timeout due to service issues
                 )
-                print(f"[DEBUG] Audio API response status: {download_response.status_code}")
                 
                 if download_response.status_code != 200:
                     error_detail = f"Audio conversion failed: {download_response.text}"
@@ -275,13 +480,13 @@ def rapidapi_convert(request: ConversionRequest):
                     )
                     
             except requests.exceptions.Timeout:
-                print(f"[ERROR] Audio API request timed out for: {request.video_id}")
+                logger.error("Audio API request timed out for %s", request.video_id)
                 raise HTTPException(
                     status_code=504,
                     detail=f"Audio conversion timed out - RapidAPI service may be slow. Please try again."
                 )
             except requests.exceptions.RequestException as e:
-                print(f"[ERROR] Audio API request failed: {e}")
+                logger.error("Audio API request failed: %s", e)
                 if "Read timed out" in str(e):
                     raise HTTPException(
                         status_code=504,
@@ -297,12 +502,9 @@ def rapidapi_convert(request: ConversionRequest):
             video_host = "youtube-video-fast-downloader-24-7.p.rapidapi.com"
             api_provider = "YouTube Video FAST Downloader 24/7"
             
-            print(f"[DEBUG] Calling video API: {video_host}")
-            print(f"[DEBUG] Using endpoint: /download_video/{request.video_id}")
-            
             try:
-                download_response = requests.get(
-                    f"https://{video_host}/download_video/{request.video_id}",
+                download_response = rapidapi_get(
+                    video_host, f"/download_video/{request.video_id}",
                     params={"quality": request.quality},
                     headers={
                         "X-RapidAPI-Key": rapidapi_key,
@@ -310,7 +512,6 @@ def rapidapi_convert(request: ConversionRequest):
                     },
                     timeout=90  # Increased timeout due to service issues
                 )
-                print(f"[DEBUG] Video API response status: {download_response.status_code}")
                 
                 if download_response.status_code != 200:
                     error_detail = f"Video conversion failed: {download_response.text}"
@@ -333,13 +534,13 @@ def rapidapi_convert(request: ConversionRequest):
                     )
                     
             except requests.exceptions.Timeout:
-                print(f"[ERROR] Video API request timed out for: {request.video_id}")
+                logger.error("Video API request timed out for %s", request.video_id)
                 raise HTTPException(
                     status_code=504,
                     detail=f"Video conversion timed out - RapidAPI service may be slow. Please try again."
                 )
             except requests.exceptions.RequestException as e:
-                print(f"[ERROR] Video API request failed: {e}")
+                logger.error("Video API request failed: %s", e)
                 if "Read timed out" in str(e):
                     raise HTTPException(
                         status_code=504,
@@ -351,19 +552,23 @@ def rapidapi_convert(request: ConversionRequest):
                 )
         
         # Handle response from either API
-        print(f"[DEBUG] API response status: {download_response.status_code}")
-        print(f"[DEBUG] API response headers: {dict(download_response.headers)}")
-        print(f"[DEBUG] Response content length: {len(download_response.content) if download_response.content else 0}")
-        print(f"[DEBUG] Response text preview: {download_response.text[:200] if download_response.text else 'No text'}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Upstream response", extra={"fields": {
+                "provider": api_provider,
+                "status": download_response.status_code,
+                "headers": dict(download_response.headers),
+                "content_length": len(download_response.content or b""),
+            }})
         
         if download_response.status_code == 200:
             try:
                 data = download_response.json()
-                print(f"[DEBUG] API response data keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
-                print(f"[DEBUG] Full API response data: {data}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Upstream response body", extra={"fields": {"body": data}})
             except Exception as json_error:
-                print(f"[ERROR] Failed to parse JSON response: {json_error}")
-                print(f"[ERROR] Raw response: {download_response.text[:500]}")
+                logger.error("Failed to parse JSON response", extra={"fields": {
+                    "error": str(json_error), "body": download_response.text
+                }})
                 raise HTTPException(
                     status_code=502,
                     detail=f"Invalid JSON response from {api_provider}: {json_error}"
@@ -382,7 +587,7 @@ def rapidapi_convert(request: ConversionRequest):
                 "duration": video_info.get("duration") or data.get("duration"),
                 "fileSize": data.get("file_size") or data.get("size"),
                 "quality": data.get("quality", request.quality),
-                "format": data.get("format") or ("mp3" if request.content_type.lower() == "audio" else "mp4"),
+                "format": data.get("format") or ("m4a" if request.content_type.lower() == "audio" else "mp4"),
                 "thumbnail": video_info.get("thumbnail") or data.get("thumbnail"),
                 "processedAt": datetime.utcnow().isoformat(),
                 "apiProvider": api_provider,
@@ -410,43 +615,71 @@ def rapidapi_convert(request: ConversionRequest):
             )
             
     except requests.exceptions.Timeout:
-        print(f"[ERROR] Timeout error for video_id: {request.video_id}")
+        logger.error("Timeout error for video_id %s", request.video_id)
         raise HTTPException(
             status_code=504,
             detail=f"Video conversion timed out for {request.video_id}. The RapidAPI service may be experiencing delays. Please try again in a few minutes."
         )
     except requests.exceptions.RequestException as e:
-        print(f"[ERROR] Request error for video_id: {request.video_id}, error: {str(e)}")
+        logger.error("Request error for video_id %s: %s", request.video_id, e)
         raise HTTPException(
             status_code=502,
             detail=f"External API request failed: {str(e)}"
         )
     except HTTPException as http_exc:
         # Re-raise HTTPExceptions with more detail
-        print(f"[ERROR] HTTPException for video_id: {request.video_id}")
-        print(f"[ERROR] Status: {http_exc.status_code}, Detail: {http_exc.detail}")
+        logger.error("Conversion failed for video_id %s", request.video_id, extra={"fields": {
+            "status": http_exc.status_code, "detail": http_exc.detail
+        }})
         raise http_exc
     except Exception as e:
         error_msg = str(e) if str(e) else f"Unknown error: {type(e).__name__}"
-        print(f"[ERROR] Unexpected error for video_id: {request.video_id}, error: {error_msg}")
-        print(f"[ERROR] Exception type: {type(e)}")
-        print(f"[ERROR] Exception args: {e.args}")
-        # Add more debugging for HTTPExceptions caught here
-        if isinstance(e, HTTPException):
-            print(f"[ERROR] This was an HTTPException with status: {e.status_code}, detail: {e.detail}")
+        logger.exception("Unexpected error for video_id %s: %s", request.video_id, error_msg)
         raise HTTPException(
             status_code=500,
             detail=f"Conversion service error: {error_msg}"
         )
 
-# 📥 Serve previously downloaded file  
-@app.get("/download/{filename}")
-def download(filename: str):
-    downloads_dir = os.path.join(os.getcwd(), "downloads")
-    file_path = os.path.join(downloads_dir, filename)
-    if not os.path.exists(file_path):
+def fill_artifact_cache(filename: str):
+    """Pull an artifact from S3 into the hot tier after a cache miss"""
+    try:
+        artifact_cache.fill(filename, lambda dest: cold_storage.download(artifact_key(filename), dest))
+    except Exception as e:
+        logger.warning("Failed to fill artifact cache for %s: %s", filename, e)
+
+# 📥 Serve a converted file - local cache first, S3 presigned redirect on a miss
+# Supports Range/If-Range for seeking players and ETag/Last-Modified revalidation
+@app.api_route("/download/{filename}", methods=["GET", "HEAD"])
+def download(filename: str, request: Request, background_tasks: BackgroundTasks,
+             sig: str = Query(None, description="Signature from the feed or job that issued the link"),
+             exp: str = Query(None, description="Unix time the signature expires")):
+    # Links are capabilities handed out by the conversion API (feeds); unsigned
+    # requests would let anyone mint signed URLs into the private bucket
+    if not download_allowed(filename, sig, exp):
+        raise HTTPException(status_code=403, detail="Invalid, expired or missing download signature")
+
+    try:
+        file_path = artifact_cache.get(filename)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    CACHE_EVENTS.labels("artifact", "hit" if file_path else "miss").inc()
+    if file_path:
+        try:
+            return MediaFileResponse(file_path, request.headers, method=request.method, filename=filename)
+        except FileNotFoundError:
+            # Evicted between lookup and open - fall through to the cold tier
+            pass
+
+    try:
+        url = artifact_urls.url_for_existing(artifact_key(filename))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Storage unavailable: {str(e)}")
+    if url is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type="video/mp4", filename=filename)
+
+    background_tasks.add_task(fill_artifact_cache, filename)
+    return RedirectResponse(url, status_code=302)
 
 # Run the server
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import math
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from lib.admission import HEARTBEAT_KEY, WORKER_HEARTBEAT_TTL, AdmissionController
+
+pytestmark = pytest.mark.anyio
+
+
+def snapshot(slots=2, busy=2, service=60.0):
+    return {"slots": slots, "busy_slots": busy, "free_slots": slots - busy, "service_seconds": service}
+
+
+def test_no_wait_while_a_slot_is_free():
+    assert AdmissionController.estimated_wait(snapshot(slots=4, busy=2), jobs_ahead=1) == 0.0
+
+
+def test_wait_counts_in_flight_jobs_as_half_done():
+    # (3 queued + 2 busy / 2) x 60s over 2 slots
+    assert AdmissionController.estimated_wait(snapshot(), jobs_ahead=3) == 120.0
+
+
+def test_wait_is_infinite_without_workers():
+    assert AdmissionController.estimated_wait(snapshot(slots=0, busy=0), jobs_ahead=0) == math.inf
+
+
+async def admission_with(redis, queued=0, priority=0, workers=(), service=None, max_wait=600):
+    admission = AdmissionController(redis, max_wait_seconds=max_wait)
+    for n in range(queued):
+        await redis.lpush("conversion_queue", f"q{n}")
+    for n in range(priority):
+        await redis.lpush("priority_queue", f"p{n}")
+    for n, (slots, busy) in enumerate(workers):
+        await admission.heartbeat(slots, busy, ident=f"w{n}")
+    for seconds in service or ():
+        await admission.record_service_time(seconds)
+    return admission
+
+
+async def test_admits_when_capacity_is_free(redis):
+    admission = await admission_with(redis, workers=[(1, 0)])
+    await admission.admit()
+
+
+async def test_busy_workers_still_count_as_capacity(redis):
+    admission = await admission_with(redis, queued=1, workers=[(1, 1)], service=[100])
+    assert await admission.current_wait() == 150.0
+    await admission.admit()
+
+
+async def test_rejects_with_retry_after_past_the_slo(redis):
+    # (10 ahead + 2 more + 1 busy / 2) x 100s = 1250s, 650s over the SLO
+    admission = await admission_with(redis, queued=10, workers=[(1, 1)], service=[100], max_wait=600)
+    with pytest.raises(HTTPException) as error:
+        await admission.admit(count=3)
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "650"
+
+
+async def test_priority_jobs_only_wait_behind_priority_jobs(redis):
+    admission = await admission_with(redis, queued=50, priority=1, workers=[(1, 1)], service=[100])
+    await admission.admit(priority=True)
+    with pytest.raises(HTTPException):
+        await admission.admit()
+
+
+async def test_no_live_workers_is_503(redis):
+    admission = await admission_with(redis)
+    await redis.hset(HEARTBEAT_KEY, "dead", f"{time.time() - WORKER_HEARTBEAT_TTL - 1:.0f} 1 0")
+    with pytest.raises(HTTPException) as error:
+        await admission.admit()
+    assert error.value.status_code == 503
+    # Stale heartbeats are dropped
+    assert await redis.hgetall(HEARTBEAT_KEY) == {}
+
+
+async def test_malformed_heartbeats_are_dropped(redis):
+    admission = await admission_with(redis, workers=[(2, 1)])
+    await redis.hset(HEARTBEAT_KEY, "garbled", f"{time.time():.0f} 2")
+    current = await admission.snapshot()
+    assert (current["workers"], current["slots"], current["busy_slots"]) == (1, 2, 1)
+    assert list(await redis.hgetall(HEARTBEAT_KEY)) == ["w0"]
+
+
+async def test_retired_workers_stop_counting(redis):
+    admission = await admission_with(redis, workers=[(1, 0)])
+    await admission.retire(ident="w0")
+    assert (await admission.snapshot(refresh=True))["slots"] == 0
+
+
+async def test_autoscale_covers_arrivals_and_backlog(redis):
+    admission = await admission_with(redis, queued=20, workers=[(1, 1)], service=[60])
+    result = await admission.autoscale()
+    # No arrivals yet: backlog of 20 x 60s drained within AUTOSCALE_DRAIN_SECONDS (600)
+    assert result["desired_workers"] == 2
+    assert result["busy_slots"] == 1 and result["free_slots"] == 0
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from lib.artifact_cache import ArtifactCache
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def age_markers(cache, names):
+    """Pretend `names` were last used in this order, long ago"""
+    for n, name in enumerate(names):
+        os.utime(cache._used_marker(name), (1000 + n, 1000 + n))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ArtifactCache(str(tmp_path / "cache"), max_bytes=30)
+
+
+def test_evicts_least_recently_used_first(cache, tmp_path):
+    for name in ("a.m4a", "b.m4a", "c.m4a"):
+        cache.put(name, write(tmp_path / name, 10))
+    age_markers(cache, ["a.m4a", "b.m4a", "c.m4a"])
+
+    # A hit makes "a" the most recent, so "b" is now the oldest
+    assert cache.get("a.m4a")
+    cache.put("d.m4a", write(tmp_path / "d.m4a", 10))
+
+    assert cache.get("b.m4a") is None
+    assert not os.path.exists(cache._used_marker("b.m4a"))
+    assert all(cache.get(name) for name in ("a.m4a", "c.m4a", "d.m4a"))
+    assert cache.usage() == 30
+
+
+def test_evicts_as_many_entries_as_needed(cache, tmp_path):
+    for name in ("a.m4a", "b.m4a", "c.m4a"):
+        cache.put(name, write(tmp_path / name, 10))
+    age_markers(cache, ["c.m4a", "a.m4a", "b.m4a"])
+
+    cache.put("big.m4a", write(tmp_path / "big.m4a", 25))
+
+    assert [cache.get(name) is not None for name in ("a.m4a", "b.m4a", "c.m4a")] == [False, False, False]
+    assert cache.usage() == 25
+
+
+def test_touching_an_evicted_entry_leaves_no_marker(cache):
+    # get() found the file, then another process evicted it before the touch
+    assert not cache._touch("gone.m4a")
+    assert not os.path.exists(cache._used_marker("gone.m4a"))
+
+
+def test_eviction_sweeps_orphan_markers(cache, tmp_path):
+    write(cache._used_marker("gone.m4a"), 0)
+    cache.put("a.m4a", write(tmp_path / "a.m4a", 10))
+    assert not os.path.exists(cache._used_marker("gone.m4a"))
+    assert os.path.exists(cache._used_marker("a.m4a"))
+
+
+def test_hit_keeps_artifact_mtime(cache, tmp_path):
+    path = cache.put("a.m4a", write(tmp_path / "a.m4a", 10))
+    os.utime(path, (1000, 1000))
+
+    cache.get("a.m4a")
+
+    # mtime feeds the ETag and Last-Modified of /download responses
+    assert os.stat(path).st_mtime == 1000
+
+
+def test_untouched_entries_fall_back_to_mtime(cache, tmp_path):
+    for name in ("a.m4a", "b.m4a"):
+        cache.put(name, write(tmp_path / name, 15))
+        os.unlink(cache._used_marker(name))
+    os.utime(os.path.join(cache.cache_dir, "a.m4a"), (2000, 2000))
+    os.utime(os.path.join(cache.cache_dir, "b.m4a"), (1000, 1000))
+
+    cache.put("c.m4a", write(tmp_path / "c.m4a", 15))
+
+    assert cache.get("b.m4a") is None
+    assert cache.get("a.m4a")
+
+
+def test_oversized_file_is_dropped(cache, tmp_path):
+    src = write(tmp_path / "huge.m4a", 31)
+    assert cache.put("huge.m4a", src) is None
+    assert not os.path.exists(src)
+    assert cache.usage() == 0
+
+
+@pytest.mark.parametrize("name", ["", ".lock", "../etc/passwd", "a/b.m4a", "a\x00.m4a"])
+def test_rejects_names_outside_the_cache(cache, name):
+    with pytest.raises(ValueError):
+        cache.path_for(name)
@@ -0,0 +1,33 @@
+import pytest
+from fastapi import HTTPException
+
+from lib.audio_formats import DEFAULT_AUDIO_FORMAT, build_audio_options, resolve_audio_format
+
+
+def test_resolve_defaults_and_normalises():
+    assert resolve_audio_format(None) == DEFAULT_AUDIO_FORMAT
+    assert resolve_audio_format("MP3") == "mp3"
+
+
+def test_resolve_rejects_unknown_formats():
+    with pytest.raises(HTTPException) as error:
+        resolve_audio_format("flac")
+    assert error.value.status_code == 400
+
+
+def test_native_formats_prefer_a_stream_copy():
+    options = build_audio_options("m4a", "medium")
+    assert options["format"] == "ba[ext=m4a][abr<=192]/ba[ext=m4a]/ba[abr<=192]/ba/best"
+    assert options["postprocessors"] == [{"key": "FFmpegExtractAudio", "preferredcodec": "m4a"}]
+    assert (options["ext"], options["mime"]) == ("m4a", "audio/mp4")
+
+
+def test_high_quality_has_no_bitrate_cap():
+    assert build_audio_options("opus", "high")["format"] == "ba[acodec=opus]/ba[acodec=opus]/ba/ba/best"
+
+
+def test_mp3_reencodes_at_the_quality_bitrate():
+    options = build_audio_options("mp3", "low")
+    assert options["format"] == "ba[abr<=128]/best[abr<=128]"
+    assert options["postprocessors"][0]["preferredquality"] == "128"
+    assert build_audio_options("mp3", "high")["postprocessors"][0]["preferredquality"] == "320"
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from lib.channel_sync import ChannelSync
+from lib.shared_state import LocalBackend, SharedState
+
+OLD = "2020-01-01T00:00:00Z"
+
+
+def recent():
+    return (datetime.now(timezone.utc) - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeYouTube:
+    """Uploads playlist (newest first) and privacy statuses behind ChannelSync._get"""
+
+    def __init__(self, page_size=2):
+        self.videos = []
+        self.page_size = page_size
+        self.calls = []
+
+    def add(self, video_id, privacy="public", published=OLD):
+        self.videos.insert(0, {"id": video_id, "privacy": privacy, "published": published})
+
+    def etag(self):
+        return "etag-" + ",".join(video["id"] for video in self.videos)
+
+    def get(self, path, token, params, plan=None, etag=None):
+        self.calls.append(path)
+        if path == "channels":
+            return {"items": [{
+                "id": "UC1",
+                "snippet": {"title": "Channel", "description": "", "publishedAt": OLD},
+                "contentDetails": {"relatedPlaylists": {"uploads": "UU1"}},
+            }]}
+        if path == "playlistItems":
+            if etag == self.etag():
+                return None
+            start = int(params.get("pageToken", 0))
+            page = self.videos[start:start + self.page_size]
+            data = {
+                "etag": self.etag(),
+                "pageInfo": {"totalResults": len(self.videos)},
+                "items": [{"snippet": {
+                    "resourceId": {"videoId": video["id"]}, "title": video["id"], "publishedAt": video["published"],
+                }} for video in page],
+            }
+            if start + self.page_size < len(self.videos):
+                data["nextPageToken"] = str(start + self.page_size)
+            return data
+        if path == "videos":
+            wanted = params["id"].split(",")
+            return {"items": [{"id": video["id"], "status": {"privacyStatus": video["privacy"]}}
+                              for video in self.videos if video["id"] in wanted]}
+        raise AssertionError(path)
+
+
+@pytest.fixture
+def youtube(monkeypatch):
+    fake = FakeYouTube()
+    for video_id in ("v1", "v2", "v3"):
+        fake.add(video_id)
+    return fake
+
+
+@pytest.fixture
+def sync(youtube, monkeypatch):
+    channel_sync = ChannelSync(SharedState(LocalBackend()), "https://youtube.invalid")
+    monkeypatch.setattr(channel_sync, "_get", youtube.get)
+    return channel_sync
+
+
+def test_first_sync_is_a_baseline(sync):
+    published = []
+    result = sync.sync("token", on_published=lambda channel, videos: published.append(videos))
+    assert result["baseline"] and result["trackedVideos"] == 3
+    assert published == []
+
+
+def test_unchanged_playlist_costs_one_conditional_request(sync, youtube):
+    sync.sync("token")
+    youtube.calls.clear()
+    result = sync.sync("token")
+    assert youtube.calls == ["playlistItems"]
+    assert (result["additions"], result["removals"], result["privacyChanges"]) == ([], [], [])
+
+
+def test_additions_page_only_until_a_known_video(sync, youtube):
+    sync.sync("token")
+    youtube.add("v4")
+    youtube.add("v5", privacy="private")
+    youtube.calls.clear()
+
+    published = []
+    result = sync.sync("token", on_published=lambda channel, videos: published.append(videos) or "queued")
+    assert [video["videoId"] for video in result["additions"]] == ["v5", "v4"]
+    assert youtube.calls.count("playlistItems") == 2
+    assert [video["videoId"] for video in published[0]] == ["v4"]
+    assert result["enqueued"] == "queued"
+
+
+def test_failed_enqueues_are_retried_on_the_next_sync(sync, youtube):
+    sync.sync("token")
+    youtube.add("v4")
+
+    published = []
+    result = sync.sync("token", on_published=lambda channel, videos: published.append(videos) or {"error": "429"})
+    assert result["enqueued"] == {"error": "429"}
+    # Nothing changed upstream, but the failed upload is offered again
+    result = sync.sync("token", on_published=lambda channel, videos: published.append(videos) or "queued")
+    assert result["additions"] == [] and result["enqueued"] == "queued"
+    assert [[video["videoId"] for video in videos] for videos in published] == [["v4"], ["v4"]]
+    assert sync.sync("token", on_published=lambda channel, videos: published.append(videos))["enqueued"] is None
+    assert len(published) == 2
+
+
+def test_removals_trigger_a_relist(sync, youtube):
+    sync.sync("token")
+    youtube.videos = [video for video in youtube.videos if video["id"] != "v1"]
+    youtube.add("v4")
+    result = sync.sync("token")
+    assert [video["videoId"] for video in result["additions"]] == ["v4"]
+    assert result["removals"] == ["v1"]
+
+
+def test_recent_uploads_are_rechecked_for_privacy(sync, youtube):
+    youtube.add("fresh", privacy="unlisted", published=recent())
+    sync.sync("token")
+    youtube.videos[0]["privacy"] = "public"
+
+    published = []
+    result = sync.sync("token", on_published=lambda channel, videos: published.append(videos))
+    assert result["privacyChanges"] == [{"videoId": "fresh", "from": "unlisted", "to": "public"}]
+    assert published == [[{"videoId": "fresh"}]]
+    # Old uploads checked within CHANNEL_SYNC_RECHECK_SECONDS are skipped
+    assert result["privacyChecked"] == 1
+
+
+def test_state_is_shared_through_the_backend(youtube, monkeypatch):
+    state = SharedState(LocalBackend())
+    first, second = ChannelSync(state), ChannelSync(state)
+    monkeypatch.setattr(first, "_get", youtube.get)
+    monkeypatch.setattr(second, "_get", youtube.get)
+    first.sync("token")
+    youtube.add("v4")
+    assert [video["videoId"] for video in first.sync("token")["additions"]] == ["v4"]
+    # A second process sees the cursor the first one stored
+    assert second.sync("token")["additions"] == []
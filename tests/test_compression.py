@@ -0,0 +1,100 @@
+import pytest
+from fastapi import FastAPI
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.testclient import TestClient
+
+from lib import compression
+from lib.compression import CompressionMiddleware, compressible, negotiate_encoding
+from lib.json_response import FastJSONResponse, dumps
+
+brotli = pytest.importorskip("brotli")
+
+BIG = {"items": [{"id": n, "text": "hello world " * 4} for n in range(100)]}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, *", "gzip"),
+    ("*", "br"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("gzip;q=abc, br", "br"),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+def test_negotiation_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert negotiate_encoding("br, gzip") == "gzip"
+    assert negotiate_encoding("br") is None
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ("application/json", True),
+    ("text/html; charset=utf-8", True),
+    ("application/rss+xml; charset=utf-8", True),
+    ("audio/mp4", False),
+    ("", False),
+])
+def test_compressible(content_type, expected):
+    assert compressible(content_type) is expected
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/big")
+    def big():
+        return FastJSONResponse(BIG, headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/media")
+    def media():
+        return Response(b"x" * 5000, media_type="audio/mp4")
+
+    @app.get("/partial")
+    def partial():
+        return PlainTextResponse("x" * 5000, status_code=206)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([b"a" * 3000, b"b" * 3000]), media_type="text/plain")
+
+    return TestClient(app)
+
+
+def test_brotli_and_gzip_bodies(client):
+    r = client.get("/big", headers={"Accept-Encoding": "br"}, )
+    assert r.headers["content-encoding"] == "br"
+    assert r.json() == BIG
+    assert int(r.headers["content-length"]) < len(dumps(BIG))
+
+    r = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json() == BIG
+
+
+def test_compressed_responses_get_weak_etags(client):
+    assert client.get("/big", headers={"Accept-Encoding": "gzip"}).headers["etag"] == 'W/"v1"'
+    assert client.get("/big", headers={"Accept-Encoding": "identity"}).headers["etag"] == '"v1"'
+
+
+def test_identity_still_varies_on_accept_encoding(client):
+    r = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.headers["vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("path", ["/small", "/media", "/partial", "/stream"])
+def test_passthrough(client, path):
+    r = client.get(path, headers={"Accept-Encoding": "br, gzip"})
+    assert "content-encoding" not in r.headers
@@ -0,0 +1,341 @@
+import os
+import sys
+import asyncio
+import functools
+import tempfile
+import types
+
+os.environ.setdefault("ARTIFACT_CACHE_DIR", tempfile.mkdtemp(prefix="test-artifacts-"))
+
+import httpx
+import pytest
+
+from benchmarks.serve_conversion import load_conversion_api
+from lib.admission import AdmissionController
+from lib.artifact_cache import ArtifactCache
+from lib.feeds import FeedStore
+from lib.job_control import JobControl
+from lib.job_store import JobStore
+from lib.metrics import InstrumentedRedis
+from lib.partials import PartialDownloads
+from lib.temp_space import TempSpaceBudget
+
+api = load_conversion_api()
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeYoutubeDL:
+    """yt_dlp.YoutubeDL stand-in that 'downloads' a few bytes to outtmpl"""
+
+    downloads = []
+
+    def __init__(self, opts):
+        self.opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        return {"id": url.rsplit("=", 1)[-1], "title": "Stub video", "duration": 60, "filesize": 10, "ext": "mp4"}
+
+    def process_ie_result(self, info, download=True):
+        for hook in self.opts["progress_hooks"]:
+            hook({"status": "downloading"})
+        path = self.opts["outtmpl"] % {"ext": info["ext"]}
+        with open(path, "wb") as f:
+            f.write(b"x" * info["filesize"])
+        FakeYoutubeDL.downloads.append(info["id"])
+        return info
+
+
+@pytest.fixture
+def yt_dlp(monkeypatch):
+    class DownloadCancelled(Exception):
+        pass
+
+    utils = types.SimpleNamespace(DownloadCancelled=DownloadCancelled)
+    module = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL, utils=utils)
+    monkeypatch.setitem(sys.modules, "yt_dlp", module)
+    FakeYoutubeDL.downloads = []
+    return FakeYoutubeDL
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    keys = []
+    monkeypatch.setattr(api.cold_storage, "upload", lambda file_path, key, mime_type: keys.append(key))
+    return keys
+
+
+@pytest.fixture
+async def conversion(redis, monkeypatch, tmp_path):
+    """The conversion API module wired to fakeredis and throwaway scratch dirs"""
+    client = InstrumentedRedis(redis)
+    temp_dir = tmp_path / "conversions"
+    temp_dir.mkdir()
+    partials = PartialDownloads(str(tmp_path / "partials"))
+    monkeypatch.setattr(api, "redis_client", client)
+    monkeypatch.setattr(api, "job_store", JobStore(client))
+    monkeypatch.setattr(api, "admission", AdmissionController(client))
+    monkeypatch.setattr(api, "feeds", FeedStore(client))
+    monkeypatch.setattr(api, "TEMP_DIR", str(temp_dir))
+    monkeypatch.setattr(api, "partials", partials)
+    monkeypatch.setattr(api, "temp_space", TempSpaceBudget(str(temp_dir), budget_bytes=10 ** 6, headroom_bytes=0,
+                                                          partials_dir=partials.directory))
+    monkeypatch.setattr(api, "artifact_cache", ArtifactCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(api.conversion_api, "active_jobs", 0)
+    return api
+
+
+@pytest.fixture
+async def http(conversion):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=conversion.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def worker_up(conversion):
+    await conversion.admission.heartbeat(slots=1, busy=0, ident="w0")
+
+
+async def convert(http, video_id="v1", key=None, **params):
+    headers = {"Idempotency-Key": key} if key else {}
+    return await http.post("/convert", params=dict({"video_id": video_id, "content_type": "video"}, **params),
+                           headers=headers)
+
+
+async def submit(conversion, video_id="v1", user_id=None, **fields):
+    """Queue a job directly, as /convert would, without admission control"""
+    job_id = f"job-{video_id}"
+    await conversion.job_store.create(job_id, dict({
+        "video_id": video_id, "content_type": "video", "quality": "medium", "audio_format": "", "user_id": user_id,
+    }, **fields))
+    await conversion.redis_client.lpush("conversion_queue", job_id)
+    return job_id
+
+
+async def status(conversion, job_id):
+    return (await conversion.job_store.get(job_id))["status"]
+
+
+# Submission
+
+async def test_retries_with_an_idempotency_key_get_the_same_job(http, worker_up):
+    first = await convert(http, key="n8n-run-1")
+    assert first.status_code == 200 and "duplicate" not in first.json()
+    retry = await convert(http, key="n8n-run-1")
+    assert retry.json() == {"job_id": first.json()["job_id"], "status": "queued", "duplicate": True}
+    other = await convert(http, key="n8n-run-2")
+    assert other.json()["job_id"] != first.json()["job_id"]
+    assert await api.redis_client.llen("conversion_queue") == 2
+
+
+async def test_a_failed_job_can_be_resubmitted_under_its_key(http, worker_up):
+    first = (await convert(http, key="k")).json()["job_id"]
+    await api.job_store.transition(first, "failed", error="boom")
+    retry = await convert(http, key="k")
+    assert retry.json()["job_id"] != first
+
+
+async def test_batch_retries_report_duplicates(http, worker_up):
+    batch = {"user_id": "u1", "videos": [{"video_id": "a", "content_type": "video"},
+                                         {"video_id": "b", "content_type": "video"}]}
+    first = (await http.post("/convert/batch", json=batch, headers={"Idempotency-Key": "b1"})).json()
+    retry = (await http.post("/convert/batch", json=batch, headers={"Idempotency-Key": "b1"})).json()
+    assert retry["job_ids"] == first["job_ids"]
+    assert (first["duplicates"], retry["duplicates"]) == (0, 2)
+
+
+async def test_no_live_workers_is_503_with_retry_after(http):
+    r = await convert(http)
+    assert r.status_code == 503
+    assert int(r.headers["retry-after"]) > 0
+    assert await api.redis_client.llen("conversion_queue") == 0
+
+
+async def test_full_queue_is_429_with_retry_after(http, conversion, monkeypatch):
+    monkeypatch.setattr(conversion, "admission", AdmissionController(conversion.redis_client, max_wait_seconds=100))
+    await conversion.admission.heartbeat(slots=1, busy=1, ident="w0")
+    await conversion.admission.record_service_time(60)
+    for n in range(5):
+        await conversion.redis_client.lpush("conversion_queue", f"q{n}")
+    r = await convert(http)
+    assert r.status_code == 429
+    assert int(r.headers["retry-after"]) > 0
+
+
+async def test_refused_retries_still_get_the_accepted_job(http, conversion):
+    await conversion.admission.heartbeat(slots=1, busy=0, ident="w0")
+    accepted = (await convert(http, key="k")).json()["job_id"]
+    await conversion.admission.retire(ident="w0")
+    await conversion.admission.snapshot(refresh=True)
+    retry = await convert(http, key="k")
+    assert retry.status_code == 200 and retry.json()["job_id"] == accepted
+    assert (await convert(http, key="other")).status_code == 503
+
+
+# Cancellation and listing
+
+async def test_cancel_route(http, conversion):
+    job_id = await submit(conversion)
+    r = await http.delete(f"/status/{job_id}")
+    assert r.json() == {"job_id": job_id, "status": "cancelled", "previous_status": "queued"}
+    assert (await http.delete(f"/status/{job_id}")).status_code == 409
+    assert (await http.delete("/status/nope")).status_code == 404
+
+
+async def test_cancel_user_jobs_skips_finished_ones(http, conversion):
+    live = await submit(conversion, "a", user_id="u1")
+    done = await submit(conversion, "b", user_id="u1")
+    await conversion.job_store.transition(done, "completed", progress=100)
+    r = await http.delete("/users/u1/jobs")
+    assert r.json() == {"user_id": "u1", "cancelled": 1}
+    assert await status(conversion, live) == "cancelled"
+    assert await status(conversion, done) == "completed"
+
+
+async def test_list_rejects_a_malformed_cursor(http, conversion):
+    await submit(conversion, user_id="u1")
+    assert (await http.get("/users/u1/jobs")).json()["jobs"][0]["video_id"] == "v1"
+    r = await http.get("/users/u1/jobs", params={"cursor": "garbage"})
+    assert r.status_code == 400
+
+
+# Worker
+
+async def test_job_completes_and_lands_in_the_hot_tier(conversion, yt_dlp, uploads):
+    job_id = await submit(conversion, user_id="u1")
+    assert await conversion.conversion_api.process_video(job_id) == "conversions/v1-medium.mp4"
+    job = await conversion.job_store.get(job_id)
+    assert (job["status"], job["artifact_key"]) == ("completed", "conversions/v1-medium.mp4")
+    assert uploads == ["conversions/v1-medium.mp4"]
+    assert conversion.artifact_cache.get("v1-medium.mp4")
+    assert (await conversion.feeds.validators("u1")) is not None
+    # Scratch space and the reservation are released
+    assert os.listdir(conversion.TEMP_DIR) == [".reservations"]
+    assert conversion.temp_space.available() == 10 ** 6
+
+
+async def test_hot_tier_failure_leaves_the_job_completed(conversion, yt_dlp, uploads, monkeypatch):
+    def full_disk(name, src_path):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(conversion.artifact_cache, "put", full_disk)
+    job_id = await submit(conversion)
+    await conversion.conversion_api.process_video(job_id)
+    assert await status(conversion, job_id) == "completed"
+
+
+async def test_scratch_space_exhaustion_requeues_the_job(conversion, yt_dlp, uploads, monkeypatch):
+    space = TempSpaceBudget(conversion.TEMP_DIR, budget_bytes=1, headroom_bytes=0)
+    monkeypatch.setattr(space, "reserve", functools.partial(space.reserve, timeout=0))
+    monkeypatch.setattr(conversion, "temp_space", space)
+    job_id = await submit(conversion)
+    assert await conversion.redis_client.rpop("conversion_queue") == job_id
+
+    assert await conversion.conversion_api.process_video(job_id) is None
+    assert await status(conversion, job_id) == "queued"
+    assert await conversion.redis_client.lrange("conversion_queue", 0, -1) == [job_id]
+    assert uploads == []
+
+
+async def test_preempted_job_goes_back_to_the_front(conversion, yt_dlp, uploads):
+    job_id = await submit(conversion, "a")
+    await conversion.redis_client.rpop("conversion_queue")
+    await submit(conversion, "b")
+    control = JobControl(job_id, preemptible=True)
+    control.stop("preempted")
+
+    assert await conversion.conversion_api.process_video(job_id, control) is None
+    assert await status(conversion, job_id) == "queued"
+    # RPUSH: the next BRPOP takes it before the job that was already waiting
+    assert await conversion.redis_client.rpop("conversion_queue") == job_id
+    assert yt_dlp.downloads == [] and uploads == []
+
+
+async def test_cancel_wins_over_preemption(conversion, yt_dlp, uploads):
+    job_id = await submit(conversion)
+    await conversion.redis_client.rpop("conversion_queue")
+    await conversion.job_store.cancel([job_id])
+    control = JobControl(job_id, preemptible=True)
+    control.stop("preempted")
+
+    assert await conversion.conversion_api.process_video(job_id, control) is None
+    assert await status(conversion, job_id) == "cancelled"
+    assert await conversion.redis_client.llen("conversion_queue") == 0
+    assert not await conversion.job_store.is_cancelled(job_id)
+
+
+async def test_job_cancelled_during_upload_is_not_completed(conversion, yt_dlp, monkeypatch):
+    job_id = await submit(conversion)
+    control = JobControl(job_id)
+
+    async def upload_then_cancel(file_path, video_id, quality):
+        await conversion.job_store.cancel([job_id])
+        return "conversions/v1-medium.mp4"
+
+    monkeypatch.setattr(conversion.conversion_api, "upload_to_storage", upload_then_cancel)
+    assert await conversion.conversion_api.process_video(job_id, control) is None
+    assert await status(conversion, job_id) == "cancelled"
+
+
+async def run_worker_until(conversion, monkeypatch, done):
+    """
+    Run worker_loop until `done()` is true, then stop it while it idles
+
+    Cancelling it inside BRPOP would leave the connection a reply behind,
+    so it is first starved of scratch space, which parks it in a sleep.
+    """
+    parked, stopping = asyncio.Event(), []
+    available = conversion.temp_space.available
+
+    def gated():
+        if stopping:
+            parked.set()
+            return 0
+        return available()
+
+    monkeypatch.setattr(conversion.temp_space, "available", gated)
+    task = asyncio.create_task(conversion.worker_loop())
+    try:
+        for _ in range(100):
+            if await done():
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        stopping.append(True)
+        await asyncio.wait_for(parked.wait(), 10)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_worker_loop_skips_cancelled_jobs(conversion, yt_dlp, uploads, monkeypatch):
+    cancelled = await submit(conversion, "a")
+    wanted = await submit(conversion, "b")
+    await conversion.job_store.cancel([cancelled])
+
+    async def wanted_done():
+        return await status(conversion, wanted) == "completed"
+
+    await run_worker_until(conversion, monkeypatch, wanted_done)
+    assert await status(conversion, wanted) == "completed"
+    assert await status(conversion, cancelled) == "cancelled"
+    assert yt_dlp.downloads == ["b"]
+    assert await conversion.redis_client.get("active_jobs") == "0"
+    assert await conversion.redis_client.llen("conversion_queue") == 0
+
+
+async def test_scratch_space_is_set_up_by_the_worker_not_on_import(monkeypatch, tmp_path):
+    assert api.temp_space is None and api.partials is None
+    temp_dir = tmp_path / "conversions"
+    monkeypatch.setattr(api, "TEMP_DIR", str(temp_dir))
+    monkeypatch.setattr(api, "PartialDownloads", functools.partial(PartialDownloads, str(temp_dir / ".partials")))
+    monkeypatch.setattr(api, "temp_space", None)
+    monkeypatch.setattr(api, "partials", None)
+    api.init_scratch()
+    assert api.temp_space.temp_dir == str(temp_dir)
+    assert api.temp_space.partials_dir == api.partials.directory
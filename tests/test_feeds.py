@@ -0,0 +1,162 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from lib import feeds, storage
+from lib.feeds import FeedStore, episode_guid, render_item, sign_links
+
+pytestmark = pytest.mark.anyio
+
+ITUNES = "http://www.itunes.com/dtds/podcast-1.0.dtd"
+
+
+@pytest.fixture(autouse=True)
+def signing(monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_MODE", "private")
+    monkeypatch.setattr(storage, "DOWNLOAD_URL_SECRET", "secret")
+    monkeypatch.setattr(feeds, "FEED_MEDIA_BASE_URL", "https://media.example.com/")
+
+
+def episode(video_id, published, quality="medium", ext="m4a", **fields):
+    return dict({
+        "title": f"Episode {video_id}",
+        "video_id": video_id,
+        "artifact": f"{video_id}-{quality}.{ext}",
+        "size": 1000,
+        "published": published,
+    }, **fields)
+
+
+def items(body):
+    return ET.fromstring(body).findall("./channel/item")
+
+
+def test_render_item_escapes_and_signs():
+    expires = storage.download_expiry()
+    xml = sign_links(render_item("u1:v1", episode("v1", 0, title="Q&A <live>", duration=61.6)).encode(), expires)
+    item = ET.fromstring(f'<rss xmlns:itunes="{ITUNES}">{xml}</rss>').find("item")
+    assert item.find("title").text == "Q&A <live>"
+    assert item.find("guid").text == "u1:v1"
+    enclosure = item.find("enclosure").attrib
+    assert enclosure["url"] == "https://media.example.com" + storage.download_path("v1-medium.m4a", expires)
+    assert enclosure["type"] == "audio/mp4" and enclosure["length"] == "1000"
+    assert item.find(f"{{{ITUNES}}}duration").text == "62"
+
+
+async def test_episodes_are_spliced_newest_first(redis):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+    await store.add_episode("u1", episode("b", 3000))
+    version = await store.add_episode("u1", episode("c", 2000))
+
+    _, _, body = await store.document("u1", version)
+    assert [item.find("guid").text for item in items(body)] == ["u1:b", "u1:c", "u1:a"]
+    assert version == 3
+
+
+async def test_reconverting_replaces_the_episode(redis):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+    version = await store.add_episode("u1", episode("a", 2000, quality="high", ext="mp3", size=5000))
+
+    _, _, body = await store.document("u1", version)
+    (item,) = items(body)
+    assert item.find("guid").text == episode_guid("u1", "a")
+    assert "/download/a-high.mp3?" in item.find("enclosure").attrib["url"]
+    assert item.find("enclosure").attrib["length"] == "5000"
+
+
+async def stored_items(redis, store, user_id):
+    """The stored document's items, and the stored fragments in publish order"""
+    _, episodes_key, order_key, document_key = store.keys(user_id)
+    document = await redis.get(document_key)
+    fragments = await redis.hmget(episodes_key, await redis.zrevrange(order_key, 0, -1))
+    return document[document.index("<item>"):-len(feeds.FEED_TAIL)], "".join(fragments)
+
+
+async def test_splicing_matches_a_full_render(redis):
+    store = FeedStore(redis, max_episodes=3)
+    for video_id, published in [("a", 1000), ("b", 3000), ("c", 2000), ("a", 4000), ("d", 500), ("e", 2500)]:
+        await store.add_episode("u1", episode(video_id, published))
+        spliced, rendered = await stored_items(redis, store, "u1")
+        assert spliced == rendered
+    assert rendered.count("<item>") == 3
+
+    # Spliced, not re-rendered from the fragments: untouched bytes survive
+    document_key = store.keys("u1")[3]
+    document = await redis.get(document_key)
+    await redis.set(document_key, document.replace(feeds.FEED_TAIL, "<!--x-->" + feeds.FEED_TAIL))
+    await store.add_episode("u1", episode("f", 5000))
+    assert "<!--x-->" in await redis.get(document_key)
+
+
+async def test_documents_without_a_stored_header_length_are_rebuilt(redis):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+    await redis.hdel(store.keys("u1")[0], "head_len")
+    await redis.set(store.keys("u1")[3], "stale")
+    version = await store.add_episode("u1", episode("b", 2000))
+    _, _, body = await store.document("u1", version)
+    assert [item.find("guid").text for item in items(body)] == ["u1:b", "u1:a"]
+
+
+async def test_feeds_are_per_user(redis):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+    await store.add_episode("u2", episode("a", 1000))
+    assert (await store.validators("u1"))[0] == 1
+    assert (await store.validators("u3")) is None
+
+
+async def test_oldest_episodes_are_dropped_past_the_cap(redis):
+    store = FeedStore(redis, max_episodes=2)
+    for n, video_id in enumerate(["a", "b", "c"]):
+        version = await store.add_episode("u1", episode(video_id, 1000 + n))
+    _, _, body = await store.document("u1", version)
+    assert [item.find("guid").text for item in items(body)] == ["u1:c", "u1:b"]
+    assert sorted(await redis.hkeys(store.keys("u1")[1])) == ["u1:b", "u1:c"]
+
+
+async def test_conditional_responses(redis):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+
+    response = await store.response("u1", {})
+    assert response.status_code == 200
+    assert response.media_type.startswith("application/rss+xml")
+    etag = response.headers["etag"]
+
+    assert (await store.response("u1", {"if-none-match": etag})).status_code == 304
+    assert (await store.response("u1", {"if-modified-since": response.headers["last-modified"]})).status_code == 304
+
+    await store.add_episode("u1", episode("b", 2000))
+    changed = await store.response("u1", {"if-none-match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(items(changed.body)) == 2
+
+    assert await store.response("nobody", {}) is None
+
+
+async def test_documents_are_cached_per_version(redis):
+    store = FeedStore(redis)
+    version = await store.add_episode("u1", episode("a", 1000))
+    first = await store.document("u1", version)
+    # Served from the process cache without reading the document again
+    await redis.delete(store.keys("u1")[3])
+    assert await store.document("u1", version) == first
+
+
+async def test_links_are_resigned_each_expiry_window(redis, monkeypatch):
+    store = FeedStore(redis)
+    await store.add_episode("u1", episode("a", 1000))
+    now = [2_000_000_000.0]
+    monkeypatch.setattr(storage.time, "time", lambda: now[0])
+
+    first = await store.response("u1", {})
+    url = items(first.body)[0].find("enclosure").attrib["url"]
+    assert url == "https://media.example.com" + storage.download_path("a-medium.m4a")
+
+    now[0] += storage.DOWNLOAD_URL_TTL
+    later = await store.response("u1", {"if-none-match": first.headers["etag"]})
+    assert later.status_code == 200 and later.headers["etag"] != first.headers["etag"]
+    assert items(later.body)[0].find("enclosure").attrib["url"] != url
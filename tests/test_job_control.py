@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from lib import job_control
+from lib.job_control import JobControl, JobInterrupted
+from lib.job_store import JobStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def store(redis):
+    return JobStore(redis)
+
+
+async def processing_job(store, job_id="j1", **fields):
+    await store.create(job_id, dict({"video_id": "vid", "user_id": "u1"}, **fields))
+    await store.transition(job_id, "processing")
+
+
+async def test_cancel_only_touches_live_jobs(store):
+    await processing_job(store, "running")
+    await store.create("queued", {"video_id": "v"})
+    await store.create("done", {"video_id": "v"})
+    await store.transition("done", "completed")
+
+    previous = await store.cancel(["running", "queued", "done", "missing"])
+    assert previous == {"running": "processing", "queued": "queued", "done": "completed", "missing": None}
+    assert (await store.get("running"))["status"] == "cancelled"
+    assert (await store.get("done"))["status"] == "completed"
+    assert await store.is_cancelled("queued") and not await store.is_cancelled("done")
+
+
+async def test_tombstones_are_consumed_once(store):
+    await store.create("j1", {"video_id": "v"})
+    await store.cancel(["j1"])
+    assert await store.consume_tombstone("j1")
+    assert not await store.consume_tombstone("j1")
+
+
+async def test_requeue_pushes_to_the_consuming_end(store, redis):
+    await redis.lpush("conversion_queue", "other")
+    await processing_job(store)
+    assert await store.requeue("j1", "conversion_queue", front=True)
+    assert await redis.rpop("conversion_queue") == "j1"
+    assert (await store.get("j1"))["status"] == "queued"
+    assert (await store.count_by_state())["processing"] == 0
+
+
+async def test_requeue_loses_to_a_cancel(store, redis):
+    await processing_job(store)
+    await store.cancel(["j1"])
+    assert not await store.requeue("j1", "conversion_queue")
+    assert (await store.get("j1"))["status"] == "cancelled"
+    assert await redis.llen("conversion_queue") == 0
+
+
+async def test_requeue_honours_a_tombstone_overwritten_by_processing(store, redis):
+    # Cancelled while queued, then the worker's own transition wrote "processing" over it
+    await store.create("j1", {"video_id": "v"})
+    await store.cancel(["j1"])
+    await store.transition("j1", "processing")
+    assert not await store.requeue("j1", "conversion_queue")
+    assert await redis.llen("conversion_queue") == 0
+
+
+async def test_live_user_jobs(store):
+    await processing_job(store, "running")
+    await store.create("queued", {"video_id": "v", "user_id": "u1"})
+    await store.create("done", {"video_id": "v", "user_id": "u1"})
+    await store.transition("done", "completed")
+    assert sorted(await store.live_user_jobs("u1", batch_size=2)) == ["queued", "running"]
+
+
+def test_raise_if_stopped_keeps_the_first_reason():
+    control = JobControl("j1")
+    control.raise_if_stopped()
+    control.stop("preempted")
+    control.stop("cancelled")
+    with pytest.raises(JobInterrupted) as error:
+        control.raise_if_stopped()
+    assert error.value.reason == "preempted"
+
+
+@pytest.fixture
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(job_control, "JOB_CONTROL_POLL_SECONDS", 0.01)
+
+
+async def test_watch_notices_a_cancel(store, redis, fast_poll):
+    await processing_job(store)
+    control = JobControl("j1")
+    watcher = asyncio.create_task(control.watch(store, redis))
+    await store.cancel(["j1"])
+    await asyncio.wait_for(watcher, 1)
+    assert control.reason == "cancelled"
+
+
+async def test_one_backfill_job_is_preempted_per_waiting_priority_job(store, redis, fast_poll, monkeypatch):
+    monkeypatch.setattr(job_control, "PREEMPT_AFTER_SECONDS", 0)
+    await processing_job(store, "backfill1")
+    await processing_job(store, "backfill2")
+    await store.create("urgent", {"video_id": "v"})
+    await redis.lpush("priority_queue", "urgent")
+
+    first, second = JobControl("backfill1", preemptible=True), JobControl("backfill2", preemptible=True)
+    watchers = [asyncio.create_task(control.watch(store, redis)) for control in (first, second)]
+    await asyncio.sleep(0.1)
+    for watcher in watchers:
+        watcher.cancel()
+    assert [first.reason, second.reason].count("preempted") == 1
+
+
+async def test_recent_priority_jobs_do_not_preempt(store, redis, fast_poll, monkeypatch):
+    monkeypatch.setattr(job_control, "PREEMPT_AFTER_SECONDS", 3600)
+    await processing_job(store, "backfill")
+    await store.create("urgent", {"video_id": "v"})
+    await redis.lpush("priority_queue", "urgent")
+    control = JobControl("backfill", preemptible=True)
+    watcher = asyncio.create_task(control.watch(store, redis))
+    await asyncio.sleep(0.05)
+    watcher.cancel()
+    assert control.reason is None
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from lib.job_store import FIELDS, JobStore, decode_job, encode_job, idempotency_key, now_ms
+
+pytestmark = pytest.mark.anyio
+
+
+def test_encode_job_is_compact():
+    encoded = encode_job({
+        "video_id": "abc", "content_type": "audio", "quality": "high", "status": "processing",
+        "progress": 40, "error": None, "title": "", "unknown": "dropped",
+    })
+    assert encoded == {"v": "abc", "t": "0", "q": "2", "s": "1", "g": "40"}
+
+
+def test_decode_job_round_trips():
+    fields = {"video_id": "abc", "content_type": "video", "audio_format": "mp3", "status": "completed",
+              "created_at": 1700000000000, "user_id": "u1", "title": "Episode"}
+    job = decode_job("j1", encode_job(fields))
+    assert job == dict(fields, job_id="j1", progress=0)
+
+
+def test_values_outside_an_enum_are_kept():
+    assert decode_job("j1", encode_job({"quality": "4k"}))["quality"] == "4k"
+
+
+def test_decode_job_reads_legacy_hashes():
+    assert decode_job("j1", {"status": "queued", "video_id": "abc"}) == {"status": "queued", "video_id": "abc", "job_id": "j1"}
+
+
+def test_client_keys_are_scoped_per_user():
+    key_a, _ = idempotency_key("a", "vid", "audio", "medium", "m4a", "client-key")
+    key_b, _ = idempotency_key("b", "vid", "audio", "medium", "m4a", "client-key")
+    assert key_a != key_b
+    derived, _ = idempotency_key("a", "vid", "audio", "medium", "m4a")
+    assert derived != key_a
+
+
+async def test_create_resolves_duplicates_to_the_live_job(redis):
+    store = JobStore(redis)
+    key = idempotency_key("u1", "vid", "audio", "medium", "m4a")
+    assert await store.create("j1", {"video_id": "vid", "user_id": "u1"}, key) is None
+    assert await store.create("j2", {"video_id": "vid", "user_id": "u1"}, key) == "j1"
+    assert await store.live_job_for(key[0]) == "j1"
+
+    # A failed job no longer holds its key
+    await store.transition("j1", "failed", error="boom")
+    assert await store.live_job_for(key[0]) is None
+    assert await store.create("j3", {"video_id": "vid", "user_id": "u1"}, key) is None
+
+
+async def test_transition_moves_between_state_indexes(redis):
+    store = JobStore(redis, ttl_seconds=60)
+    await store.create("j1", {"video_id": "vid"})
+    await store.transition("j1", "processing")
+    assert await store.count_by_state() == {"queued": 0, "processing": 1, "completed": 0, "failed": 0, "cancelled": 0}
+    assert await redis.ttl(store.job_key("j1")) == -1
+
+    await store.transition("j1", "completed", progress=100, artifact_key="audio/vid-medium.m4a")
+    assert (await store.count_by_state())["completed"] == 1
+    assert await redis.ttl(store.job_key("j1")) > 60
+    assert await store.get_fields("j1", "status", "progress", "artifact_key") == ["completed", 100, "audio/vid-medium.m4a"]
+
+
+async def test_list_user_jobs_pages_newest_first(redis):
+    store = JobStore(redis)
+    for n in range(5):
+        await store.create(f"j{n}", {"video_id": f"v{n}", "user_id": "u1"})
+        await redis.zadd(store.user_index("u1"), {f"j{n}": 1000 + n})
+
+    seen, cursor = [], None
+    while True:
+        jobs, cursor = await store.list_user_jobs("u1", limit=2, cursor=cursor)
+        seen += [job["job_id"] for job in jobs]
+        if cursor is None:
+            break
+    assert seen == ["j4", "j3", "j2", "j1", "j0"]
+
+
+async def test_cursor_survives_its_job_expiring(redis):
+    store = JobStore(redis)
+    for n in range(4):
+        await store.create(f"j{n}", {"video_id": f"v{n}", "user_id": "u1"})
+        await redis.zadd(store.user_index("u1"), {f"j{n}": 1000 + n})
+
+    jobs, cursor = await store.list_user_jobs("u1", limit=2)
+    assert cursor == "1002:j2"
+    # The cursor's job disappears before the next page is fetched
+    await redis.zrem(store.user_index("u1"), "j2")
+    jobs, cursor = await store.list_user_jobs("u1", limit=2, cursor=cursor)
+    assert [job["job_id"] for job in jobs] == ["j1", "j0"]
+
+
+@pytest.mark.parametrize("cursor", ["garbage", "12.5:j1", "abc:j1", "1002:"])
+async def test_malformed_cursor_is_rejected(redis, cursor):
+    with pytest.raises(ValueError):
+        await JobStore(redis).list_user_jobs("u1", cursor=cursor)
+
+
+async def test_listing_prunes_jobs_expired_by_redis(redis):
+    store = JobStore(redis)
+    await store.create("j1", {"video_id": "v1", "user_id": "u1"})
+    await store.create("j2", {"video_id": "v2", "user_id": "u1"})
+    await redis.delete(store.job_key("j1"))
+
+    jobs, _ = await store.list_user_jobs("u1")
+    assert [job["job_id"] for job in jobs] == ["j2"]
+    assert await redis.zrange(store.user_index("u1"), 0, -1) == ["j2"]
+
+
+async def test_expire_finished_archives_and_removes(redis, tmp_path):
+    archive = tmp_path / "jobs.jsonl"
+    store = JobStore(redis, ttl_seconds=60, archive_path=str(archive))
+    await store.create("old", {"video_id": "v1", "user_id": "u1"})
+    await store.create("new", {"video_id": "v2", "user_id": "u1"})
+    await store.transition("old", "completed")
+    await store.transition("new", "completed")
+    await redis.zadd(store.state_index("completed"), {"old": now_ms() - 120_000})
+
+    assert await store.expire_finished() == 1
+    assert await store.get("old") is None
+    assert await store.get("new") is not None
+    assert await redis.zrange(store.user_index("u1"), 0, -1) == ["new"]
+    record = json.loads(archive.read_text())
+    assert record["job_id"] == "old" and record["status"] == "completed"
+    assert record["created_at"].endswith("+00:00")
+
+
+async def test_job_hash_uses_short_fields(redis):
+    store = JobStore(redis)
+    await store.create("j1", {"video_id": "vid", "content_type": "audio", "user_id": "u1"})
+    raw = await redis.hgetall(store.job_key("j1"))
+    assert set(raw) <= set(FIELDS.values())
+    assert raw[FIELDS["status"]] == "0"
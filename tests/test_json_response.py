@@ -0,0 +1,48 @@
+import orjson
+import pytest
+from pydantic import BaseModel
+
+from lib.json_response import FastJSONResponse, FragmentCache, dumps
+
+
+class Item(BaseModel):
+    id: int
+
+
+def test_dumps_handles_models_and_sets():
+    assert orjson.loads(dumps({"item": Item(id=1), "tags": {"a"}, 1: "int key"})) == {"item": {"id": 1}, "tags": ["a"], "1": "int key"}
+    with pytest.raises(TypeError):
+        dumps({"x": object()})
+
+
+def test_fragment_cache_encodes_each_version_once():
+    built = []
+    cache = FragmentCache("test", max_items=10)
+
+    def build(item):
+        built.append(item["id"])
+        return item
+
+    items = [{"id": 1, "etag": "a"}, {"id": 2, "etag": "a"}]
+    key = lambda item: (item["id"], item["etag"])
+    first = dumps({"videos": cache.fragments(items, key, build)})
+    second = dumps({"videos": cache.fragments(items, key, build)})
+    assert first == second == dumps({"videos": items})
+    assert built == [1, 2]
+
+    items[0] = {"id": 1, "etag": "b"}
+    cache.fragments(items, key, build)
+    assert built == [1, 2, 1]
+
+
+def test_fragment_cache_is_bounded_and_skips_unversioned_items():
+    cache = FragmentCache("test", max_items=2)
+    cache.fragments([{"id": n} for n in range(5)], lambda item: item["id"], lambda item: item)
+    assert len(cache._items) == 2
+    cache.fragments([{"id": 9}], lambda item: None, lambda item: item)
+    assert 9 not in cache._items
+
+
+def test_fast_json_response_writes_fragments_as_is():
+    fragment = orjson.Fragment(b'{"cached":true}')
+    assert FastJSONResponse({"items": [fragment]}).body == b'{"items":[{"cached":true}]}'
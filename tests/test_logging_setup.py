@@ -0,0 +1,112 @@
+import json
+import queue
+import logging
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from lib import logging_setup
+from lib.logging_setup import (
+    REDACTED,
+    REQUEST_ID_HEADER,
+    DroppingQueueHandler,
+    JSONFormatter,
+    RequestContextFilter,
+    SamplingFilter,
+    redact,
+    request_id_middleware,
+    request_id_var,
+    truncate,
+)
+
+
+def make_record(msg, level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+def test_truncate():
+    assert truncate("short", 10) == "short"
+    assert truncate("a" * 15, 10) == "a" * 10 + "...[5 more chars]"
+
+
+def test_redact_masks_sensitive_keys_recursively():
+    value = {"api_key": "secret", "nested": {"Authorization": "Bearer x", "ok": 1}, "items": [{"token": "t"}]}
+    assert redact(value) == {"api_key": REDACTED, "nested": {"Authorization": REDACTED, "ok": 1}, "items": [{"token": REDACTED}]}
+
+
+def test_redact_masks_credentials_inside_strings():
+    redacted = redact("GET /videos?access_token=abc123&part=snippet")
+    assert "abc123" not in redacted
+    assert f"access_token={REDACTED}&part=snippet" in redacted
+    assert redact("Authorization: Bearer abc.def") == f"Authorization: Bearer {REDACTED}"
+
+
+def test_json_formatter_emits_redacted_fields_and_request_id():
+    record = make_record("calling upstream", request_id="req-1", fields={"x-rapidapi-key": "k", "status": 200})
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry["msg"] == "calling upstream"
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "req-1"
+    assert entry["x-rapidapi-key"] == REDACTED
+    assert entry["status"] == 200
+
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        import sys
+        record = make_record("failed", level=logging.ERROR, exc_info=sys.exc_info())
+    entry = json.loads(JSONFormatter().format(record))
+    assert "ValueError: boom" in entry["exc"]
+
+
+def test_sampling_filter(monkeypatch):
+    monkeypatch.setattr(logging_setup, "LOG_SAMPLE_RATES", {logging.DEBUG: 0.0, logging.INFO: 1.0})
+    sampler = SamplingFilter()
+    assert not sampler.filter(make_record("debug", level=logging.DEBUG))
+    assert sampler.filter(make_record("info"))
+    assert sampler.filter(make_record("error", level=logging.ERROR))
+
+
+def test_request_context_filter_stamps_current_request_id():
+    token = request_id_var.set("req-2")
+    try:
+        record = make_record("hello")
+        assert RequestContextFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    assert record.request_id == "req-2"
+
+
+def test_dropping_queue_handler_drops_when_full(monkeypatch):
+    monkeypatch.setattr(DroppingQueueHandler, "dropped", 0)
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record("first"))
+    handler.handle(make_record("second"))
+    assert handler.queue.qsize() == 1
+    assert DroppingQueueHandler.dropped == 1
+    # Left unformatted for the listener thread
+    assert handler.queue.get_nowait().msg == "first"
+
+
+def test_request_id_middleware_adopts_or_mints():
+    app = FastAPI()
+    app.middleware("http")(request_id_middleware)
+
+    @app.get("/whoami")
+    async def whoami():
+        return {"request_id": request_id_var.get()}
+
+    client = TestClient(app)
+    response = client.get("/whoami", headers={REQUEST_ID_HEADER: "abc"})
+    assert response.json() == {"request_id": "abc"}
+    assert response.headers[REQUEST_ID_HEADER] == "abc"
+
+    minted = client.get("/whoami")
+    assert minted.headers[REQUEST_ID_HEADER] == minted.json()["request_id"]
+    assert len(minted.headers[REQUEST_ID_HEADER]) == 32
+    assert request_id_var.get() is None
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import time
+
+os.environ.setdefault("ARTIFACT_CACHE_DIR", tempfile.mkdtemp(prefix="test-artifacts-"))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from lib import storage
+from lib.artifact_cache import ArtifactCache
+from lib.shared_state import LocalBackend, RedisBackend
+from lib.storage import download_expiry, download_path, download_signature
+
+AUTH = {"Authorization": "Bearer token"}
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def signed_in(monkeypatch):
+    monkeypatch.setattr(main.token_manager, "validate_token", lambda token: {"sub": "account"})
+
+
+def test_auto_enqueue_needs_shared_state(client, signed_in, monkeypatch):
+    monkeypatch.setattr(main.shared_state, "backend", LocalBackend())
+    r = client.get("/sync_user_videos?enqueue=true", headers=AUTH)
+    assert r.status_code == 503
+
+
+def test_enqueued_jobs_belong_to_the_callers_channel(client, signed_in, monkeypatch):
+    monkeypatch.setattr(main.shared_state, "backend", RedisBackend("redis://unused"))
+    monkeypatch.setattr(main.quota_planner, "plan", lambda *args, **kwargs: None)
+    owners = []
+    monkeypatch.setattr(main, "enqueue_published", lambda channel, videos, user_id, *args: owners.append(user_id))
+
+    def fake_sync(token, full=False, on_published=None, plan=None):
+        on_published({"id": "UCcaller"}, [{"videoId": "v1"}])
+        return {"ok": True}
+
+    monkeypatch.setattr(main.channel_sync, "sync", fake_sync)
+    r = client.get("/sync_user_videos?enqueue=true&user_id=someone-else", headers=AUTH)
+    assert r.status_code == 200
+    assert owners == ["UCcaller"]
+
+
+@pytest.fixture
+def downloads(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "STORAGE_MODE", "private")
+    monkeypatch.setattr(storage, "DOWNLOAD_URL_SECRET", "secret")
+    cache = ArtifactCache(str(tmp_path))
+    (tmp_path / "cached-medium.m4a").write_bytes(b"x" * 100)
+    monkeypatch.setattr(main, "artifact_cache", cache)
+    fills = []
+    monkeypatch.setattr(main, "fill_artifact_cache", fills.append)
+    return fills
+
+
+def test_download_requires_a_signature(client, downloads):
+    assert client.get("/download/cached-medium.m4a").status_code == 403
+    expires = download_expiry()
+    assert client.get(f"/download/cached-medium.m4a?exp={expires}&sig={download_signature('other.m4a', expires)}").status_code == 403
+    # A link that expired a second ago, correctly signed
+    assert client.get(download_path("cached-medium.m4a", expires=int(time.time()) - 1)).status_code == 403
+    r = client.get(download_path("cached-medium.m4a"))
+    assert r.status_code == 200 and len(r.content) == 100
+
+
+def test_missing_objects_are_404_without_a_fill(client, downloads, monkeypatch):
+    monkeypatch.setattr(main.cold_storage, "exists", lambda key: False)
+    r = client.get(download_path("gone-medium.m4a"), follow_redirects=False)
+    assert r.status_code == 404
+    assert downloads == []
+
+
+def test_cold_objects_redirect_and_fill(client, downloads, monkeypatch):
+    monkeypatch.setattr(main.cold_storage, "exists", lambda key: True)
+    monkeypatch.setattr(main.artifact_urls, "_sign", lambda key: f"https://s3.invalid/{key}")
+    r = client.get(download_path("cold-medium.m4a"), follow_redirects=False)
+    assert r.status_code == 302
+    assert r.headers["location"] == "https://s3.invalid/conversions/cold-medium.m4a"
+    assert downloads == ["cold-medium.m4a"]
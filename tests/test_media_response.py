@@ -0,0 +1,155 @@
+import os
+from email.utils import formatdate
+
+import anyio
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from lib.media_response import MAX_RANGES, MediaFileResponse, guess_media_type, not_modified, parse_range_header
+
+BODY = bytes(range(256)) * 40
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=900-5000", [(900, 999)]),
+    ("bytes=0-10, 5-20, 22-30", [(0, 20), (22, 30)]),
+    ("bytes=21-30,0-20", [(0, 30)]),
+    ("BYTES = 0-0", [(0, 0)]),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0", "bytes=2000-3000"])
+def test_unsatisfiable_ranges(header):
+    assert parse_range_header(header, 1000) == []
+
+
+@pytest.mark.parametrize("header", ["items=0-1", "bytes=", "bytes=5", "bytes=10-5", "bytes=a-b", "bytes=0-1,x"])
+def test_malformed_ranges_are_ignored(header):
+    assert parse_range_header(header, 1000) is None
+
+
+def test_too_many_ranges_are_ignored():
+    header = "bytes=" + ",".join(f"{n * 10}-{n * 10 + 1}" for n in range(MAX_RANGES + 1))
+    assert parse_range_header(header, 1000) is None
+
+
+def test_not_modified_prefers_if_none_match():
+    etag = '"abc"'
+    assert not_modified({"if-none-match": 'W/"abc", "def"'}, etag, 1000)
+    assert not_modified({"if-none-match": "*"}, etag, 1000)
+    # If-Modified-Since is ignored once If-None-Match is present
+    assert not not_modified({"if-none-match": '"def"', "if-modified-since": formatdate(2000, usegmt=True)}, etag, 1000)
+    assert not_modified({"if-modified-since": formatdate(1000, usegmt=True)}, etag, 1000.5)
+    assert not not_modified({"if-modified-since": formatdate(999, usegmt=True)}, etag, 1000)
+    assert not not_modified({"if-modified-since": "not a date"}, etag, 1000)
+
+
+def test_guess_media_type():
+    assert guess_media_type("a-medium.m4a") == "audio/mp4"
+    assert guess_media_type("a-high.MP3") == "audio/mpeg"
+    assert guess_media_type("a.unknownext") == "application/octet-stream"
+
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "a-medium.m4a"
+    path.write_bytes(BODY)
+
+    def serve(request):
+        return MediaFileResponse(str(path), request.headers, method=request.method)
+
+    client = TestClient(Starlette(routes=[Route("/a", serve, methods=["GET", "HEAD"])]))
+    return client, path
+
+
+def test_full_response(media):
+    client, _ = media
+    r = client.get("/a")
+    assert r.status_code == 200 and r.content == BODY
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["content-type"] == "audio/mp4"
+    assert r.headers["etag"].startswith('"')
+
+
+def test_single_range(media):
+    client, _ = media
+    r = client.get("/a", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206 and r.content == BODY[10:20]
+    assert r.headers["content-range"] == f"bytes 10-19/{len(BODY)}"
+
+
+def test_multiple_ranges(media):
+    client, _ = media
+    r = client.get("/a", headers={"Range": "bytes=0-3,100-103"})
+    assert r.status_code == 206
+    boundary = r.headers["content-type"].split("boundary=")[1]
+    assert int(r.headers["content-length"]) == len(r.content)
+    parts = r.content.split(f"--{boundary}".encode())
+    assert parts[1].endswith(b"\r\n\r\n" + BODY[0:4] + b"\r\n")
+    assert parts[2].endswith(b"\r\n\r\n" + BODY[100:104] + b"\r\n")
+    assert parts[3] == b"--\r\n"
+
+
+def test_unsatisfiable_range(media):
+    client, _ = media
+    r = client.get("/a", headers={"Range": f"bytes={len(BODY)}-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(BODY)}"
+
+
+def test_if_range_mismatch_sends_the_whole_file(media):
+    client, _ = media
+    etag = client.head("/a").headers["etag"]
+    assert client.get("/a", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+    r = client.get("/a", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert r.status_code == 200 and r.content == BODY
+    # Weak validators never satisfy If-Range
+    assert client.get("/a", headers={"Range": "bytes=0-9", "If-Range": f"W/{etag}"}).status_code == 200
+
+
+def test_conditional_get(media):
+    client, path = media
+    etag = client.get("/a").headers["etag"]
+    r = client.get("/a", headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b""
+
+    # Replacing the file changes the validator
+    os.utime(path, ns=(0, 10**18))
+    assert client.get("/a", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_head_has_no_body(media):
+    client, _ = media
+    r = client.head("/a")
+    assert r.status_code == 200 and r.content == b""
+    assert r.headers["content-length"] == str(len(BODY))
+
+
+def test_file_stays_readable_after_eviction(tmp_path):
+    path = tmp_path / "a.m4a"
+    path.write_bytes(BODY)
+    response = MediaFileResponse(str(path), {"range": "bytes=0-9"})
+    # Evicted between building the response and sending it
+    path.unlink()
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    anyio.run(response, {"type": "http"}, None, send)
+    assert sent[0]["status"] == 206
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == BODY[:10]
+
+
+def test_missing_file_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        MediaFileResponse(str(tmp_path / "gone.m4a"), {})
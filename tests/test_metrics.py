@@ -0,0 +1,94 @@
+import pytest
+import requests
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+from starlette.testclient import TestClient
+
+from lib import http_client
+from lib.http_client import upstream_get
+from lib.job_store import JobStore
+from lib.metrics import InstrumentedRedis, http_metrics_middleware, metrics_response
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_http_metrics_labelled_by_route_template():
+    app = FastAPI()
+    app.middleware("http")(http_metrics_middleware)
+
+    @app.get("/users/{user_id}/jobs")
+    async def jobs(user_id: str):
+        return {"user_id": user_id}
+
+    labels = {"method": "GET", "route": "/users/{user_id}/jobs", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    client = TestClient(app)
+    client.get("/users/a/jobs")
+    client.get("/users/b/jobs")
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+
+
+def test_metrics_response_renders_exposition_format(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    response = metrics_response()
+    assert response.media_type.startswith("text/plain")
+    assert b"http_request_duration_seconds" in response.body
+
+
+@pytest.mark.anyio
+async def test_instrumented_redis_counts_commands(redis, spans):
+    client = InstrumentedRedis(redis)
+    before = sample("redis_commands_total", command="set")
+    await client.set("key", "value")
+    assert await client.get("key") == "value"
+    assert sample("redis_commands_total", command="set") == before + 1
+    assert [span.name for span in spans.get_finished_spans()] == ["redis set", "redis get"]
+
+
+@pytest.mark.anyio
+async def test_instrumented_redis_counts_a_pipeline_as_one_round_trip(redis, spans):
+    store = JobStore(InstrumentedRedis(redis))
+    await store.create("job1", {"video_id": "v1", "content_type": "audio", "status": "queued"})
+    before = sample("redis_commands_total", command="pipeline")
+    await store.transition("job1", "processing")
+    assert sample("redis_commands_total", command="pipeline") == before + 1
+    assert "redis pipeline" in [span.name for span in spans.get_finished_spans()]
+    assert (await store.get("job1"))["status"] == "processing"
+
+
+def fake_response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+def test_upstream_request_records_host_and_status(monkeypatch, spans):
+    monkeypatch.setattr(http_client.requests, "request", lambda method, url, **kwargs: fake_response(404))
+    before = sample("upstream_request_duration_seconds_count", host="api.example.com", status="404")
+    assert upstream_get("https://api.example.com/v3/videos?key=secret").status_code == 404
+    assert sample("upstream_request_duration_seconds_count", host="api.example.com", status="404") == before + 1
+
+    (span,) = spans.get_finished_spans()
+    assert span.name == "GET api.example.com"
+    assert span.attributes["url.path"] == "/v3/videos"
+    assert "secret" not in str(dict(span.attributes))
+
+
+@pytest.mark.parametrize("error, status, kind", [
+    (requests.exceptions.Timeout, "timeout", "timeout"),
+    (requests.exceptions.ConnectionError, "error", "connection"),
+])
+def test_upstream_request_failures(monkeypatch, spans, error, status, kind):
+    def fail(method, url, **kwargs):
+        raise error("unreachable")
+
+    monkeypatch.setattr(http_client.requests, "request", fail)
+    before = sample("errors_total", component="upstream", kind=kind)
+    with pytest.raises(error):
+        upstream_get("https://api.example.com/v3/channels")
+    assert sample("errors_total", component="upstream", kind=kind) == before + 1
+    assert sample("upstream_request_duration_seconds_count", host="api.example.com", status=status) >= 1
+    (span,) = spans.get_finished_spans()
+    assert span.status.status_code.name == "ERROR"
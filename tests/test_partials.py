@@ -0,0 +1,70 @@
+import os
+import time
+
+import pytest
+
+from lib.partials import PartialCorrupt, PartialDownloads, partial_key, verify_media
+
+
+def write(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def partials(tmp_path):
+    return PartialDownloads(str(tmp_path), max_age_seconds=3600, max_bytes=1000)
+
+
+def names(partials):
+    return sorted(name for name in os.listdir(partials.directory) if not name.startswith("."))
+
+
+def test_partial_key_is_file_name_safe():
+    assert partial_key("a/b c", "audio", "medium", None) == "a_b_c-audio-medium-native"
+    assert partial_key("vid", "video", "high", "mp3") == "vid-video-high-mp3"
+
+
+def test_expire_removes_old_partials(partials):
+    now = time.time()
+    write(os.path.join(partials.directory, "old.m4a.part"), 10, now - 7200)
+    write(os.path.join(partials.directory, "new.m4a.part"), 10, now)
+    assert partials.expire() == 10
+    assert names(partials) == ["new.m4a.part"]
+
+
+def test_expire_removes_oldest_first_over_the_cap(partials):
+    now = time.time()
+    for n, name in enumerate(["a", "b", "c"]):
+        write(os.path.join(partials.directory, f"{name}.m4a.part"), 400, now - 100 + n)
+    assert partials.expire() == 400
+    assert names(partials) == ["b.m4a.part", "c.m4a.part"]
+
+
+def test_expire_budget_tightens_the_cap(partials):
+    now = time.time()
+    for n, name in enumerate(["a", "b", "c"]):
+        write(os.path.join(partials.directory, f"{name}.m4a.part"), 300, now - 100 + n)
+    assert partials.expire(budget_bytes=300) == 600
+    assert names(partials) == ["c.m4a.part"]
+    # A zero allowance clears every unclaimed partial
+    assert partials.expire(budget_bytes=0) == 300
+
+
+def test_expire_skips_claimed_keys(partials):
+    slot = partials.claim("vid", "audio", "medium", "m4a")
+    try:
+        write(f"{slot.base}.m4a.part", 10, time.time() - 7200)
+        assert partials.claim("vid", "audio", "medium", "m4a") is None
+        assert partials.expire() == 0
+    finally:
+        slot.release()
+    assert partials.expire() == 10
+
+
+def test_verify_media_rejects_truncated_files(tmp_path):
+    path = tmp_path / "x.bin"
+    path.write_bytes(b"x" * 10)
+    with pytest.raises(PartialCorrupt):
+        verify_media(str(path), expected_bytes=20)
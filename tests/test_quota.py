@@ -0,0 +1,92 @@
+import pytest
+from fastapi import HTTPException
+
+from lib.quota import QuotaLedger, QuotaPlanner, call_cost, quota_user
+from lib.shared_state import LocalBackend, SharedState
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+@pytest.fixture
+def ledger():
+    return QuotaLedger(SharedState(LocalBackend()), daily_limit=1000, user_daily_limit=100)
+
+
+@pytest.fixture
+def planner(ledger):
+    # 200 units reserved for interactive use; economy below 400 remaining
+    return QuotaPlanner(ledger, reserve=0.2, economy_threshold=0.4)
+
+
+def spend(ledger, units):
+    ledger.state.incr(f"quota:{ledger._day()[0]}", 3600, units)
+
+
+def test_quota_user_prefers_the_account():
+    assert quota_user({"sub": "123", "email": "a@b"}, "token") == "123"
+    assert quota_user({"email": "a@b"}, "token") == "a@b"
+    assert quota_user({}, "token") == quota_user({}, "token") != quota_user({}, "other")
+
+
+def test_call_costs():
+    assert call_cost("playlistItems", "snippet") == 1
+    assert call_cost("search", "snippet") == 100
+    assert call_cost("unknown") == 1
+
+
+def test_charges_global_and_user_ledgers(ledger):
+    plan = QuotaPlanner(ledger).plan("u1")
+    plan.charge("playlistItems", "snippet")
+    plan.charge("videos", "status")
+    assert ledger.used("u1") == (2, 2)
+    assert ledger.used("u2") == (2, 0)
+
+
+def test_full_plan_with_plenty_left(planner):
+    plan = planner.plan("u1", interactive=False)
+    assert not plan.economy
+    assert plan.parts("snippet,contentDetails", "snippet") == "snippet,contentDetails"
+
+
+def test_economy_plan_when_running_low(planner, ledger):
+    spend(ledger, 650)
+    assert planner.plan("u1").economy
+    assert planner.plan("u1").parts("snippet,contentDetails", "snippet") == "snippet"
+
+
+def test_background_work_cannot_spend_the_interactive_reserve(planner, ledger):
+    spend(ledger, 790)
+    with pytest.raises(HTTPException) as error:
+        planner.plan("u1", interactive=False, estimated_units=20)
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) > 0
+    # Interactive requests may still use it
+    assert planner.plan("u1", interactive=True, estimated_units=20)
+
+
+def test_interactive_requests_stop_at_the_daily_limit(planner, ledger):
+    spend(ledger, 999)
+    with pytest.raises(HTTPException):
+        planner.plan("u1", estimated_units=3)
+
+
+def test_per_user_limit(planner, ledger):
+    plan = planner.plan("u1")
+    for _ in range(99):
+        plan.charge("videos")
+    with pytest.raises(HTTPException) as error:
+        planner.plan("u1", estimated_units=3)
+    assert "account" in error.value.detail
+    assert planner.plan("u2", estimated_units=3)
+
+
+def test_quota_exceeded_response_exhausts_the_day(planner, ledger):
+    plan = planner.plan("u1")
+    plan.charge("videos", response=FakeResponse(403, '{"error": {"errors": [{"reason": "quotaExceeded"}]}}'))
+    assert ledger.used()[0] >= ledger.daily_limit
+    with pytest.raises(HTTPException):
+        planner.plan("u2")
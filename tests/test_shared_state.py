@@ -0,0 +1,143 @@
+import fakeredis
+import pytest
+
+from lib import shared_state
+from lib.shared_state import CircuitBreaker, LocalBackend, RateLimiter, RedisBackend, SharedState
+
+
+def redis_backend():
+    backend = RedisBackend("redis://unused")
+    backend._client = fakeredis.FakeRedis(decode_responses=True)
+    return backend
+
+
+@pytest.fixture(params=["local", "redis"])
+def state(request):
+    return SharedState(LocalBackend() if request.param == "local" else redis_backend())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(shared_state.time, "time", lambda: now[0])
+    monkeypatch.setattr(shared_state.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_set_delete(state):
+    state.set("k", "v", 60)
+    assert state.get("k") == "v"
+    state.delete("k")
+    assert state.get("k") is None
+
+
+def test_incr_counts_from_zero(state):
+    assert state.incr("n", 60) == 1
+    assert state.incr("n", 60, 5) == 6
+
+
+def test_add_only_sets_absent_keys(state):
+    assert state.add("k", "first", 60)
+    assert not state.add("k", "second", 60)
+    assert state.get("k") == "first"
+
+
+def test_only_redis_is_shared():
+    assert not SharedState(LocalBackend()).shared
+    assert SharedState(redis_backend()).shared
+
+
+def test_keys_are_prefixed():
+    backend = LocalBackend()
+    SharedState(backend, prefix="p:").set("k", "v", 60)
+    assert backend.get("p:k") == "v"
+
+
+def test_local_entries_expire(clock):
+    backend = LocalBackend()
+    backend.set("k", "v", 10)
+    backend.incr("n", 10)
+    clock[0] += 11
+    assert backend.get("k") is None
+    assert backend.incr("n", 10) == 1
+
+
+def test_redis_errors_degrade_to_misses():
+    class Broken:
+        def __getattr__(self, name):
+            raise ConnectionError("down")
+
+    backend = RedisBackend("redis://unused")
+    backend._client = Broken()
+    assert backend.get("k") is None
+    assert backend.incr("n", 60) == 0
+    assert backend.add("k", "v", 60)
+    backend.set("k", "v", 60)
+    backend.delete("k")
+
+
+def test_rate_limiter_windows(clock):
+    limiter = RateLimiter(SharedState(LocalBackend()), "host", limit=2, window_seconds=60)
+    clock[0] = 6010.0
+    assert limiter.acquire() is None
+    assert limiter.acquire() is None
+    assert limiter.acquire() == pytest.approx(50.0)
+    clock[0] = 6060.0
+    assert limiter.acquire() is None
+
+
+def test_rate_limiter_disabled_at_zero():
+    limiter = RateLimiter(SharedState(LocalBackend()), "host", limit=0)
+    assert all(limiter.acquire() is None for _ in range(10))
+
+
+def test_circuit_opens_after_repeated_failures(clock):
+    circuit = CircuitBreaker(SharedState(LocalBackend()), "host", failure_threshold=3, reset_seconds=30)
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.retry_after() is None
+    circuit.record_failure()
+    assert circuit.retry_after() == pytest.approx(30)
+    clock[0] += 31
+    assert circuit.retry_after() is None
+
+
+def test_success_resets_the_failure_count(clock):
+    circuit = CircuitBreaker(SharedState(LocalBackend()), "host", failure_threshold=2)
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    assert circuit.retry_after() is None
+
+
+def test_half_open_circuit_allows_one_trial(clock):
+    state = SharedState(LocalBackend())
+    circuit = CircuitBreaker(state, "host", failure_threshold=1, reset_seconds=30, trial_seconds=10)
+    other_worker = CircuitBreaker(state, "host", failure_threshold=1, reset_seconds=30, trial_seconds=10)
+    circuit.record_failure()
+    clock[0] += 31
+    assert circuit.retry_after() is None
+    assert other_worker.retry_after() == pytest.approx(10)
+    circuit.record_success()
+    assert other_worker.retry_after() is None
+    assert other_worker.retry_after() is None
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    circuit = CircuitBreaker(SharedState(LocalBackend()), "host", failure_threshold=3, reset_seconds=30)
+    circuit.open(5)
+    clock[0] += 6
+    assert circuit.retry_after() is None
+    # One failure is enough in half-open
+    circuit.record_failure()
+    assert circuit.retry_after() == pytest.approx(30)
+
+
+def test_abandoned_trial_is_retried(clock):
+    circuit = CircuitBreaker(SharedState(LocalBackend()), "host", failure_threshold=1, trial_seconds=10)
+    circuit.open(5)
+    clock[0] += 6
+    assert circuit.retry_after() is None
+    assert circuit.retry_after() is not None
+    clock[0] += 11
+    assert circuit.retry_after() is None
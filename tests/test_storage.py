@@ -0,0 +1,134 @@
+import pytest
+
+from lib import storage
+from lib.storage import (
+    ArtifactURLService, ColdStorage, artifact_key, download_allowed, download_expiry, download_path, download_signature,
+)
+
+
+class FakeColdStorage(ColdStorage):
+    def __init__(self, objects=()):
+        super().__init__(bucket="test-bucket")
+        self.objects = set(objects)
+        self.signed = []
+        self.heads = 0
+
+    def presigned_url(self, key, expires_in=storage.PRESIGNED_URL_TTL):
+        self.signed.append(key)
+        return f"https://signed/{key}?n={len(self.signed)}"
+
+    def exists(self, key):
+        self.heads += 1
+        return key in self.objects
+
+
+@pytest.fixture
+def private(monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_MODE", "private")
+    monkeypatch.setattr(storage, "CDN_BASE_URL", None)
+    monkeypatch.setattr(storage, "DOWNLOAD_URL_SECRET", "secret")
+
+
+def test_download_links_are_signed(private):
+    expires = download_expiry()
+    path = download_path("vid-medium.m4a")
+    assert path == f"/download/vid-medium.m4a?exp={expires}&sig={download_signature('vid-medium.m4a', expires)}"
+    signature = path.split("sig=")[1]
+    assert download_allowed("vid-medium.m4a", signature, str(expires))
+    assert not download_allowed("other-medium.m4a", signature, str(expires))
+    assert not download_allowed("vid-medium.m4a", signature, str(expires + 1))
+    assert not download_allowed("vid-medium.m4a", signature, None)
+    assert not download_allowed("vid-medium.m4a", signature, "soon")
+    assert not download_allowed("vid-medium.m4a", None, str(expires))
+    assert not download_allowed("vid-medium.m4a", "0" * 32, str(expires))
+
+
+def test_download_links_expire(private, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(storage.time, "time", lambda: now[0])
+    expires = download_expiry(ttl=100)
+    # Aligned to the window, and valid for at least one ttl
+    assert expires == 1_000_200
+    signature = download_signature("a.m4a", expires)
+    now[0] = expires
+    assert download_allowed("a.m4a", signature, str(expires))
+    now[0] = expires + 1
+    assert not download_allowed("a.m4a", signature, str(expires))
+
+
+def test_signatures_depend_on_the_secret(private):
+    assert download_signature("a.m4a", 100) != download_signature("a.m4a", 100, secret="rotated")
+
+
+def test_no_secret_refuses_every_download(private, monkeypatch):
+    monkeypatch.setattr(storage, "DOWNLOAD_URL_SECRET", "")
+    assert not download_allowed("a.m4a", "anything", str(download_expiry()))
+    with pytest.raises(RuntimeError):
+        download_path("a.m4a")
+
+
+def test_public_mode_needs_no_signature(monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_MODE", "public")
+    monkeypatch.setattr(storage, "DOWNLOAD_URL_SECRET", "")
+    assert download_path("a.m4a") == "/download/a.m4a"
+    assert download_allowed("a.m4a", None, None)
+
+
+def test_signed_urls_are_cached_until_near_expiry(private, monkeypatch):
+    cold = FakeColdStorage()
+    urls = ArtifactURLService(cold, ttl=100, refresh_margin=10)
+    now = [1000.0]
+    monkeypatch.setattr(storage.time, "time", lambda: now[0])
+
+    first = urls.url_for("k")
+    now[0] += 80
+    assert urls.url_for("k") == first
+    now[0] += 15
+    assert urls.url_for("k") != first
+    assert cold.signed == ["k", "k"]
+
+
+def test_signed_url_cache_is_bounded(private):
+    cold = FakeColdStorage()
+    urls = ArtifactURLService(cold, max_entries=2)
+    for key in ("a", "b", "c"):
+        urls.url_for(key)
+    urls.url_for("a")
+    assert cold.signed == ["a", "b", "c", "a"]
+
+
+def test_url_for_existing_checks_the_bucket(private):
+    cold = FakeColdStorage(objects={artifact_key("there.m4a")})
+    urls = ArtifactURLService(cold)
+    assert urls.url_for_existing(artifact_key("gone.m4a")) is None
+    assert cold.signed == []
+
+    assert urls.url_for_existing(artifact_key("there.m4a"))
+    # A cached URL is proof enough
+    assert urls.url_for_existing(artifact_key("there.m4a"))
+    assert cold.heads == 2
+
+
+def test_invalidate_forces_a_new_signature(private):
+    cold = FakeColdStorage()
+    urls = ArtifactURLService(cold)
+    first = urls.url_for("k")
+    urls.invalidate("k")
+    assert urls.url_for("k") != first
+
+
+def test_public_mode_uses_static_urls(monkeypatch):
+    monkeypatch.setattr(storage, "STORAGE_MODE", "public")
+    monkeypatch.setattr(storage, "CDN_BASE_URL", None)
+    urls = ArtifactURLService(FakeColdStorage())
+    assert urls.url_for("conversions/a.m4a") == "https://test-bucket.s3.amazonaws.com/conversions/a.m4a"
+
+
+def test_private_mode_never_hands_out_unsigned_cdn_urls(private, monkeypatch):
+    monkeypatch.setattr(storage, "CDN_BASE_URL", "https://cdn.example.com")
+    monkeypatch.setattr(storage, "CDN_KEY_PAIR_ID", None)
+    cold = FakeColdStorage()
+    assert ArtifactURLService(cold).url_for("conversions/a.m4a").startswith("https://signed/")
+
+    monkeypatch.setattr(storage, "STORAGE_MODE", "public")
+    assert ArtifactURLService(cold).url_for("conversions/a.m4a") == "https://cdn.example.com/conversions/a.m4a"
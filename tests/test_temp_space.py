@@ -0,0 +1,148 @@
+import os
+import time
+
+import pytest
+
+from lib.job_control import JobControl, JobInterrupted
+from lib.temp_space import (
+    POSTPROCESS_FACTOR, TEMP_DEFAULT_JOB_BYTES, TEMP_ORPHAN_GRACE, TempSpaceBudget, TempSpaceExhausted,
+    estimate_job_bytes,
+)
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    temp_dir, partials_dir = tmp_path / "conversions", tmp_path / "partials"
+    temp_dir.mkdir()
+    partials_dir.mkdir()
+    return str(temp_dir), str(partials_dir)
+
+
+def budget(dirs, budget_bytes=1000):
+    temp_dir, partials_dir = dirs
+    return TempSpaceBudget(temp_dir, budget_bytes=budget_bytes, headroom_bytes=0, partials_dir=partials_dir)
+
+
+def test_reservations_come_out_of_the_budget(dirs):
+    space = budget(dirs)
+    assert space.try_reserve("job1", 600)
+    assert space.available() == 400
+    assert not space.try_reserve("job2", 500)
+    space.release("job1")
+    assert space.try_reserve("job2", 500)
+
+
+def test_job_files_are_not_charged_twice(dirs):
+    space = budget(dirs)
+    assert space.try_reserve("job1", 600)
+    write(os.path.join(dirs[0], "job1.m4a"), 300)
+    assert space.available() == 400
+
+
+def test_unowned_partials_are_charged(dirs):
+    space = budget(dirs)
+    write(os.path.join(dirs[1], "vid1-audio-medium-m4a.m4a.part"), 300)
+    assert space.available() == 700
+    assert not space.try_reserve("job1", 800)
+
+
+def test_owned_partial_is_covered_by_the_reservation(dirs):
+    space = budget(dirs)
+    write(os.path.join(dirs[1], "vid1-audio-medium-m4a.m4a.part"), 300)
+    # Resuming the partial: the job's estimate already includes those bytes
+    assert space.try_reserve("job1", 800, partial_key="vid1-audio-medium-m4a")
+    assert space.available() == 200
+
+
+def test_partials_allowance_excludes_reservations(dirs):
+    space = budget(dirs)
+    write(os.path.join(dirs[1], "owned.m4a.part"), 100)
+    write(os.path.join(dirs[1], "abandoned.m4a.part"), 200)
+    assert space.try_reserve("job1", 600, partial_key="owned")
+    # 1000 - 600 reserved, plus the owned partial's bytes inside that reservation
+    assert space.partials_allowance() == 500
+
+
+def test_partials_inside_the_scratch_dir_are_charged_once(tmp_path):
+    partials_dir = tmp_path / ".partials"
+    partials_dir.mkdir()
+    space = TempSpaceBudget(str(tmp_path), budget_bytes=1000, headroom_bytes=0, partials_dir=str(partials_dir))
+    write(str(partials_dir / "abandoned.m4a.part"), 300)
+    assert space.available() == 700
+    old = time.time() - TEMP_ORPHAN_GRACE - 60
+    os.utime(str(partials_dir / "abandoned.m4a.part"), (old, old))
+    assert space.janitor() == 0
+
+
+def test_partials_on_another_filesystem_are_refused(dirs, monkeypatch):
+    real_stat = os.stat
+
+    def stat(path, *args, **kwargs):
+        result = real_stat(path, *args, **kwargs)
+        if path == dirs[1]:
+            return os.stat_result((result.st_mode, result.st_ino, result.st_dev + 1) + tuple(result)[3:])
+        return result
+
+    monkeypatch.setattr(os, "stat", stat)
+    with pytest.raises(ValueError, match="same filesystem"):
+        budget(dirs)
+
+
+def test_dead_reservations_are_dropped(dirs):
+    space = budget(dirs)
+    with open(os.path.join(space.reservations_dir, "ghost"), "w") as f:
+        f.write(f"{space.hostname} 999999999 900")
+    assert space.available() == 1000
+    assert not os.path.exists(os.path.join(space.reservations_dir, "ghost"))
+
+
+@pytest.mark.anyio
+async def test_reserve_gives_up_after_the_timeout(dirs):
+    space = budget(dirs)
+    assert space.try_reserve("job1", 900)
+    with pytest.raises(TempSpaceExhausted):
+        await space.reserve("job2", 500, timeout=0)
+    assert "job2" not in os.listdir(space.reservations_dir)
+
+
+@pytest.mark.anyio
+async def test_reserve_stops_when_the_job_is_cancelled(dirs):
+    space = budget(dirs)
+    assert space.try_reserve("job1", 1000)
+    control = JobControl("job2")
+    control.stop("cancelled")
+    with pytest.raises(JobInterrupted):
+        await space.reserve("job2", 500, timeout=5, control=control)
+
+
+def test_cleanup_job_removes_only_that_jobs_files(dirs):
+    space = budget(dirs)
+    for name in ("job1.webm", "job1.m4a", "job10.m4a"):
+        write(os.path.join(dirs[0], name), 10)
+    space.cleanup_job("job1")
+    assert sorted(os.listdir(dirs[0])) == [".reservations", "job10.m4a"]
+
+
+def test_janitor_keeps_reserved_and_recent_files(dirs):
+    space = budget(dirs)
+    assert space.try_reserve("live", 100)
+    old = time.time() - TEMP_ORPHAN_GRACE - 60
+    for name in ("live.webm", "crashed.webm"):
+        path = os.path.join(dirs[0], name)
+        write(path, 50)
+        os.utime(path, (old, old))
+    write(os.path.join(dirs[0], "fresh.webm"), 50)
+    assert space.janitor() == 50
+    assert sorted(os.listdir(dirs[0])) == [".reservations", "fresh.webm", "live.webm"]
+
+
+def test_estimate_uses_sizes_then_bitrate():
+    assert estimate_job_bytes({"filesize": 1000}) == 1000 * POSTPROCESS_FACTOR
+    assert estimate_job_bytes({"duration": 10, "tbr": 8}) == 10 * 1000 * POSTPROCESS_FACTOR
+    assert estimate_job_bytes({"requested_formats": [{"filesize": 100}, {"filesize_approx": 50}]}) == 150 * POSTPROCESS_FACTOR
+    assert estimate_job_bytes({}) == TEMP_DEFAULT_JOB_BYTES * POSTPROCESS_FACTOR
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import FastAPI, HTTPException
+from opentelemetry.trace import SpanKind, StatusCode
+from starlette.testclient import TestClient
+
+from lib.tracing import context_from_fields, record_exception, trace_context_fields, tracer, tracing_middleware
+
+TRACEPARENT = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+
+def test_trace_context_fields_empty_outside_a_span(spans):
+    assert trace_context_fields() == {}
+    assert context_from_fields({}) is None
+    assert context_from_fields({"traceparent": ""}) is None
+
+
+def test_trace_context_round_trips_through_job_fields(spans):
+    with tracer.start_as_current_span("submit") as submit:
+        fields = trace_context_fields()
+    assert fields["traceparent"].split("-")[1] == format(submit.get_span_context().trace_id, "032x")
+
+    with tracer.start_as_current_span("job", context=context_from_fields(fields)):
+        pass
+    submitted, job = spans.get_finished_spans()
+    assert job.context.trace_id == submitted.context.trace_id
+    assert job.parent.span_id == submitted.context.span_id
+
+
+def test_record_exception_marks_span_failed(spans):
+    with tracer.start_as_current_span("work") as span:
+        record_exception(span, RuntimeError("boom"))
+    (finished,) = spans.get_finished_spans()
+    assert finished.status.status_code is StatusCode.ERROR
+    assert finished.events[0].name == "exception"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.middleware("http")(tracing_middleware)
+
+    @app.get("/jobs/{job_id}")
+    async def job(job_id: str):
+        return {"job_id": job_id}
+
+    @app.get("/broken")
+    async def broken():
+        raise HTTPException(status_code=503, detail="down")
+
+    return TestClient(app)
+
+
+def test_server_span_named_by_route_and_continues_traceparent(client, spans):
+    assert client.get("/jobs/abc", headers={"traceparent": TRACEPARENT}).status_code == 200
+    (span,) = spans.get_finished_spans()
+    assert span.kind is SpanKind.SERVER
+    assert span.name == "GET /jobs/{job_id}"
+    assert span.attributes["http.route"] == "/jobs/{job_id}"
+    assert span.attributes["http.status_code"] == 200
+    assert format(span.context.trace_id, "032x") == TRACEPARENT.split("-")[1]
+    assert format(span.parent.span_id, "016x") == TRACEPARENT.split("-")[2]
+
+
+def test_server_errors_mark_span_failed(client, spans):
+    assert client.get("/broken").status_code == 503
+    (span,) = spans.get_finished_spans()
+    assert span.status.status_code is StatusCode.ERROR